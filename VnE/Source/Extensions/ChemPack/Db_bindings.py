@@ -193,6 +193,40 @@ def search(text, search_type, db_type='cryst', exact=None, process=None, CSD=Tru
     return process
 
 
+def refcodesLookup(refcodes, db_type='cryst', exact=True, process=None):
+    url_mods = {'cryst': 'api/v1/structures',
+                'qm': 'api/v1/qc_structures'}
+    if process is None:
+        process = QProcess()
+    if not SESSION.ready:
+        process.kill()
+        return
+    url_mod = url_mods.get(db_type, 'api/v1/structures')
+    token = SESSION.user_token
+    req = f'{SESSION.url_base}/{url_mod}/refcodes/'
+    root = opath.normpath(f'{opath.dirname(__file__)}/../../../..')
+    path = opath.normpath(f'{root}/VnE/Source/Extensions/ChemPack/searchProcess.py')
+    if os.name == 'nt':
+        prog = opath.normpath(f'{root}\\venv\\Scripts\\python.exe')
+    elif os.name == 'posix':
+        prog = opath.normpath(f'{root}/venv/bin/python3')
+    body = json.dumps({'refcodes': refcodes, 'exact': exact})+'\n'
+    process.startCommand(f'{prog} {path} -f refcodes -r "{req}" -t {token} -b True')
+    process.waitForStarted()
+    process.write(bytes(body, encoding='utf-8'))
+    return process
+
+
+def showMissingRefcodes(missing):
+    SESSION.error_dialog.append(ErrorDialog({'Not found': ' '.join(missing)}, title='Import refs'))
+    SESSION.error_dialog[-1].show()
+
+
+def showTruncatedRefcodes(count):
+    SESSION.error_dialog.append(ErrorDialog({'Too many structures': f'only the first {count} are shown'}, title='Import refs'))
+    SESSION.error_dialog[-1].show()
+
+
 def get_full_info(id, db_type='cryst'):
     url_mods = {'cryst': 'api/v1/structures',
                 'qm': 'api/v1/qc_structures'}
@@ -350,6 +384,7 @@ def structureSearch(struct, url_mod, process=None, db_string=''):
     body['edges'] = edges
     body['chunk_size'] = 10000
     body['iter_num'] = 0
+    body['stream'] = 'ndjson'
     token = SESSION.user_token
     req = f'{SESSION.url_base}/{url_mod}/search/?limit=10000'
     if db_string:
@@ -39,6 +39,7 @@ import os.path as opath
 import json
 
 DB_VIEWER = None
+REFS_MATCH_MODES = ['Exact refcodes', 'Refcode prefixes']  # how refcodes of the imported file are matched
 
 import debug
 
@@ -82,6 +83,23 @@ class StructuresListModel(QAbstractListModel):
         else:
             return
 
+    def refsPopulate(self, refcodes, db_type='cryst', exact=True):
+        self._last_db_type = db_type
+        if self._search_proc is None:
+            if self.progress_bar:
+                self.progress_bar.setValue(0)
+                self.progress = 0
+            self.beginResetModel()
+            self._data = []
+            self._rows = 0
+            self.endResetModel()
+            self._search_proc = QProcess(self)
+            self._search_proc.finished.connect(self.searchDone)
+            self._search_proc.readyReadStandardOutput.connect(self.appendRes)
+            self._search_proc = Db_bindings.refcodesLookup(refcodes, db_type, exact, process=self._search_proc)
+        else:
+            return
+
     def iterPopulate(self, requests):
 
         def getCallBack(func, search_proc):
@@ -135,6 +153,10 @@ class StructuresListModel(QAbstractListModel):
         for d in data:
             if d:
                 d = json.loads(d)
+                if d.get('missing'):
+                    Db_bindings.showMissingRefcodes(d['missing'])
+                if d.get('truncated'):
+                    Db_bindings.showTruncatedRefcodes(d['count'])
                 if self.progress_bar:
                     if d.get('max_iter_num', None):
                         self.progress = self.progress + 1 / d['max_iter_num']
@@ -602,8 +624,13 @@ class DbWindow(base_search_window.Ui_Dialog, QtWidgets.QDialog):
         filename, _ = QtWidgets.QFileDialog.getOpenFileName(filter='*.txt')
         if filename:
             file = open(filename, 'r')
-            data = [x for x in file.read().split('\n') if x]
-            self.list_model.iterPopulate(((x, 'refcode', 'cryst', 'refcode', {}) for x in data))
+            data = [x.strip() for x in file.read().split('\n') if x.strip()]
+            file.close()
+            match, ok = QtWidgets.QInputDialog.getItem(
+                self, 'Import refs', 'Match refcodes:', REFS_MATCH_MODES, 0, False
+            )
+            if ok:
+                self.list_model.refsPopulate(data, 'cryst', exact=match == REFS_MATCH_MODES[0])
 
 
 DIALOG = None
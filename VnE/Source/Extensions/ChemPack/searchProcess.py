@@ -38,13 +38,26 @@ def structureSearch(req, body, token=None):
 
     if token is not None and token != 'None':
         headers = {'Authorization': f'Token {token}'}
-        reqf = lambda: requests.get(req, json=body, headers=headers)
+        reqf = lambda: requests.get(req, json=body, headers=headers, stream=True)
     else:
-        reqf = lambda: requests.get(req, json=body)
+        reqf = lambda: requests.get(req, json=body, stream=True)
     data = reqf()
+    if data.headers.get('Content-Type', '').startswith('application/x-ndjson'):
+        # streamed search: every chunk of hits is written as a separate page as soon as it is found
+        for line in data.iter_lines():
+            if not line:
+                continue
+            record = json.loads(line)
+            if record['type'] == 'hits':
+                page = {'max_iter_num': record['max_iter_num'], 'count': len(record['results']),
+                        'results': record['results']}
+                sys.stdout.write(json.dumps(page)+'\n')
+                sys.stdout.flush()
+        return
     data = data.content.decode(data.apparent_encoding)
     sys.stdout.write(data+'\n')
     data = json.loads(data)
+    body.pop('stream', None)
     for iter in range(1, data['max_iter_num']+1):
         body['iter_num'] = iter
         data = reqf()
@@ -69,8 +82,20 @@ def search(req, token=None):
         data = json.loads(data)
 
 
+def refcodes(req, body, token=None):
+    body = json.loads(body)
+    if token is not None and token != 'None':
+        headers = {'Authorization': f'Token {token}'}
+        data = requests.post(req, json=body, headers=headers)
+    else:
+        data = requests.post(req, json=body)
+    data = data.content.decode(data.apparent_encoding)
+    sys.stdout.write(data+'\n')
+
+
 FUNCTIONS = {'structureSearch': (structureSearch, ('request', 'body', 'token')),
-             'search': (search, ('request', 'token'))
+             'search': (search, ('request', 'token')),
+             'refcodes': (refcodes, ('request', 'body', 'token'))
              }
 
 parser = argparse.ArgumentParser()
@@ -32,3 +32,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # statistics of the query planner are updated when structures are deleted
+        from . import query_planner  # noqa: F401
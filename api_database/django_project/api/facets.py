@@ -0,0 +1,142 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import hashlib
+from django.core.cache import cache
+from django.db.models import Count, F, FloatField, IntegerField, Max, Min, Sum
+from django.db.models.functions import Cast, Least
+from structure.models import CENTRINGS, SYSTEMS, MASK_BITS, get_element_positions
+
+DEFAULT_BINS = 20  # the number of histogram bins
+MAX_BINS = 200
+FACETS_CACHE_TTL = 24 * 60 * 60  # results are also invalidated by the dataset version
+IGNORED_PARAMS = ('limit', 'page', 'after', 'format')  # parameters which do not change the result
+# {facet name: (field, choices or None)}
+FACETS = {
+    'system': ('cell__spacegroup__system', SYSTEMS),
+    'spacegroup': ('cell__spacegroup__name', None),
+    'centring': ('cell__centring', CENTRINGS),
+}
+QC_FACETS = {
+    'system': ('qc_cell__spacegroup__system', SYSTEMS),
+    'spacegroup': ('qc_cell__spacegroup__name', None),
+    'centring': ('qc_cell__centring', CENTRINGS),
+}
+# {histogram name: numeric field}
+HISTOGRAMS = {
+    'temperature': 'experimental_info__structure_determination_temperature',
+    'density': 'experimental_info__calculated_density_value',
+    'r_factor': 'refinement_info__r_factor',
+    'wR_factor': 'refinement_info__wR_factor',
+    'gof': 'refinement_info__gof',
+}
+QC_HISTOGRAMS = {
+    'energy': 'qc_properties__energy',
+    'density': 'qc_properties__calculated_density',
+}
+
+
+def get_elements_counts(queryset):
+    '''Return {element: the number of structures with the element} counted by bits of the elements masks.'''
+    positions = get_element_positions()
+    counts = queryset.aggregate(**{
+        element: Sum(F(f'elements_mask_{position // MASK_BITS + 1}').bitrightshift(position % MASK_BITS).bitand(1))
+        for element, position in positions.items()
+    })
+    return {element: count for element, count in counts.items() if count}
+
+
+def get_facet(queryset, field, choices=None):
+    '''Return [{'value', 'count'(, 'label')}, ...] of the field values from the most frequent one.'''
+    labels = dict(choices or ())
+    rows = queryset.exclude(**{f'{field}__isnull': True}).values_list(field).annotate(
+        count=Count('id')
+    ).order_by('-count', field)
+    facet = []
+    for value, count in rows:
+        item = {'value': value, 'count': count}
+        if choices:
+            item['label'] = labels.get(value)
+        facet.append(item)
+    return facet
+
+
+def get_histogram(queryset, field, bins=DEFAULT_BINS):
+    '''Return {'min', 'max', 'missing', 'bins': [{'start', 'end', 'count'}, ...]} of the numeric field.'''
+    values = queryset.exclude(**{f'{field}__isnull': True})
+    limits = values.aggregate(min=Min(field), max=Max(field), count=Count('id'))
+    histogram = {'min': limits['min'], 'max': limits['max'], 'missing': queryset.count() - limits['count'], 'bins': []}
+    if limits['min'] is None:
+        return histogram
+    width = (limits['max'] - limits['min']) / bins or 1.0
+    # values equal to the maximum are put in the last bin
+    bin_number = Least(
+        Cast((Cast(field, FloatField()) - limits['min']) / width, IntegerField()), bins - 1
+    )
+    counts = dict(
+        values.annotate(bin_number=bin_number).values_list('bin_number').annotate(count=Count('id')).order_by()
+    )
+    for number in range(bins):
+        histogram['bins'].append({
+            'start': limits['min'] + number * width,
+            'end': limits['min'] + (number + 1) * width,
+            'count': counts.get(number, 0),
+        })
+    return histogram
+
+
+def get_facets(queryset, facets, histograms, bins=DEFAULT_BINS):
+    '''Facet counts and histograms of the structures (the queryset can be filtered, distinct and ordered).'''
+    queryset = queryset.model.objects.filter(id__in=queryset.order_by().values('id'))
+    return {
+        'count': queryset.count(),
+        'facets': {
+            'elements': [
+                {'value': element, 'count': count}
+                for element, count in sorted(get_elements_counts(queryset).items(), key=lambda item: -item[1])
+            ],
+            **{name: get_facet(queryset, field, choices) for name, (field, choices) in facets.items()},
+        },
+        'histograms': {name: get_histogram(queryset, field, bins) for name, field in histograms.items()},
+    }
+
+
+def get_facets_cache_key(model, query_params, scope, version):
+    '''Cache key of the facets of the filtered structures.'''
+    params = sorted((name, values) for name, values in query_params.lists() if name not in IGNORED_PARAMS)
+    key = f'{model._meta.label}:{params}:{scope}:{version}'
+    return f'facets:{hashlib.sha1(key.encode()).hexdigest()}'
+
+
+def get_cached_facets(key, *args, **kwargs):
+    '''Return facets from the cache or calculate and save them.'''
+    data = cache.get(key)
+    if data is None:
+        data = get_facets(*args, **kwargs)
+        cache.set(key, data, FACETS_CACHE_TTL)
+    return data
@@ -0,0 +1,211 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.core.validators import EMPTY_VALUES
+from django.db import close_old_connections
+from django_filters.rest_framework import FilterSet
+from .facets import get_elements_counts
+from .id_tables import filter_by_ids
+import numpy as np
+
+MAX_CANDIDATES = 10000  # found ids passed to the next filter, the rest of the filters are chained to more ids
+RESIDUAL_SELECTIVITY = 0.3  # filters matching a larger part of structures are applied to the final queryset
+STATISTICS_TTL = 600  # seconds between background reloads of the statistics in a worker
+MAX_OBSERVED = 2000  # the number of remembered filter results
+CANDIDATES_TABLE = 'filter_candidates'  # the temporary table with more than MAX_CANDIDATES found ids
+# the expected part of structures matched by the filter if there is nothing better
+FILTER_SELECTIVITY = {
+    'refcode': 0.001,
+    'CCDC_number': 0.001,
+    'doi': 0.0001,
+    'formula': 0.01,
+    'cell': 0.001,
+    'name': 0.01,
+    'authors': 0.01,
+    'journal': 0.05,
+    'temperature': 0.02,
+    'temperature_range': 0.3,
+    'sg_num': 0.05,
+    'system': 0.2,
+    'program': 0.5,
+}
+DEFAULT_SELECTIVITY = 1.0
+
+_statistics = dict()  # {db_table: {'loaded': time, 'count': structures, 'elements': {element: part}}}
+_statistics_loading = set()  # tables whose statistics are being loaded
+_statistics_lock = threading.Lock()
+_observed = OrderedDict()  # {(db_table, filter name, value): the number of found structures}
+_observed_lock = threading.Lock()
+
+
+def load_statistics(model):
+    '''Count the structures and the parts of structures with each element.'''
+    table = model._meta.db_table
+    try:
+        count = model.objects.count()
+        elements_counts = get_elements_counts(model.objects.all())
+        elements = {element: number / max(count, 1) for element, number in elements_counts.items()}
+        _statistics[table] = {'loaded': time.time(), 'count': count, 'elements': elements}
+    finally:
+        with _statistics_lock:
+            _statistics_loading.discard(table)
+    return _statistics[table]
+
+
+def _load_statistics_in_background(model):
+    try:
+        load_statistics(model)
+    finally:
+        close_old_connections()
+
+
+def get_statistics(model):
+    '''
+    Return the statistics of the structures (see load_statistics) or None if they are not loaded yet.
+    Statistics are loaded in a background thread and reloaded every STATISTICS_TTL, so the aggregation over
+    all structures never runs on the request path; outdated statistics are returned until the reload is done.
+    '''
+    table = model._meta.db_table
+    statistics = _statistics.get(table)
+    if statistics is None or time.time() - statistics['loaded'] > STATISTICS_TTL:
+        with _statistics_lock:
+            if table not in _statistics_loading:
+                _statistics_loading.add(table)
+                threading.Thread(
+                    target=_load_statistics_in_background, args=(model,), name='filter-statistics', daemon=True
+                ).start()
+    return statistics
+
+
+def get_elements_selectivity(value, statistics, exclude=False):
+    '''The part of structures with all the elements (without any of them if exclude), elements are independent.'''
+    selectivity = 1.0
+    for element in re.findall(r'[A-Za-z]{1,3}', value):
+        part = statistics['elements'].get(element.capitalize(), 0.0)
+        selectivity *= 1.0 - part if exclude else part
+    return selectivity
+
+
+def remember_observed(key, count):
+    with _observed_lock:
+        _observed[key] = count
+        _observed.move_to_end(key)
+        if len(_observed) > MAX_OBSERVED:
+            _observed.popitem(last=False)
+
+
+def get_observed(key):
+    with _observed_lock:
+        return _observed.get(key)
+
+
+class PlannedFilterSet(FilterSet):
+    '''
+    FilterSet which evaluates selective filters from the most selective one into sorted arrays of structure ids,
+    every next filter checks only the ids found before, and the queryset is filtered by the final ids. So the
+    search costs in proportion to the most selective filter instead of the join of all filters. Unselective filters
+    and filters ordering structures are applied to the final queryset as usual.
+    Selectivity is estimated by the numbers of structures found by the same filters before, element statistics
+    and FILTER_SELECTIVITY. If the most selective filter is expected to match more than MAX_CANDIDATES structures
+    or the statistics are not loaded yet, the filters are chained as usual; if a filter finds more structures than
+    expected, the found ids are kept and the rest of the filters are chained to them.
+    '''
+
+    def get_ordering_filters(self):
+        '''Names of the filters which order structures.'''
+        ordering_filters = {'text'}
+        if self.request is not None and self.request.GET.get('cell_order') == 'distance':
+            ordering_filters.add('cell')
+        return ordering_filters
+
+    def get_selectivity(self, name, value, statistics):
+        '''Estimated part of the structures matched by the filter.'''
+        observed = get_observed((self._meta.model._meta.db_table, name, str(value)))
+        if observed is not None:
+            return observed / max(statistics['count'], 1)
+        if name == 'elements':
+            return get_elements_selectivity(value, statistics)
+        if name == 'no_elements':
+            return get_elements_selectivity(value, statistics, exclude=True)
+        if name == 'formula':
+            return get_elements_selectivity(value, statistics) * FILTER_SELECTIVITY['formula']
+        return FILTER_SELECTIVITY.get(name, DEFAULT_SELECTIVITY)
+
+    def get_plan(self, statistics):
+        '''
+        Return (planned filters from the most selective one as a list of (selectivity, name, value),
+        other filters as a list of (name, value)).
+        '''
+        ordering_filters = self.get_ordering_filters()
+        planned, other = [], []
+        for name, value in self.form.cleaned_data.items():
+            if value in EMPTY_VALUES:
+                continue
+            selectivity = self.get_selectivity(name, value, statistics)
+            if name in ordering_filters or selectivity > RESIDUAL_SELECTIVITY:
+                other.append((name, value))
+            else:
+                planned.append((selectivity, name, value))
+        planned.sort(key=lambda item: item[0])
+        return planned, other
+
+    def filter_ids(self, name, value, candidates=None):
+        '''Return the sorted array of ids of all structures (or the candidates) matched by the filter.'''
+        queryset = self._meta.model._default_manager.all()
+        if candidates is not None:
+            queryset = queryset.filter(id__in=candidates.tolist())
+        queryset = self.filters[name].filter(queryset, value)
+        ids = np.unique(np.fromiter(queryset.order_by().values_list('id', flat=True), dtype=np.int64))
+        if candidates is None:
+            remember_observed((self._meta.model._meta.db_table, name, str(value)), len(ids))
+        return ids
+
+    def filter_queryset(self, queryset):
+        statistics = get_statistics(self._meta.model)
+        if statistics is None:
+            return super().filter_queryset(queryset)
+        planned, other = self.get_plan(statistics)
+        if len(planned) < 2 or planned[0][0] * statistics['count'] > MAX_CANDIDATES:
+            return super().filter_queryset(queryset)
+        ids = None
+        remaining = list(planned)
+        while remaining and (ids is None or 0 < len(ids) <= MAX_CANDIDATES):
+            # the estimate can be wrong, the found number is remembered for the next plans
+            selectivity, name, value = remaining.pop(0)
+            ids = self.filter_ids(name, value, ids)
+        # if more than MAX_CANDIDATES were found, the found ids are kept and the rest of the filters are chained
+        queryset = filter_by_ids(queryset, ids, CANDIDATES_TABLE, MAX_CANDIDATES)
+        for selectivity, name, value in remaining:
+            queryset = self.filters[name].filter(queryset, value)
+        for name, value in other:
+            queryset = self.filters[name].filter(queryset, value)
+        return queryset
@@ -26,23 +26,26 @@
 #
 # *****************************************************************************************
 
-from django_filters.rest_framework import FilterSet, filters
-from structure.models import (StructureCode, ElementsSet1, ElementsSet2,
-                              ElementsSet3, ElementsSet4, ElementsSet5,
-                              ElementsSet6, ElementsSet7, ElementsSet8,
-                              CENTRINGS)
-from qc_structure.models import QCStructureCode, PROGRAMS
+from django.db.models import F, Q, FloatField, ExpressionWrapper, Min
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Upper
+from django_filters.rest_framework import filters
+from structure.models import (StructureCode, ReducedCell, CENTRINGS, get_element_positions, get_elements_mask,
+                              get_composition_item)
+from structure.cell_index import has_cell_index, get_cell_index_query
+from structure.search_text import (TEXT_TABLES, TEXT_COLUMNS, MIN_TERM_LENGTH, has_text_index, get_text_terms,
+                                   get_match_query)
+from qc_structure.models import QCStructureCode, QCReducedCell, PROGRAMS
+from .filter_planner import PlannedFilterSet
 from gemmi import UnitCell, SpaceGroup, GruberVector
 import re
 
-ELEMENTS_SET_CLASSES = [
-    ElementsSet1, ElementsSet2, ElementsSet3, ElementsSet4,
-    ElementsSet5, ElementsSet6, ElementsSet7, ElementsSet8
-]
-
-
-def get_fields_list(model):
-    return [field.name for field in model._meta.get_fields()]
+CELL_PARAMS = ('a', 'b', 'c', 'al', 'be', 'ga')
+NAME_FIELDS = ('name__systematic_name', 'name__trivial_name')
+AUTHOR_FIELDS = ('authors__family_name', )
+JOURNAL_FIELDS = ('publication__publication__journal__name', 'publication__publication__journal__fullname')
+DOI_FIELDS = ('publication__publication__doi', )
+QC_NAME_FIELDS = ('qc_name__systematic_name', 'qc_name__trivial_name')
 
 
 def split_element_and_count(element):
@@ -65,32 +68,119 @@ def get_reduced_cell(params: list, centring: str) -> list:
     return list(reduced_params)
 
 
+def get_refcodes_filter(refcodes, exact=True):
+    '''
+    Return Q object matching refcodes (or refcode prefixes if not exact) case-insensitively, the refcode_upper
+    alias is compared as ranges, so the Upper(refcode) index is used instead of LIKE scans.
+    '''
+    refcodes = [refcode.upper() for refcode in refcodes]
+    if exact:
+        return Q(refcode_upper__in=refcodes)
+    refcodes_filter = Q()
+    for prefix in refcodes:
+        upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        refcodes_filter |= Q(refcode_upper__gte=prefix, refcode_upper__lt=upper_bound)
+    return refcodes_filter
+
+
+def filter_refcodes(queryset, refcodes, exact=True):
+    '''Structures with the refcodes (or refcode prefixes if not exact) in one query.'''
+    refcodes = [refcode for refcode in refcodes if refcode]
+    if not refcodes:
+        return queryset.none()
+    return queryset.alias(refcode_upper=Upper('refcode')).filter(get_refcodes_filter(refcodes, exact))
+
+
 def general_refcode_filter(request, queryset, value):
     exact = False
     if request:
         exact = request.GET.get('exact', False)
     if value:
-        queryset_temp = 0
+        return filter_refcodes(queryset, value.split(), exact == 'refcode')
+    return queryset
+
+
+def general_elements_filter(queryset, value, exclude=False):
+    '''
+    Structures which have all given elements (without any of them if exclude), checked by bits of
+    elements_mask_1 and elements_mask_2 columns. Unknown element gives empty queryset.
+    '''
+    if value:
+        elements = [element.capitalize() for element in value.split()]
+        positions = get_element_positions()
+        if any(element not in positions for element in elements):
+            return queryset.none()
+        prefix = 'no_elements' if exclude else 'elements'
+        for i, mask in enumerate(get_elements_mask(elements), start=1):
+            if mask:
+                queryset = queryset.alias(
+                    **{f'{prefix}_bits_{i}': F(f'elements_mask_{i}').bitand(mask)}
+                ).filter(**{f'{prefix}_bits_{i}': 0 if exclude else mask})
+    return queryset
+
+
+def general_formula_filter(queryset, value):
+    '''
+    Structures with the given numbers of elements ("C6 H12 O" format, other elements can be present),
+    checked by the elements mask and the composition column.
+    '''
+    if value:
+        counts = dict()
         for element in value.split():
-            if exact == 'refcode':
-                if queryset_temp:
-                    queryset_temp = queryset_temp | queryset.filter(refcode__iexact=element)
-                else:
-                    queryset_temp = queryset.filter(refcode__iexact=element)
-            else:
-                if queryset_temp:
-                    queryset_temp = queryset_temp | queryset.filter(refcode__istartswith=element)
-                else:
-                    queryset_temp = queryset.filter(refcode__istartswith=element)
-        return queryset_temp
+            elem, count = split_element_and_count(element)
+            counts[elem.capitalize()] = count
+        queryset = general_elements_filter(queryset, ' '.join(counts))
+        for elem, count in counts.items():
+            queryset = queryset.filter(composition__contains=f' {get_composition_item(elem, count)} ')
     return queryset
 
 
+def general_text_filter(queryset, value, fields, columns=None, qc=False, rank=False):
+    '''
+    Full-text search, structures must contain all terms of the value ("quoted text" is one term).
+    fields - fields searched with icontains if the full-text index is not available,
+    columns - columns of the full-text index (all columns if None),
+    rank - order structures by relevance.
+    '''
+    terms = get_text_terms(value)
+    if has_text_index(qc):
+        text_table = TEXT_TABLES[qc]
+        index_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+        terms = [term for term in terms if len(term) < MIN_TERM_LENGTH]
+        if index_terms and rank:
+            queryset = queryset.extra(
+                tables=[text_table],
+                where=[f'{text_table}.rowid = {queryset.model._meta.db_table}.id', f'{text_table} MATCH %s'],
+                params=[get_match_query(index_terms, columns)],
+                select={'text_rank': f'{text_table}.rank'},
+                order_by=['text_rank', 'id'],
+            )
+        elif index_terms:
+            text_sql = f'SELECT rowid FROM {text_table} WHERE {text_table} MATCH %s'
+            queryset = queryset.filter(id__in=RawSQL(text_sql, (get_match_query(index_terms, columns),)))
+    for term in terms:
+        term_filter = Q()
+        for field in fields:
+            term_filter |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(term_filter)
+    return queryset
+
+
+def get_cell_distance(params, qc=''):
+    '''Return the expression of the squared relative distance between the reduced cell and the params cell.'''
+    distance = 0
+    for name, value in zip(CELL_PARAMS, params):
+        deviation = (F(f'{qc}reduced_cells__{name}') - value) / value
+        distance = distance + deviation * deviation
+    return ExpressionWrapper(distance, output_field=FloatField())
+
+
 def general_cell_filter(request, queryset, value, qc=''):
     """
     Unit cell search.
     Format: a,b,c,al,be,ga,centring,parameter_deviation(value_or_none),angle_deviation(value_or_none);
     Example: 6,7,8,90,90,90,P,0.015,0.02
+    With the cell_order=distance query parameter structures are ordered by the distance to the query cell.
     """
     raw_params = value.split(',')
     params = list(map(float, raw_params[:6]))
@@ -107,20 +197,23 @@ def general_cell_filter(request, queryset, value, qc=''):
         abc_deviation = float(params[7])
     if params[8] != 'none':
         angle_deviation = float(params[8])
-    cell_filter = {
-        f'{qc}reduced_cells__a__range': (params[0] - params[0] * abc_deviation, params[0] + params[0] * angle_deviation),
-        f'{qc}reduced_cells__b__range': (params[1] - params[1] * abc_deviation, params[1] + params[1] * angle_deviation),
-        f'{qc}reduced_cells__c__range': (params[2] - params[2] * abc_deviation, params[2] + params[2] * angle_deviation),
-        f'{qc}reduced_cells__al__range': (params[3] - params[3] * abc_deviation, params[3] + params[3] * angle_deviation),
-        f'{qc}reduced_cells__be__range': (params[4] - params[4] * abc_deviation, params[4] + params[4] * angle_deviation),
-        f'{qc}reduced_cells__ga__range': (params[5] - params[5] * abc_deviation, params[5] + params[5] * angle_deviation),
-        f'{qc}cell__centring__exact': centrings[params[6].upper()]
-    }
-    queryset = queryset.filter(**cell_filter).distinct()
-    return queryset
-
-
-class StructureFilter(FilterSet):
+    ranges = dict()
+    for i, name in enumerate(CELL_PARAMS):
+        deviation = abc_deviation if i < 3 else angle_deviation
+        ranges[name] = (params[i] - params[i] * deviation, params[i] + params[i] * deviation)
+    cell_filter = {f'{qc}reduced_cells__{name}__range': ranges[name] for name in CELL_PARAMS}
+    cell_filter[f'{qc}cell__centring__exact'] = centrings[params[6].upper()]
+    # the box lookup in the R*Tree index narrows the reduced cells before the range filters
+    cell_table = (QCReducedCell if qc else ReducedCell)._meta.db_table
+    if has_cell_index(cell_table):
+        cell_filter[f'{qc}reduced_cells__id__in'] = RawSQL(*get_cell_index_query(cell_table, ranges))
+    queryset = queryset.filter(**cell_filter)
+    if request and request.query_params.get('cell_order') == 'distance':
+        return queryset.annotate(cell_distance=Min(get_cell_distance(params[:6], qc))).order_by('cell_distance', 'id')
+    return queryset.distinct()
+
+
+class StructureFilter(PlannedFilterSet):
     # refcode search
     refcode = filters.CharFilter(method='filter_refcode')
     CCDC_number = filters.CharFilter(method='filter_CCDC_number')
@@ -138,7 +231,11 @@ class StructureFilter(FilterSet):
     # element exclude search
     no_elements = filters.CharFilter(method='filter_no_elements')
     # doi search (doi format: 10.7503/cjcu20200475)
-    doi = filters.CharFilter(field_name='publication__publication__doi', lookup_expr='iexact')
+    doi = filters.CharFilter(method='filter_doi')
+    # journal search
+    journal = filters.CharFilter(method='filter_journal')
+    # full-text search over names, authors, journals and doi, results are ordered by relevance
+    text = filters.CharFilter(method='filter_text')
     # temperature search
     temperature = filters.NumberFilter(
         field_name='experimental_info__structure_determination_temperature',
@@ -222,60 +319,38 @@ class StructureFilter(FilterSet):
 
     def filter_name(self, queryset, name, value):
         if value:
-            for element in value.split():
-                queryset = queryset.filter(name__systematic_name__icontains=element) | queryset.filter(name__trivial_name__icontains=element)
+            return general_text_filter(queryset, value, NAME_FIELDS, columns=TEXT_COLUMNS[False][:2])
         return queryset
 
-    def filter_formula(self, queryset, name, value):
+    def filter_doi(self, queryset, name, value):
         if value:
-            filtr = {}
-            # for each element of user defined
-            for element in value.split():
-                # define element and it's quantity
-                elem, count = split_element_and_count(element)
-                # if there is a problem with spliting, return empty queryset
-                if elem == 'error':
-                    return queryset.none()
-                # find database table with current element
-                for i, model in enumerate(
-                        ELEMENTS_SET_CLASSES, start=1):
-                    # add filter, the quality of the element
-                    if elem.capitalize() in get_fields_list(model):
-                        filtr[f'elements__element_set_{i}__isnull'] = False
-                        filtr[f'elements__element_set_{i}__{elem.capitalize()}__exact'] = float(count)
-                        break
-                # if element was not found, return empty queryset
-                else:
-                    return queryset.none()
-            return queryset.filter(**filtr)
+            queryset = general_text_filter(queryset, f'"{value}"', DOI_FIELDS, columns=('doi', ))
+            return queryset.filter(publication__publication__doi__iexact=value)
         return queryset
 
-    def filter_elements(self, queryset, name, value, exclude=False):
+    def filter_journal(self, queryset, name, value):
         if value:
-            filtr = {}
-            # for each element of user defined
-            for element in value.split():
-                # find database table with current element
-                for i, model in enumerate(
-                        ELEMENTS_SET_CLASSES, start=1):
-                    # add filter, that element must be not Null
-                    if element.capitalize() in get_fields_list(model):
-                        filtr[f'elements__element_set_{i}__isnull'] = exclude
-                        filtr[f'elements__element_set_{i}__{element.capitalize()}__isnull'] = exclude
-                        break
-                # if element was not found, return empty queryset
-                else:
-                    return queryset.none()
-            return queryset.filter(**filtr)
+            return general_text_filter(queryset, value, JOURNAL_FIELDS, columns=('journal', ))
         return queryset
 
+    def filter_text(self, queryset, name, value):
+        if value:
+            fields = NAME_FIELDS + AUTHOR_FIELDS + JOURNAL_FIELDS + DOI_FIELDS
+            return general_text_filter(queryset.distinct(), value, fields, rank=True)
+        return queryset
+
+    def filter_formula(self, queryset, name, value):
+        return general_formula_filter(queryset, value)
+
+    def filter_elements(self, queryset, name, value, exclude=False):
+        return general_elements_filter(queryset, value, exclude)
+
     def filter_no_elements(self, queryset, name, value):
         return self.filter_elements(queryset, name, value, True)
 
     def filter_authors(self, queryset, name, value):
         if value:
-            for element in value.split():
-                queryset = queryset.filter(authors__family_name__icontains=element)
+            return general_text_filter(queryset, value, AUTHOR_FIELDS, columns=('authors', ))
         return queryset
 
     def filter_cell(self, queryset, name, value):
@@ -294,11 +369,12 @@ class StructureFilter(FilterSet):
         return queryset
 
 
-class QCStructureFilter(FilterSet):
+class QCStructureFilter(PlannedFilterSet):
     refcode = filters.CharFilter(method='filter_refcode')
     user_db = filters.CharFilter(method='filter_user_db')
     program = filters.CharFilter(method='filter_program')
     name = filters.CharFilter(method='filter_name')
+    text = filters.CharFilter(method='filter_text')
     formula = filters.CharFilter(method='filter_formula')
     elements = filters.CharFilter(method='filter_elements')
     no_elements = filters.CharFilter(method='filter_no_elements')
@@ -337,40 +413,19 @@ class QCStructureFilter(FilterSet):
 
     def filter_name(self, queryset, name, value):
         if value:
-            for element in value.split():
-                queryset = queryset.filter(qc_name__systematic_name__icontains=element) | queryset.filter(qc_name__trivial_name__icontains=element)
+            return general_text_filter(queryset, value, QC_NAME_FIELDS, columns=TEXT_COLUMNS[True], qc=True)
         return queryset
 
-    def filter_formula(self, queryset, name, value):
+    def filter_text(self, queryset, name, value):
         if value:
-            filtr = {}
-            for element in value.split():
-                elem, count = split_element_and_count(element)
-                if elem == 'error':
-                    return queryset.none()
-                for i, model in enumerate(ELEMENTS_SET_CLASSES, start=1):
-                    if elem.capitalize() in get_fields_list(model):
-                        filtr[f'qc_elements__element_set_{i}__isnull'] = False
-                        filtr[f'qc_elements__element_set_{i}__{elem.capitalize()}__exact'] = float(count)
-                        break
-                else:
-                    return queryset.none()
-            return queryset.filter(**filtr)
+            return general_text_filter(queryset, value, QC_NAME_FIELDS, qc=True, rank=True)
         return queryset
 
+    def filter_formula(self, queryset, name, value):
+        return general_formula_filter(queryset, value)
+
     def filter_elements(self, queryset, name, value, exclude=False):
-        if value:
-            filtr = {}
-            for element in value.split():
-                for i, model in enumerate(ELEMENTS_SET_CLASSES, start=1):
-                    if element.capitalize() in get_fields_list(model):
-                        filtr[f'qc_elements__element_set_{i}__isnull'] = exclude
-                        filtr[f'qc_elements__element_set_{i}__{element.capitalize()}__isnull'] = exclude
-                        break
-                else:
-                    return queryset.none()
-            return queryset.filter(**filtr)
-        return queryset
+        return general_elements_filter(queryset, value, exclude)
 
     def filter_no_elements(self, queryset, name, value):
         return self.filter_elements(queryset, name, value, True)
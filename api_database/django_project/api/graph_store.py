@@ -0,0 +1,263 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import threading
+from array import array
+import numpy as np
+from django.conf import settings
+from modules.graph_pack.fingerprint import FP_BYTES
+from structure.models import CoordinatesBlock
+from qc_structure.models import QCCoordinatesBlock
+from .result_cache import search_result_cache
+
+LOAD_CHUNK_SIZE = 5000  # the number of graphs read from the database at once
+MAX_QUERY_IDS = 900  # the number of ids in one "id__in" query
+FP_WORDS = FP_BYTES // 8  # the number of uint64 words in a fingerprint
+
+
+class GraphStore:
+    '''
+    Process-wide store of packed structure graphs used by the search views.
+    Graphs are loaded once and kept in the "graphs" list; "slots" maps structure id to the list position,
+    "no_graph" keeps ids of structures which were looked up and have no graph.
+    The store remembers the dataset version it was loaded at; when another process changes structures
+    (the version in the search result cache is bumped), graphs of the changed structures are reread
+    from the change log of the cache, the whole store is reloaded only if the log does not have their ids.
+    Fingerprints are kept in the "fingerprints" matrix (one row per slot), structures without fingerprint
+    have all bits set and always pass the prescreen.
+    '''
+
+    def __init__(self, coordinates_model, qc=False):
+        self.coordinates_model = coordinates_model
+        self.scope = 'qc' if qc else 'exp'
+        self.graphs = []
+        self.fingerprints = np.empty((0, FP_WORDS), dtype=np.uint64)
+        self.slots = dict()
+        self.free_slots = []
+        self.no_graph = set()
+        self.loaded = False
+        self.version = None
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _put(self, structure_id, graph, fingerprint):
+        slot = self.slots.get(structure_id)
+        if slot is None:
+            if self.free_slots:
+                slot = self.free_slots.pop()
+                self.graphs[slot] = graph
+            else:
+                slot = len(self.graphs)
+                self.graphs.append(graph)
+            self.slots[structure_id] = slot
+        else:
+            self.graphs[slot] = graph
+        if slot >= len(self.fingerprints):
+            fingerprints = np.empty((max(slot + 1, len(self.fingerprints) * 2), FP_WORDS), dtype=np.uint64)
+            fingerprints[:len(self.fingerprints)] = self.fingerprints
+            self.fingerprints = fingerprints
+        if fingerprint and len(fingerprint) == FP_BYTES:
+            self.fingerprints[slot] = np.frombuffer(fingerprint, dtype=np.uint64)
+        else:
+            self.fingerprints[slot] = np.iinfo(np.uint64).max
+
+    def _pop(self, structure_id):
+        slot = self.slots.pop(structure_id, None)
+        if slot is not None:
+            self.graphs[slot] = b''
+            self.free_slots.append(slot)
+
+    def _read_graphs(self, structure_ids=None):
+        graphs = self.coordinates_model.objects.filter(packed_graph__isnull=False)
+        if structure_ids is not None:
+            graphs = graphs.filter(refcode_id__in=structure_ids)
+        graphs = graphs.values_list('refcode_id', 'packed_graph', 'fingerprint')
+        for structure_id, graph, fingerprint in graphs.iterator(chunk_size=LOAD_CHUNK_SIZE):
+            if graph:
+                yield structure_id, bytes(graph), fingerprint
+
+    def load(self):
+        '''Read all graphs from the database, replacing the current content.'''
+        with self.lock:
+            version = search_result_cache.get_version()
+            self.graphs = []
+            self.fingerprints = np.empty((0, FP_WORDS), dtype=np.uint64)
+            self.slots = dict()
+            self.free_slots = []
+            self.no_graph = set()
+            for structure_id, graph, fingerprint in self._read_graphs():
+                self._put(structure_id, graph, fingerprint)
+            self.version = version
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.load()
+
+    def ensure_actual(self):
+        '''Load the store or apply changes of structures made by other processes since it was loaded.'''
+        version = search_result_cache.get_version()
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            elif self.version != version:
+                structure_ids = search_result_cache.get_changed_ids(self.version, version, self.scope)
+                if structure_ids is None:
+                    self.load()
+                    return
+                self._update(sorted(structure_ids))
+                self.version = version
+
+    def _set_version(self, version):
+        # the store is still actual if the only change since it was loaded is the one just applied
+        if version is not None and self.version == version - 1:
+            self.version = version
+
+    def _update(self, structure_ids):
+        structure_ids = list(structure_ids)
+        for i in range(0, len(structure_ids), MAX_QUERY_IDS):
+            ids = structure_ids[i:i + MAX_QUERY_IDS]
+            found = set()
+            for structure_id, graph, fingerprint in self._read_graphs(ids):
+                self._put(structure_id, graph, fingerprint)
+                found.add(structure_id)
+            for structure_id in set(ids) - found:
+                self._pop(structure_id)
+            self.no_graph.difference_update(ids)
+
+    def update(self, structure_ids, version=None):
+        '''
+        Reread graphs of the given structures (after upload or re-processing).
+        "version" is the dataset version returned by bump_dataset_version for this change.
+        '''
+        with self.lock:
+            if not self.loaded:
+                return
+            self._update(structure_ids)
+            self._set_version(version)
+
+    def remove(self, structure_ids, version=None):
+        with self.lock:
+            for structure_id in structure_ids:
+                self._pop(structure_id)
+                self.no_graph.discard(structure_id)
+            self._set_version(version)
+
+    def _get_slots(self, structure_ids, fingerprint=None, stats=None):
+        '''Return (structure id, slot) pairs of the given structures which pass the fingerprint prescreen.'''
+        self.ensure_actual()
+        structure_ids = list(structure_ids)
+        with self.lock:
+            missing = [
+                structure_id for structure_id in structure_ids
+                if structure_id not in self.slots and structure_id not in self.no_graph
+            ]
+            if missing:
+                for i in range(0, len(missing), MAX_QUERY_IDS):
+                    for structure_id, graph, fp in self._read_graphs(missing[i:i + MAX_QUERY_IDS]):
+                        self._put(structure_id, graph, fp)
+                self.no_graph.update(structure_id for structure_id in missing if structure_id not in self.slots)
+            slots = self.slots
+            found = [(structure_id, slots[structure_id]) for structure_id in structure_ids if structure_id in slots]
+            passed = found
+            if fingerprint is not None:
+                queries = [fingerprint] if isinstance(fingerprint, (bytes, bytearray)) else fingerprint
+                queries = [np.frombuffer(query, dtype=np.uint64) for query in queries]
+                if found and all(query.any() for query in queries):
+                    rows = self.fingerprints[np.array([slot for structure_id, slot in found], dtype=np.intp)]
+                    mask = np.zeros(len(found), dtype=bool)
+                    for query in queries:
+                        mask |= ((rows & query) == query).all(axis=1)
+                    passed = [item for item, is_passed in zip(found, mask.tolist()) if is_passed]
+            if stats is not None:
+                stats['candidates'] = len(found)
+                stats['passed'] = len(passed)
+            return passed
+
+    def get_graphs(self, structure_ids, fingerprint=None, stats=None):
+        '''
+        Return graphs of the given structures in the same order. Structures which are not in the store yet
+        (added by another process) are read from the database, structures without graph are skipped.
+        If the request "fingerprint" is given, structures whose fingerprint bits are not a superset
+        of its bits are skipped too; the number of candidates and passed structures is written to "stats".
+        "fingerprint" can be a list of fingerprints, then structures which pass any of them are returned.
+        '''
+        with self.lock:
+            graphs = self.graphs
+            return [graphs[slot] for structure_id, slot in self._get_slots(structure_ids, fingerprint, stats)]
+
+    def get_ids(self, structure_ids, fingerprint=None, stats=None):
+        '''The same as get_graphs, but return ids of the structures (array of uint32) instead of their graphs.'''
+        return array('I', [structure_id for structure_id, slot in self._get_slots(structure_ids, fingerprint, stats)])
+
+
+class GraphChunks:
+    '''
+    Search plan: ids of candidate structures split into chunks of chunk_size structures.
+    Graphs of a chunk are taken from the graph store only when the chunk is searched,
+    so the plan can be kept between iterations of the partial search.
+    '''
+
+    def __init__(self, structure_ids, chunk_size, qc=False):
+        self.structure_ids = array('I', structure_ids)
+        self.chunk_size = chunk_size
+        self.qc = qc
+
+    def __len__(self):
+        return -(-len(self.structure_ids) // self.chunk_size)
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError('chunk index out of range')
+        chunk_ids = self.structure_ids[index * self.chunk_size:(index + 1) * self.chunk_size]
+        return get_graph_store(self.qc).get_graphs(chunk_ids)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+structure_graphs = GraphStore(CoordinatesBlock)
+qc_structure_graphs = GraphStore(QCCoordinatesBlock, qc=True)
+
+
+def get_graph_store(qc=False):
+    if qc:
+        return qc_structure_graphs
+    return structure_graphs
+
+
+def preload_graph_stores():
+    '''Load graphs at worker startup if it is enabled in settings.'''
+    if getattr(settings, 'GRAPH_STORE_PRELOAD', False):
+        structure_graphs.ensure_loaded()
+        qc_structure_graphs.ensure_loaded()
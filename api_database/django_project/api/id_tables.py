@@ -0,0 +1,49 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+MAX_ID_PARAMS = 30000  # more ids are written to the temporary table instead of query parameters
+
+
+def filter_by_ids(queryset, ids, table, max_params=MAX_ID_PARAMS):
+    '''
+    Filter the queryset by the ids. Up to max_params ids are passed as query parameters, more ids are written
+    to the temporary table of the database connection, so the database filters and sorts the structures
+    without a huge query. The table is refilled by the next call with the same table in the same thread,
+    so the queryset should be evaluated before it.
+    '''
+    ids = [int(value) for value in ids]
+    if len(ids) <= max_params:
+        return queryset.filter(id__in=ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY)')
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.executemany(f'INSERT INTO {table} (id) VALUES (%s)', [(value,) for value in ids])
+    return queryset.filter(id__in=RawSQL(f'SELECT id FROM {table}', ()))
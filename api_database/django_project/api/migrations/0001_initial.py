@@ -0,0 +1,40 @@
+# Generated by Django 3.2.24 on 2026-10-17 00:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('qc', models.BooleanField(default=False, verbose_name='QC structures')),
+                ('search_type', models.CharField(choices=[('substructure', 'substructure'), ('exact', 'exact')], max_length=12)),
+                ('template', models.TextField(verbose_name='Template graph')),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('cancelled', 'cancelled'), ('failed', 'failed')], db_index=True, default='queued', max_length=9)),
+                ('chunks_total', models.IntegerField(default=0)),
+                ('chunks_done', models.IntegerField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('result_ids', models.BinaryField(default=bytes, help_text='ids of found structures (uint32 array), sorted by refcode when the job is done', verbose_name='Result')),
+                ('prescreen', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
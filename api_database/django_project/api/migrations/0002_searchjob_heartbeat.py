@@ -0,0 +1,23 @@
+# Generated by Django 3.2.24 on 2026-10-17 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='owner',
+            field=models.CharField(blank=True, default='', help_text='server process which runs the job', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='searchjob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='last time the owner process confirmed that it keeps the job', null=True),
+        ),
+    ]
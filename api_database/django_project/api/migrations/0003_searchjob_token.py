@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-17 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_searchjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='token',
+            field=models.CharField(blank=True, default='', editable=False, help_text='secret which gives access to the job submitted without login', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-17 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_searchjob_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='result_positions',
+            field=models.BinaryField(default=bytes, help_text='positions of the result ids in the order of ids (uint32 array), to find a structure by bisection', verbose_name='Result positions'),
+        ),
+    ]
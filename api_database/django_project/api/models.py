@@ -0,0 +1,123 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import uuid
+from bisect import bisect_left
+from django.db import models
+from django.contrib.auth import get_user_model
+
+
+User = get_user_model()
+
+JOB_STATUSES = [
+    ('queued', 'queued'),
+    ('running', 'running'),
+    ('done', 'done'),
+    ('cancelled', 'cancelled'),
+    ('failed', 'failed'),
+]
+SEARCH_TYPES = [
+    ('substructure', 'substructure'),
+    ('exact', 'exact'),
+]
+
+
+class SearchJob(models.Model):
+    '''Substructure search running in the background (see api/search_jobs.py).'''
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='search_jobs',
+        blank=True,
+        null=True
+    )
+    qc = models.BooleanField(verbose_name='QC structures', default=False)
+    search_type = models.CharField(max_length=12, choices=SEARCH_TYPES)
+    template = models.TextField(verbose_name='Template graph')
+    status = models.CharField(max_length=9, choices=JOB_STATUSES, default='queued', db_index=True)
+    chunks_total = models.IntegerField(default=0)
+    chunks_done = models.IntegerField(default=0)
+    hits = models.IntegerField(default=0)
+    result_ids = models.BinaryField(
+        verbose_name='Result',
+        help_text='ids of found structures (uint32 array), sorted by refcode when the job is done',
+        default=bytes,
+        editable=False
+    )
+    result_positions = models.BinaryField(
+        verbose_name='Result positions',
+        help_text='positions of the result ids in the order of ids (uint32 array), to find a structure by bisection',
+        default=bytes,
+        editable=False
+    )
+    prescreen = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    token = models.CharField(
+        max_length=64,
+        help_text='secret which gives access to the job submitted without login',
+        blank=True,
+        default='',
+        editable=False
+    )
+    owner = models.CharField(
+        max_length=64,
+        help_text='server process which runs the job',
+        blank=True,
+        default=''
+    )
+    heartbeat = models.DateTimeField(
+        help_text='last time the owner process confirmed that it keeps the job',
+        blank=True,
+        null=True,
+        db_index=True
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'{self.id} ({self.status})'
+
+    def get_result_ids(self):
+        '''Found ids sorted by refcode as the uint32 view of the stored array, which is not decoded.'''
+        return memoryview(bytes(self.result_ids)).cast('I')
+
+    def get_result_position(self, structure_id):
+        '''Position of the structure in the result ids or None if it was not found.'''
+        ids = self.get_result_ids()
+        positions = memoryview(bytes(self.result_positions)).cast('I')
+        if len(positions) != len(ids):
+            # the job was finished before the positions were stored
+            positions = sorted(range(len(ids)), key=ids.__getitem__)
+        index = bisect_left(positions, structure_id, key=ids.__getitem__)
+        if index < len(positions) and ids[positions[index]] == structure_id:
+            return positions[index]
+        return None
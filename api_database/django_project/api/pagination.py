@@ -26,9 +26,76 @@
 #
 # *****************************************************************************************
 
+from bisect import bisect_right
+from collections import OrderedDict
+from django.db.models import QuerySet
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class LimitPagination(PageNumberPagination):
+    '''
+    Page number pagination with the page size set by "limit" parameter and keyset pagination by refcode:
+    if "after" parameter is given, the page starts after the structure with this refcode, so every page costs
+    the same as the first one. "next" link uses "after" if the structures are sorted by refcode, querysets
+    sorted otherwise (e.g. by the distance to the query cell or by the text relevance) get page number links
+    to keep their order.
+    Querysets and lists of (refcode, id) pairs sorted by refcode can be paginated, other sorted lists
+    should override get_position.
+    '''
     page_size_query_param = 'limit'
+    after_query_param = 'after'
     ordering = 'refcode'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.is_keyset_ordered(queryset)
+        self.after = request.query_params.get(self.after_query_param) if self.keyset else None
+        if self.after is None:
+            page = super().paginate_queryset(queryset, request, view)
+            if page is not None:
+                self.count = self.page.paginator.count
+                self.has_next = self.page.has_next()
+            return page
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        if isinstance(queryset, QuerySet):
+            self.count = queryset.count()
+            page = list(queryset.filter(refcode__gt=self.after).order_by(self.ordering)[:page_size + 1])
+        else:
+            self.count = len(queryset)
+            start = self.get_position(queryset, self.after)
+            page = list(queryset[start:start + page_size + 1])
+        self.has_next = len(page) > page_size
+        return page[:page_size]
+
+    def is_keyset_ordered(self, queryset):
+        '''Whether the order of the queryset is kept by the keyset pagination by refcode.'''
+        if not isinstance(queryset, QuerySet):
+            return True
+        query = queryset.query
+        if query.extra_order_by:
+            # relevance of the full-text search
+            return False
+        ordering = query.order_by or (queryset.model._meta.ordering if query.default_ordering else [])
+        return not ordering or list(ordering) == [self.ordering]
+
+    def get_position(self, items, after):
+        '''Index of the first item with refcode greater than "after".'''
+        return bisect_right(items, (after, float('inf')))
+
+    def get_paginated_response(self, data):
+        next_link = None
+        if not self.keyset:
+            next_link = self.get_next_link()
+        elif self.has_next and data:
+            next_link = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+            next_link = replace_query_param(next_link, self.after_query_param, data[-1]['refcode'])
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', next_link),
+            ('previous', self.get_previous_link() if self.after is None else None),
+            ('results', data)
+        ]))
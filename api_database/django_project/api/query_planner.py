@@ -0,0 +1,146 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import time
+from collections import Counter
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from structure.models import AtomStatistics, CoordinatesBlock
+from qc_structure.models import QCCoordinatesBlock
+from modules.graph_pack.graph_pack import unpack_graph, parse_template
+
+MAX_STAT_VALUE = 15  # H-count and coordination above this value are counted together
+STATISTICS_TTL = 600  # seconds between reloads of the statistics in a worker
+HYDROGEN = 1
+
+_statistics = {False: {'loaded': 0, 'data': dict()}, True: {'loaded': 0, 'data': dict()}}
+
+
+def count_atoms(packed_graph):
+    '''Return Counter of (element, H-count, coordination) of the graph atoms.'''
+    structure_id, types, h_nums, bonds = unpack_graph(packed_graph)
+    degrees = [0] * len(types)
+    explicit_h = [0] * len(types)
+    for atom1, atom2 in bonds:
+        degrees[atom1 - 1] += 1
+        degrees[atom2 - 1] += 1
+        if types[atom2 - 1] == HYDROGEN:
+            explicit_h[atom1 - 1] += 1
+        if types[atom1 - 1] == HYDROGEN:
+            explicit_h[atom2 - 1] += 1
+    counter = Counter()
+    for atom_type, h_num, degree, h_explicit in zip(types, h_nums, degrees, explicit_h):
+        counter[(
+            atom_type,
+            min(h_num + h_explicit, MAX_STAT_VALUE),
+            min(h_num + degree, MAX_STAT_VALUE)
+        )] += 1
+    return counter
+
+
+def count_atoms_change(old_graph, new_graph):
+    '''Return Counter of atoms added (positive) and removed (negative) when old_graph is replaced by new_graph.'''
+    counter = count_atoms(new_graph) if new_graph else Counter()
+    if old_graph:
+        counter.subtract(count_atoms(old_graph))
+    return counter
+
+
+def add_atom_statistics(counter, qc=False):
+    '''Add counted atoms (negative counts are subtracted) to the AtomStatistics table of experimental or QC structures.'''
+    with transaction.atomic():
+        for (element, h_num, coord), count in counter.items():
+            if not count:
+                continue
+            updated = AtomStatistics.objects.filter(qc=qc, element=element, h_num=h_num, coord=coord).update(
+                count=F('count') + count
+            )
+            if not updated and count > 0:
+                AtomStatistics.objects.create(qc=qc, element=element, h_num=h_num, coord=coord, count=count)
+
+
+@receiver(pre_delete, sender=CoordinatesBlock)
+@receiver(pre_delete, sender=QCCoordinatesBlock)
+def remove_atom_statistics(sender, instance, **kwargs):
+    '''Atoms of deleted structures (also deleted by cascade) are subtracted from the statistics.'''
+    if instance.packed_graph:
+        counter = Counter()
+        counter.subtract(count_atoms(instance.packed_graph))
+        add_atom_statistics(counter, qc=sender is QCCoordinatesBlock)
+
+
+def get_statistics(qc=False):
+    '''Return {element: [(h_num, coord, count), ...]} of experimental or QC structures, reloaded every STATISTICS_TTL seconds.'''
+    statistics = _statistics[qc]
+    if time.time() - statistics['loaded'] > STATISTICS_TTL:
+        data = dict()
+        for element, h_num, coord, count in AtomStatistics.objects.filter(qc=qc).values_list(
+                'element', 'h_num', 'coord', 'count'):
+            data.setdefault(element, []).append((h_num, coord, count))
+        statistics['data'] = data
+        statistics['loaded'] = time.time()
+    return statistics['data']
+
+
+def estimate_count(types, h_num, cord_min, cord_max, statistics):
+    '''The number of database atoms which can be matched with the template atom.'''
+    count = 0
+    for element in types:
+        for data_h_num, coord, number in statistics.get(element, ()):
+            if data_h_num >= h_num and cord_min <= coord <= cord_max:
+                count += number
+    return count
+
+
+def get_start_atom(template, statistics=None, qc=False):
+    '''
+    Return the number of the rarest (by the atom statistics) and most connected template atom,
+    cpplib starts the search from this atom (start_atom argument of SearchMainPacked and SearchBatchPacked).
+    Returns 0 (the default start of cpplib) if there are no statistics.
+    '''
+    if statistics is None:
+        statistics = get_statistics(qc)
+    if not statistics:
+        return 0
+    atoms, bonds, multitypes = parse_template(template)
+    degrees = [0] * (len(atoms) + 1)
+    for atom1, atom2 in bonds:
+        degrees[atom1] += 1
+        degrees[atom2] += 1
+    candidates = []
+    for atom, (atom_type, h_num, cord_min, cord_max) in enumerate(atoms, 1):
+        types = multitypes.get(atom_type, [atom_type])
+        # hydrogens are unpacked by cpplib and can not be the first atom
+        if HYDROGEN not in types:
+            count = estimate_count(types, h_num, cord_min, cord_max, statistics)
+            candidates.append((count, -degrees[atom], atom))
+    if not candidates:
+        return 0
+    return min(candidates)[2]
@@ -0,0 +1,227 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+import networkx as nx
+from django.conf import settings
+from modules.graph_pack.graph_pack import parse_template
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024  # maximum total size of stored ids in bytes
+MAX_CHANGES = 1000  # the number of last dataset changes kept in the change log
+WL_ITERATIONS = 3  # iterations of Weisfeiler-Lehman hash of the template graph
+
+
+def template_to_graph(template):
+    '''Build networkx graph from the template string ("1 n b (type H cmin cmax)*n (a b)*b [multitypes]").'''
+    atoms, bonds, multitypes = parse_template(template)
+    graph = nx.Graph()
+    for atom, (atom_type, h_num, cord_min, cord_max) in enumerate(atoms, 1):
+        types = sorted(multitypes.get(atom_type, [atom_type]))
+        graph.add_node(atom, label=f'{"/".join(map(str, types))}:{h_num}:{cord_min}:{cord_max}')
+    graph.add_edges_from(bonds)
+    return graph
+
+
+def get_template_hash(template):
+    '''Hash of the template graph which does not depend on the atom order.'''
+    graph = template_to_graph(template)
+    return nx.weisfeiler_lehman_graph_hash(graph, node_attr='label', iterations=WL_ITERATIONS)
+
+
+def is_same_template(template_1, template_2):
+    return template_1 == template_2 or nx.is_isomorphic(
+        template_to_graph(template_1),
+        template_to_graph(template_2),
+        node_match=lambda node_1, node_2: node_1['label'] == node_2['label']
+    )
+
+
+class SearchResultCache:
+    '''
+    Search results (ids of found structures) shared by all workers through the SQLite file.
+    Entries are keyed by the template hash, search type, structure scope and the dataset version,
+    which is bumped on every change of structures, so outdated results are never returned.
+    The total size of stored ids is limited, least recently used entries are removed first.
+    Every bump is recorded in the change log with ids of the changed structures, so other processes
+    can update their copies of the structures instead of reloading all of them (see get_changes).
+    '''
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.local = threading.local()
+
+    def _connect(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version INTEGER, template TEXT, '
+                'ids BLOB, size INTEGER, last_used REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS changes (version INTEGER PRIMARY KEY, scope TEXT, ids BLOB)'
+            )
+            self.local.connection = connection
+        return connection
+
+    def get_version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE name = 'dataset_version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, structure_ids=None, scope=None):
+        '''
+        Invalidate all stored results (structures were added, changed or deleted) and return the new version.
+        structure_ids: ids of the changed structures of the scope ('exp' or 'qc'), None if any structure
+        could be changed (then processes reload all structures of the scope, or of both scopes if it is None)
+        '''
+        ids = None if structure_ids is None else array('I', structure_ids).tobytes()
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                "INSERT INTO meta (name, value) VALUES ('dataset_version', 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1"
+            )
+            version = connection.execute("SELECT value FROM meta WHERE name = 'dataset_version'").fetchone()[0]
+            connection.execute('DELETE FROM results WHERE version < ?', (version,))
+            connection.execute('INSERT OR REPLACE INTO changes (version, scope, ids) VALUES (?, ?, ?)',
+                               (version, scope, ids))
+            connection.execute('DELETE FROM changes WHERE version <= ?', (version - MAX_CHANGES,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return version
+
+    def get_changes(self, since, version):
+        '''
+        Return [(scope, structure ids or None), ...] of the changes made after the version "since"
+        up to "version", None if some of them are not in the change log (then everything should be reloaded).
+        '''
+        rows = self._connect().execute(
+            'SELECT scope, ids FROM changes WHERE version > ? AND version <= ? ORDER BY version', (since, version)
+        ).fetchall()
+        if len(rows) != version - since:
+            return None
+        return [(scope, None if ids is None else array('I', ids).tolist()) for scope, ids in rows]
+
+    def get_changed_ids(self, since, version, scope):
+        '''
+        Return the set of ids of the structures of the scope ('exp' or 'qc') changed after the version "since"
+        up to "version", None if they are not known (then all structures of the scope should be reread).
+        '''
+        changes = self.get_changes(since, version)
+        if changes is None:
+            return None
+        changed_ids = set()
+        for change_scope, structure_ids in changes:
+            if change_scope in (None, scope):
+                if structure_ids is None:
+                    return None
+                changed_ids.update(structure_ids)
+        return changed_ids
+
+    def get_key(self, template, search_type, scope, version):
+        key = f'{get_template_hash(template)}:{search_type}:{scope}:{version}'
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, template, search_type, scope):
+        '''Return the list of found structure ids or None.'''
+        connection = self._connect()
+        version = self.get_version()
+        key = self.get_key(template, search_type, scope, version)
+        row = connection.execute('SELECT template, ids FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None or not is_same_template(row[0], template):
+            return None
+        connection.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        return array('I', row[1]).tolist()
+
+    def set(self, template, search_type, scope, structure_ids, version=None):
+        '''Save found ids. The version should be read before the search, so results of a search
+        which was running during the dataset change are saved under the outdated version.'''
+        connection = self._connect()
+        if version is None:
+            version = self.get_version()
+        key = self.get_key(template, search_type, scope, version)
+        ids = array('I', structure_ids).tobytes()
+        if len(ids) > self.max_size:
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO results (key, version, template, ids, size, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, version, template, ids, len(ids), time.time())
+            )
+            total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            if total_size > self.max_size:
+                for old_key, size in connection.execute(
+                        'SELECT key, size FROM results ORDER BY last_used').fetchall():
+                    if total_size <= self.max_size:
+                        break
+                    connection.execute('DELETE FROM results WHERE key = ?', (old_key,))
+                    total_size -= size
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        self._connect().execute('DELETE FROM results')
+
+
+search_result_cache = SearchResultCache(
+    getattr(settings, 'SEARCH_RESULT_CACHE_PATH', os.path.join(settings.BASE_DIR, 'search_cache.sqlite3')),
+    getattr(settings, 'SEARCH_RESULT_CACHE_SIZE', DEFAULT_MAX_SIZE)
+)
+
+
+def bump_dataset_version(structure_ids=None, qc=None):
+    '''Bump the dataset version recording ids of the changed structures (see SearchResultCache.bump_version).'''
+    scope = None if qc is None else 'qc' if qc else 'exp'
+    return search_result_cache.bump_version(structure_ids, scope)
+
+
+def get_result_cache_scope(request, queryset, qc):
+    '''
+    Results are shared by all users who can see only common structures,
+    users with their own structures get their own entries.
+    '''
+    scope = 'qc' if qc else 'exp'
+    if request.user.is_authenticated and queryset.filter(user=request.user).exists():
+        return f'{scope}:user{request.user.id}'
+    return f'{scope}:common'
@@ -0,0 +1,266 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import os
+import secrets
+import socket
+import threading
+import time
+import uuid
+import networkx as nx
+import cpplib
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import mixins, viewsets, status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from structure.models import StructureCode
+from qc_structure.models import QCStructureCode
+from django_project.loggers import search_logger
+from .models import SearchJob
+from .serializers import (SearchSerializer, SearchJobSerializer, SearchJobCreatedSerializer, RefcodeShortSerializer,
+                          QCRefcodeShortSerializer)
+from .pagination import LimitPagination
+from .views import (get_user_queryset, get_template_graph, get_search_ids_with_filtration, get_sorted_ids,
+                    get_structures_in_order, CHUNK_SIZE)
+from .search_scheduler import search_scheduler
+from .graph_store import GraphChunks
+from .query_planner import get_start_atom
+
+ACTIVE_STATUSES = ('queued', 'running')
+# the process which runs the job, the random part distinguishes restarted processes with the same pid
+JOB_OWNER = f'{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+HEARTBEAT_INTERVAL = getattr(settings, 'SEARCH_JOB_HEARTBEAT_INTERVAL', 30)  # seconds
+STALE_HEARTBEATS = 4  # the number of missed heartbeats after which the job is orphaned
+
+# Searches run in threads: cpplib releases the GIL, so the pool bounds the number of parallel searches
+job_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'SEARCH_JOB_WORKERS', 2),
+    thread_name_prefix='search-job'
+)
+heartbeat_lock = threading.Lock()
+heartbeat_thread = None
+
+
+class SearchJobPagination(LimitPagination):
+    '''
+    Job results are ids sorted by refcode, pages are slices of the stored array; the keyset position is found
+    by bisection of the stored positions by the id of "after" structure (see SearchJob.get_result_position).
+    '''
+    structure_code_model = StructureCode
+    job = None
+
+    def get_position(self, items, after):
+        structure_id = self.structure_code_model.objects.filter(refcode=after).values_list('id', flat=True).first()
+        position = None if structure_id is None else self.job.get_result_position(structure_id)
+        if position is None:
+            raise NotFound('Invalid cursor')
+        return position + 1
+
+
+def fail_orphaned_jobs():
+    '''
+    The job queue is in memory, so active jobs of a stopped server process will never be finished.
+    Every process confirms its active jobs (heartbeat), jobs of other processes which were not confirmed
+    for STALE_HEARTBEATS intervals are marked as failed.
+    '''
+    stale = timezone.now() - timedelta(seconds=HEARTBEAT_INTERVAL * STALE_HEARTBEATS)
+    count = SearchJob.objects.filter(status__in=ACTIVE_STATUSES).exclude(owner=JOB_OWNER).filter(
+        Q(heartbeat__lt=stale) | Q(heartbeat__isnull=True)
+    ).update(status='failed', error='The server was stopped before the job was finished', finished=timezone.now())
+    if count:
+        search_logger.warning(f'{count} search jobs of stopped server processes were marked as failed')
+
+
+def send_heartbeats():
+    while True:
+        try:
+            SearchJob.objects.filter(owner=JOB_OWNER, status__in=ACTIVE_STATUSES).update(heartbeat=timezone.now())
+            fail_orphaned_jobs()
+        except Exception as error:
+            search_logger.error(f'Search job heartbeat failed: {error}')
+        finally:
+            close_old_connections()
+        time.sleep(HEARTBEAT_INTERVAL)
+
+
+def start_heartbeat():
+    '''Start the thread which confirms jobs of this process and fails orphaned ones (once per process).'''
+    global heartbeat_thread
+    with heartbeat_lock:
+        if heartbeat_thread is None:
+            heartbeat_thread = threading.Thread(target=send_heartbeats, name='search-job-heartbeat', daemon=True)
+            heartbeat_thread.start()
+
+
+def run_search_job(job_id, queryset, chunk_size):
+    '''
+    Search chunk by chunk and save the progress (the number of chunks and hits) after each chunk,
+    found ids are saved when the job is done. The job stops before the next chunk if its status was changed
+    (cancelled).
+    '''
+    # the job runs in a thread of the executor, its database connection is not closed by request signals
+    close_old_connections()
+    try:
+        search_job(job_id, queryset, chunk_size)
+    finally:
+        close_old_connections()
+
+
+def search_job(job_id, queryset, chunk_size):
+    if not SearchJob.objects.filter(id=job_id, status='queued').update(status='running'):
+        return
+    job = SearchJob.objects.get(id=job_id)
+    running = SearchJob.objects.filter(id=job_id, status='running')
+    try:
+        prescreen = dict()
+        structure_ids = get_search_ids_with_filtration(
+            job.template,
+            queryset,
+            'qc_' if job.qc else '',
+            enable_substr_filtr=False,
+            enable_fp_filtr=True,
+            enable_hash_filtr=job.search_type == 'exact',
+            stats=prescreen
+        )
+        analyse_data_split = GraphChunks(structure_ids, chunk_size, job.qc)
+        if not running.update(chunks_total=len(analyse_data_split), prescreen=prescreen):
+            return
+        exact = job.search_type == 'exact'
+        start_atom = get_start_atom(job.template, qc=job.qc)
+        result_ids = array('I')
+        for analyse_data in analyse_data_split:
+            # structures of a planned chunk can be deleted before it is searched
+            if analyse_data:
+                with search_scheduler.slot(reject=False):
+                    result_ids.extend(
+                        cpplib.SearchMainPacked(
+                            job.template, analyse_data, search_scheduler.get_threads(), exact, 0, start_atom
+                        )
+                    )
+            if not running.update(chunks_done=F('chunks_done') + 1, hits=len(result_ids)):
+                search_logger.info(f'Search job {job_id} was cancelled')
+                return
+        structure_code_model = QCStructureCode if job.qc else StructureCode
+        result_ids = array('I', [
+            structure_id for refcode, structure_id in get_sorted_ids(result_ids.tolist(), structure_code_model)
+        ])
+        result_positions = array('I', sorted(range(len(result_ids)), key=result_ids.__getitem__))
+        running.update(
+            status='done',
+            result_ids=result_ids.tobytes(),
+            result_positions=result_positions.tobytes(),
+            finished=timezone.now()
+        )
+        search_logger.info(f'Search job {job_id} has found {len(result_ids)} structures')
+    except Exception as error:
+        search_logger.error(f'Search job {job_id} failed: {error}')
+        running.update(status='failed', error=str(error), finished=timezone.now())
+
+
+class SearchJobViewSet(
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet
+):
+    '''
+    Background structure search.
+    POST (the same body as for search) submits a job and returns its id, GET returns the progress and
+    a page of found structures of the done job (limit and page parameters),
+    DELETE cancels running job or deletes finished one.
+    Jobs are available only to the user who submitted them; a job submitted without login gets a secret token
+    (returned by POST), which should be passed as "token" parameter or "X-Job-Token" header.
+    '''
+    serializer_class = SearchJobSerializer
+    out_serializer_class = RefcodeShortSerializer
+    structure_code_model = StructureCode
+    qc = False
+
+    def get_queryset(self):
+        jobs = SearchJob.objects.filter(qc=self.qc)
+        token = self.request.query_params.get('token') or self.request.headers.get('X-Job-Token')
+        access = Q(user__isnull=True, token=token) if token else Q(pk__in=[])
+        if self.request.user.is_authenticated:
+            access |= Q(user=self.request.user)
+        return jobs.filter(access)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        start_heartbeat()
+
+    def create(self, request):
+        serializer = SearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        graph = nx.Graph()
+        graph.add_nodes_from(serializer.data.get('nodes'))
+        graph.add_edges_from(serializer.data.get('edges'))
+        job = SearchJob.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            qc=self.qc,
+            search_type=serializer.data.get('search_type'),
+            template=get_template_graph(graph),
+            token='' if request.user.is_authenticated else secrets.token_urlsafe(32),
+            owner=JOB_OWNER,
+            heartbeat=timezone.now()
+        )
+        queryset = get_user_queryset(request, self.qc)
+        job_executor.submit(run_search_job, job.id, queryset, serializer.data.get('chunk_size') or CHUNK_SIZE)
+        return Response(SearchJobCreatedSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        paginator = SearchJobPagination()
+        paginator.structure_code_model = self.structure_code_model
+        paginator.job = job
+        page_ids = paginator.paginate_queryset(job.get_result_ids(), request)
+        page = get_structures_in_order(page_ids, self.structure_code_model)
+        response = paginator.get_paginated_response(self.out_serializer_class(page, many=True).data)
+        response.data.update(self.get_serializer(job).data)
+        for key in ('count', 'next', 'previous', 'results'):
+            response.data.move_to_end(key)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        job = self.get_object()
+        if SearchJob.objects.filter(id=job.id, status__in=ACTIVE_STATUSES).update(
+                status='cancelled', finished=timezone.now()):
+            job.refresh_from_db()
+            return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+        job.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class QCSearchJobViewSet(SearchJobViewSet):
+    out_serializer_class = QCRefcodeShortSerializer
+    structure_code_model = QCStructureCode
+    qc = True
@@ -0,0 +1,132 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing import cpu_count
+from django.conf import settings
+
+STATS_SIZE = 200  # the number of the last searches used for the wait and search time statistics
+
+
+class SearchQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Search queue is full, retry after {retry_after} s')
+        self.retry_after = retry_after
+
+
+class SearchScheduler:
+    '''
+    Process-wide budget of search threads. Up to "max_running" searches run at once, each of them gets the fixed
+    share of "threads" (threads // max_running), so the running searches never use more threads than the budget,
+    other searches wait in the FIFO queue of "max_queue" places, new searches over it are rejected.
+    '''
+    def __init__(self, threads, max_running, max_queue):
+        self.threads = threads
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.condition = threading.Condition()
+        self.wait_times = deque(maxlen=STATS_SIZE)
+        self.search_times = deque(maxlen=STATS_SIZE)
+
+    def is_full(self):
+        return self.running >= self.max_running and self.waiting >= self.max_queue
+
+    def get_retry_after(self):
+        '''Seconds until the queue moves by one search of the average duration for every running place.'''
+        search_time = sum(self.search_times) / len(self.search_times) if self.search_times else 1
+        return max(math.ceil(search_time * (self.waiting // self.max_running + 1)), 1)
+
+    def check(self):
+        '''Raise SearchQueueFull if a new search can not be queued.'''
+        with self.condition:
+            if self.is_full():
+                self.rejected += 1
+                raise SearchQueueFull(self.get_retry_after())
+
+    @contextmanager
+    def slot(self, reject=True):
+        '''
+        Wait for the place among running searches. With "reject" SearchQueueFull is raised if the queue is full,
+        background jobs wait anyway.
+        '''
+        start = time.monotonic()
+        with self.condition:
+            if reject and self.is_full():
+                self.rejected += 1
+                raise SearchQueueFull(self.get_retry_after())
+            self.waiting += 1
+            try:
+                while self.running >= self.max_running:
+                    self.condition.wait()
+            finally:
+                self.waiting -= 1
+            self.running += 1
+            self.wait_times.append(time.monotonic() - start)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.search_times.append(time.monotonic() - started)
+                self.condition.notify()
+
+    def get_threads(self):
+        '''Threads for one cpplib call: the share of the budget of one running place.'''
+        return max(self.threads // self.max_running, 1)
+
+    def get_status(self):
+        with self.condition:
+            wait_times = list(self.wait_times)
+            return {
+                'threads': self.threads,
+                'max_running': self.max_running,
+                'max_queue': self.max_queue,
+                'running': self.running,
+                'waiting': self.waiting,
+                'rejected': self.rejected,
+                'wait_time': {
+                    'mean': round(sum(wait_times) / len(wait_times), 3) if wait_times else 0,
+                    'max': round(max(wait_times), 3) if wait_times else 0,
+                    'last': round(wait_times[-1], 3) if wait_times else 0,
+                },
+            }
+
+
+search_scheduler = SearchScheduler(
+    getattr(settings, 'SEARCH_THREADS', max(cpu_count() // 2, 1)),
+    getattr(settings, 'SEARCH_MAX_RUNNING', 4),
+    getattr(settings, 'SEARCH_QUEUE_SIZE', 16)
+)
@@ -0,0 +1,102 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from django.utils import timezone
+from django_project.loggers import search_timings_logger
+
+
+class SearchTimings:
+    '''
+    Wall and CPU time of search phases, candidate and hit counts of one search request.
+    CPU time is the process time, so it includes search threads of cpplib and other requests running
+    at the same time. Time of a phase entered several times (chunks) is summed up.
+    '''
+
+    def __init__(self, **info):
+        self.info = info
+        self.phases = dict()
+        self.counts = dict()
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall_ms, cpu_ms = self.phases.get(name, (0.0, 0.0))
+            self.phases[name] = (
+                wall_ms + (time.perf_counter() - wall) * 1000,
+                cpu_ms + (time.process_time() - cpu) * 1000
+            )
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def get_total(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def as_dict(self):
+        return {
+            **self.info,
+            'phases': {
+                name: {'wall_ms': round(wall_ms, 2), 'cpu_ms': round(cpu_ms, 2)}
+                for name, (wall_ms, cpu_ms) in self.phases.items()
+            },
+            'total_ms': round(self.get_total(), 2),
+            **self.counts
+        }
+
+    def get_header(self):
+        '''Value of the Server-Timing header.'''
+        metrics = [
+            f'{name};dur={wall_ms:.2f};desc="cpu {cpu_ms:.2f} ms"'
+            for name, (wall_ms, cpu_ms) in self.phases.items()
+        ]
+        metrics.append(f'total;dur={self.get_total():.2f}')
+        return ', '.join(metrics)
+
+    def add_to_response(self, response, body=False):
+        '''Set the Server-Timing header, add the "_timings" block to the JSON body and write the record to the log.'''
+        record = self.as_dict()
+        response['Server-Timing'] = self.get_header()
+        if body:
+            response.data['_timings'] = record
+        search_timings_logger.info(json.dumps({'time': timezone.now().isoformat(), **record}))
+        return response
+
+
+def timed(timings, name):
+    '''Phase context of timings or no-op context if timings are not collected.'''
+    if timings is None:
+        return nullcontext()
+    return timings.phase(name)
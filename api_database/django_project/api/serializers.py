@@ -30,19 +30,25 @@ from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from structure.models import (StructureCode, Author, Spacegroup, Cell,
                               CompoundName, Formula, Publication,
-                              RefcodePublicationConnection, ExperimentalInfo,
+                              ExperimentalInfo,
                               ReducedCell, ExperimentalInfo, RefinementInfo,
                               CoordinatesBlock, CrystalAndStructureInfo,
-                              CifFile, Journal, InChI)
+                              CifFile, Journal)
 from qc_structure.models import (QCStructureCode, QCCell, QCCompoundName, QCFormula,
                                  QCReducedCell, QCCoordinatesBlock, QCProgram,
-                                 QCProperties, VaspFile, QCInChI)
+                                 QCProperties, VaspFile)
 from djoser.serializers import UserSerializer, UserCreateSerializer
 from django.contrib.auth import get_user_model
 from .fields import NodesListField, EdgesListField
+from .models import SearchJob
+from modules.graph_pack.graph_pack import graph_to_string
 
 User = get_user_model()
 
+MAX_BATCH_TEMPLATES = 50  # the number of templates searched in one batch request
+MAX_SIMILARITY_TOP_K = 1000  # the number of structures returned by the similarity search
+MAX_LOOKUP_REFCODES = 20000  # the number of refcodes resolved in one lookup request
+
 
 #########################################################################
 #                    Structure Serializers                            #
@@ -172,17 +178,15 @@ class RefcodeFullSerializer(serializers.ModelSerializer):
 
     def get_publication(self, obj):
         try:
-            publication = RefcodePublicationConnection.objects.get(refcode=obj).publication
-            return PublicationSerializer(publication).data
+            return PublicationSerializer(obj.publication.publication).data
         except Exception:
             pass
 
     def get_inchi(self, obj):
-        try:
-            inchi = InChI.objects.get(refcode=obj).get_inchi_string()
-            return inchi
-        except Exception:
-            pass
+        # the only InChI of the structure (uses prefetched objects)
+        inchis = obj.inchi.all()
+        if len(inchis) == 1:
+            return inchis[0].get_inchi_string()
 
 
 class CifUploadSerializer(serializers.ModelSerializer):
@@ -222,6 +226,66 @@ class SearchSerializer(serializers.Serializer):
     edges = EdgesListField(child=serializers.CharField(max_length=100), allow_empty=True)
     chunk_size = serializers.IntegerField(required=False, default=0, min_value=0)
     iter_num = serializers.IntegerField(required=False, default=0, min_value=0)
+    # stream all chunks in one response instead of paging them with iter_num
+    stream = serializers.ChoiceField(choices=['ndjson', 'sse'], required=False)
+    # stop the search after max_hits found structures (the first ones in the order of structure ids)
+    max_hits = serializers.IntegerField(required=False, default=0, min_value=0)
+    # return wall and CPU time of search phases in the "_timings" block (Server-Timing header is always set)
+    timings = serializers.BooleanField(required=False, default=False)
+
+
+class SearchTemplateSerializer(serializers.Serializer):
+    nodes = NodesListField(child=serializers.CharField(max_length=100), allow_empty=False, required=True)
+    edges = EdgesListField(child=serializers.CharField(max_length=100), allow_empty=True)
+
+
+class SearchBatchSerializer(serializers.Serializer):
+    search_type = serializers.ChoiceField(
+        choices=['exact', 'substructure'],
+        required=True,
+        error_messages={"invalid_choice": "Unsupported value: use 'exact' or 'substructure' keywords"}
+    )
+    # templates input: [{"nodes": [...], "edges": [...]}, ...], the same format as for the search
+    templates = serializers.ListField(
+        child=SearchTemplateSerializer(), allow_empty=False, max_length=MAX_BATCH_TEMPLATES, required=True
+    )
+
+
+class SimilaritySerializer(serializers.Serializer):
+    # the query is a structure of the database or the drawn graph
+    refcode = serializers.CharField(max_length=17, required=False)
+    nodes = NodesListField(child=serializers.CharField(max_length=100), allow_empty=False, required=False)
+    edges = EdgesListField(child=serializers.CharField(max_length=100), allow_empty=True, required=False)
+    top_k = serializers.IntegerField(required=False, default=50, min_value=1, max_value=MAX_SIMILARITY_TOP_K)
+    threshold = serializers.FloatField(required=False, default=0.0, min_value=0.0, max_value=1.0)
+
+    def validate(self, data):
+        if not data.get('refcode') and not data.get('nodes'):
+            raise serializers.ValidationError('Set "refcode" or "nodes" of the query structure')
+        return data
+
+
+class RefcodeLookupSerializer(serializers.Serializer):
+    refcodes = serializers.ListField(
+        child=serializers.CharField(max_length=17), allow_empty=False, max_length=MAX_LOOKUP_REFCODES, required=True
+    )
+    # refcodes are matched exactly (case-insensitive) or as refcode prefixes
+    exact = serializers.BooleanField(required=False, default=True)
+
+
+class SearchJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SearchJob
+        fields = (
+            'id', 'status', 'search_type', 'chunks_total', 'chunks_done',
+            'hits', 'prescreen', 'error', 'created', 'finished'
+        )
+
+
+class SearchJobCreatedSerializer(SearchJobSerializer):
+    '''The job with its access token, which is returned only once, when the job is submitted.'''
+    class Meta(SearchJobSerializer.Meta):
+        fields = SearchJobSerializer.Meta.fields + ('token',)
 
 
 #########################################################################
@@ -264,10 +328,17 @@ class QCFormulaSerializer(serializers.ModelSerializer):
 
 
 class QCCoordinatesSerializer(serializers.ModelSerializer):
+    graph = SerializerMethodField(read_only=True)
+
     class Meta:
         model = QCCoordinatesBlock
         fields = ('id', 'coordinates', 'smiles', 'graph')
 
+    def get_graph(self, obj):
+        if obj.packed_graph:
+            return graph_to_string(obj.packed_graph)
+        return None
+
 
 class QCProgramSerializer(serializers.ModelSerializer):
     class Meta:
@@ -311,11 +382,10 @@ class QCRefcodeFullSerializer(serializers.ModelSerializer):
         )
 
     def get_inchi(self, obj):
-        try:
-            inchi = QCInChI.objects.get(refcode=obj).get_inchi_string()
-            return inchi
-        except Exception:
-            pass
+        # the only InChI of the structure (uses prefetched objects)
+        inchis = obj.qc_inchi.all()
+        if len(inchis) == 1:
+            return inchis[0].get_inchi_string()
 
 
 class QCRefcodeShortSerializer(serializers.ModelSerializer):
@@ -0,0 +1,454 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django_project.loggers import search_logger
+from modules.graph_pack.fingerprint import FP_BYTES
+from .result_cache import search_result_cache
+
+LOAD_CHUNK_SIZE = 5000  # the number of fingerprints read from the database at once
+MAX_QUERY_IDS = 900  # the number of ids in one "refcode_id__in" query
+BLOCK_ROWS = 65536  # the number of matrix rows scored at once
+MIN_PARALLEL_ROWS = 200000  # smaller matrices are scored in the request thread
+CURRENT_FILE = 'current'  # the file with the name of the current matrix directory
+VERSION_FILE = 'version'  # the file with the dataset version of the matrix
+DELTA_FILE = 'delta.npz'  # rows of the structures changed after the matrix was written
+MAX_DELTA_ROWS = 50000  # structures changed after the matrix was written, more changes make the full rebuild
+MIN_REBUILD_INTERVAL = 600  # seconds between the full rebuilds started by searches
+REBUILD_LOCK_FILE = 'rebuild.lock'  # the file which exists while the matrix is rebuilt by a worker
+REBUILD_LOCK_TIMEOUT = 3600  # seconds after which the lock of a failed worker is ignored
+# number of set bits of each 16-bit word (NumPy 1.x has no bitwise_count)
+POPCOUNT_16 = np.array([bin(value).count('1') for value in range(1 << 16)], dtype=np.uint8)
+
+
+def get_matrix_path(qc=False):
+    return os.path.join(settings.SIMILARITY_MATRIX_DIR, 'qc' if qc else 'exp')
+
+
+def popcount(rows):
+    '''Number of set bits in each row of the uint8 matrix (the row length is even).'''
+    return POPCOUNT_16[rows.view(np.uint16)].sum(axis=1, dtype=np.uint32)
+
+
+def write_matrix(coordinates_model, path, stdout=None):
+    '''
+    Write fingerprints of all structures to the new directory of "path" and make it current:
+    "fingerprints.npy" (uint8 matrix, one row per structure), "ids.npy" (structure ids), "owners.npy"
+    (user ids, 0 for common structures) and "counts.npy" (number of set bits of rows).
+    The dataset version is read before the structures, so changes made during the rebuild make the matrix stale.
+    Readers keep using the previous matrix until they see the new "current" file.
+    Return the number of rows.
+    '''
+    version = search_result_cache.get_version()
+    blocks = coordinates_model.objects.filter(fingerprint__isnull=False).order_by('refcode_id')
+    num_rows = blocks.count()
+    name = f'matrix-{time.time_ns()}'
+    directory = os.path.join(path, name)
+    os.makedirs(directory)
+    fingerprints = np.lib.format.open_memmap(
+        os.path.join(directory, 'fingerprints.npy'), mode='w+', dtype=np.uint8, shape=(num_rows, FP_BYTES)
+    )
+    ids = np.zeros(num_rows, dtype=np.uint32)
+    owners = np.zeros(num_rows, dtype=np.uint32)
+    row = 0
+    for structure_id, user_id, fingerprint in blocks.values_list(
+            'refcode_id', 'refcode__user_id', 'fingerprint'
+    ).iterator(chunk_size=LOAD_CHUNK_SIZE):
+        # structures added during the rebuild are written by the next rebuild
+        if row == num_rows:
+            break
+        if not fingerprint or len(fingerprint) != FP_BYTES:
+            continue
+        fingerprints[row] = np.frombuffer(fingerprint, dtype=np.uint8)
+        ids[row] = structure_id
+        owners[row] = user_id or 0
+        row += 1
+        if stdout and row % LOAD_CHUNK_SIZE == 0:
+            stdout.write(f'{coordinates_model.__name__}: {row} of {num_rows}')
+    counts = np.zeros(num_rows, dtype=np.uint16)
+    for start in range(0, row, BLOCK_ROWS):
+        counts[start:start + BLOCK_ROWS] = popcount(fingerprints[start:min(start + BLOCK_ROWS, row)])
+    fingerprints.flush()
+    del fingerprints
+    np.save(os.path.join(directory, 'ids.npy'), ids[:row])
+    np.save(os.path.join(directory, 'owners.npy'), owners[:row])
+    np.save(os.path.join(directory, 'counts.npy'), counts[:row])
+    with open(os.path.join(directory, VERSION_FILE), 'w') as file:
+        file.write(str(version))
+    current = os.path.join(path, CURRENT_FILE)
+    with open(f'{current}.tmp', 'w') as file:
+        file.write(name)
+    os.replace(f'{current}.tmp', current)
+    # the previous matrix is kept for searches which are running on it
+    old_names = sorted(old_name for old_name in os.listdir(path) if old_name.startswith('matrix-') and old_name != name)
+    for old_name in old_names[:-1]:
+        shutil.rmtree(os.path.join(path, old_name), ignore_errors=True)
+    return row
+
+
+def load_version(directory):
+    '''Return the dataset version of the matrix directory or None for matrices written without it.'''
+    try:
+        with open(os.path.join(directory, VERSION_FILE)) as file:
+            return int(file.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def load_matrix(directory):
+    '''Return memory-mapped ids, owners, bit counts and fingerprints of the matrix directory.'''
+    ids = np.load(os.path.join(directory, 'ids.npy'), mmap_mode='r')
+    owners = np.load(os.path.join(directory, 'owners.npy'), mmap_mode='r')
+    counts = np.load(os.path.join(directory, 'counts.npy'), mmap_mode='r')
+    fingerprints = np.load(os.path.join(directory, 'fingerprints.npy'), mmap_mode='r')
+    return ids, owners, counts, fingerprints
+
+
+def get_empty_delta():
+    return {
+        'ids': np.zeros(0, dtype=np.uint32),
+        'owners': np.zeros(0, dtype=np.uint32),
+        'counts': np.zeros(0, dtype=np.uint16),
+        'fingerprints': np.zeros((0, FP_BYTES), dtype=np.uint8),
+        'removed': np.zeros(0, dtype=np.uint32),
+        'version': np.array(-1),
+    }
+
+
+def load_delta(directory):
+    '''
+    Return the delta of the matrix directory: rows of the structures changed after the matrix was written
+    ("ids", "owners", "counts", "fingerprints"), sorted ids of all such structures, whose matrix rows are skipped
+    ("removed"), and the dataset version of the delta ("version"); None if there were no changes.
+    '''
+    try:
+        with np.load(os.path.join(directory, DELTA_FILE)) as data:
+            return {name: data[name] for name in data.files}
+    except FileNotFoundError:
+        return None
+
+
+def write_delta(coordinates_model, directory, structure_ids, version):
+    '''
+    Add the changed structures to the delta of the matrix directory (see load_delta): their matrix rows are skipped
+    by the search and their current fingerprints are scored from the delta. Readers see the new delta
+    when the file is replaced. Return the number of delta rows.
+    '''
+    delta = load_delta(directory) or get_empty_delta()
+    changed = np.unique(np.array(list(structure_ids), dtype=np.uint32))
+    kept = ~np.isin(delta['ids'], changed)
+    ids = [delta['ids'][kept]]
+    owners = [delta['owners'][kept]]
+    fingerprints = [delta['fingerprints'][kept]]
+    for i in range(0, len(changed), MAX_QUERY_IDS):
+        rows = [
+            (structure_id, user_id or 0, fingerprint)
+            for structure_id, user_id, fingerprint in coordinates_model.objects.filter(
+                refcode_id__in=changed[i:i + MAX_QUERY_IDS].tolist(), fingerprint__isnull=False
+            ).values_list('refcode_id', 'refcode__user_id', 'fingerprint')
+            if fingerprint and len(fingerprint) == FP_BYTES
+        ]
+        if rows:
+            ids.append(np.array([row[0] for row in rows], dtype=np.uint32))
+            owners.append(np.array([row[1] for row in rows], dtype=np.uint32))
+            fingerprints.append(
+                np.frombuffer(b''.join(bytes(row[2]) for row in rows), dtype=np.uint8).reshape(-1, FP_BYTES)
+            )
+    ids, owners, fingerprints = np.concatenate(ids), np.concatenate(owners), np.concatenate(fingerprints)
+    order = np.argsort(ids, kind='stable')
+    path = os.path.join(directory, DELTA_FILE)
+    with open(f'{path}.tmp', 'wb') as file:
+        np.savez(
+            file,
+            ids=ids[order],
+            owners=owners[order],
+            counts=popcount(fingerprints[order]).astype(np.uint16),
+            fingerprints=fingerprints[order],
+            removed=np.union1d(delta['removed'], changed).astype(np.uint32),
+            version=np.array(version)
+        )
+    os.replace(f'{path}.tmp', path)
+    return len(ids)
+
+
+def score_fingerprints(fingerprints, counts, owners, query, query_count, owner, threshold):
+    '''Tanimoto similarity of the query and the rows, return (mask of visible rows with scores >= threshold, scores).'''
+    common = popcount(fingerprints & query)
+    union = counts.astype(np.uint32) + query_count - common
+    scores = (common / np.maximum(union, 1)).astype(np.float32)
+    visible = (owners == 0) | (owners == owner)
+    return visible & (scores >= threshold), scores
+
+
+def top_rows(scores, rows, top_k):
+    '''
+    Return (rows, scores) of the top_k scores in descending order of scores, ties are ordered by rows
+    and the first rows of the ties are taken at the top_k boundary, so the result does not depend on the blocks.
+    '''
+    if len(scores) > top_k:
+        boundary = -np.partition(-scores, top_k - 1)[top_k - 1]
+        better = np.flatnonzero(scores > boundary)
+        ties = np.flatnonzero(scores == boundary)
+        ties = ties[np.argsort(rows[ties], kind='stable')[:top_k - len(better)]]
+        best = np.concatenate([better, ties])
+        scores, rows = scores[best], rows[best]
+    order = np.lexsort((rows, -scores))
+    return rows[order], scores[order]
+
+
+def score_rows(directory, start, stop, query, owner, top_k, threshold, removed=None):
+    '''
+    Tanimoto similarity of the query fingerprint (uint8 array) and matrix rows start:stop which are common
+    or belong to the owner, rows of the "removed" structures (sorted ids, see load_delta) are skipped.
+    Return (rows, scores) of the top_k rows with scores >= threshold.
+    '''
+    ids, owners, counts, fingerprints = load_matrix(directory)
+    query_count = int(popcount(query[np.newaxis])[0])
+    found_rows = [np.empty(0, dtype=np.int64)]
+    found_scores = [np.empty(0, dtype=np.float32)]
+    for block_start in range(start, stop, BLOCK_ROWS):
+        block_stop = min(block_start + BLOCK_ROWS, stop)
+        mask, scores = score_fingerprints(
+            fingerprints[block_start:block_stop], counts[block_start:block_stop], owners[block_start:block_stop],
+            query, query_count, owner, threshold
+        )
+        if removed is not None and len(removed):
+            mask &= ~np.isin(ids[block_start:block_stop], removed)
+        rows = np.flatnonzero(mask)
+        rows, scores = top_rows(scores[rows], rows + block_start, top_k)
+        found_rows.append(rows)
+        found_scores.append(scores)
+    return top_rows(np.concatenate(found_scores), np.concatenate(found_rows), top_k)
+
+
+class SimilarityIndex:
+    '''
+    Process-wide access to the fingerprint matrix of "path". The matrix is reopened when the "current" file
+    points to a new rebuild or its delta is replaced, large matrices are scored by SIMILARITY_PROCESSES processes,
+    each of them maps the same file, so rows are not copied between processes.
+    The matrix written before the last change of structures is stale, it is updated in the background
+    (see rebuild_if_stale): structures changed since then are written to the delta, the whole matrix is rewritten
+    only if the changes are not known or the delta is too large, and not more often than MIN_REBUILD_INTERVAL.
+    '''
+
+    def __init__(self, path, coordinates_model, qc=False):
+        self.path = path
+        # the model label, models are not imported by processes of the executor
+        self.coordinates_model = coordinates_model
+        self.scope = 'qc' if qc else 'exp'
+        self.name = None
+        self.delta_time = None
+        self.matrix = None
+        self.version = None
+        self.size = 0
+        self.lock = threading.Lock()
+        self.rebuild_future = None
+
+    def get_matrix(self):
+        '''
+        Return (directory, ids, owners, counts, fingerprints, delta) of the current matrix (see load_matrix
+        and load_delta) or None if it is not built.
+        '''
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as file:
+                name = file.read().strip()
+        except FileNotFoundError:
+            return None
+        directory = os.path.join(self.path, name)
+        try:
+            delta_time = os.stat(os.path.join(directory, DELTA_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            delta_time = None
+        with self.lock:
+            if name != self.name or delta_time != self.delta_time:
+                ids, owners, counts, fingerprints = load_matrix(directory)
+                delta = load_delta(directory)
+                self.matrix = (directory, ids, owners, counts, fingerprints, delta)
+                self.version = load_version(directory)
+                self.size = len(ids)
+                if delta is not None:
+                    self.version = int(delta['version'])
+                    self.size += len(delta['ids']) - int(np.isin(ids, delta['removed']).sum())
+                self.name = name
+                self.delta_time = delta_time
+            return self.matrix
+
+    def is_stale(self):
+        '''True if the matrix is not built or structures were changed after it was written.'''
+        if self.get_matrix() is None:
+            return True
+        return self.version != search_result_cache.get_version()
+
+    def rebuild_if_stale(self):
+        '''
+        Start the update of the stale matrix in the background and return True if the matrix is stale.
+        Only one update runs at once, other workers skip it while the lock file of the running one exists.
+        '''
+        if not self.is_stale():
+            return False
+        with self.lock:
+            if self.rebuild_future is None or self.rebuild_future.done():
+                self.rebuild_future = rebuild_executor.submit(self.rebuild)
+        return True
+
+    def rebuild(self):
+        lock_path = os.path.join(self.path, REBUILD_LOCK_FILE)
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            if time.time() - os.path.getmtime(lock_path) > REBUILD_LOCK_TIMEOUT:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return
+        try:
+            # the update started after the check could have written the matrix already
+            if self.is_stale():
+                start = time.time()
+                if self.update_delta():
+                    search_logger.info(
+                        f'Similarity matrix of {self.coordinates_model} updated in {time.time() - start:.3f} s'
+                    )
+                elif self.get_matrix() is None or time.time() - self.get_written_time() >= MIN_REBUILD_INTERVAL:
+                    num_rows = write_matrix(apps.get_model(self.coordinates_model), self.path)
+                    search_logger.info(
+                        f'Similarity matrix of {self.coordinates_model} rebuilt: '
+                        f'{num_rows} fingerprints in {time.time() - start:.3f} s'
+                    )
+        except Exception:
+            search_logger.exception(f'Similarity matrix of {self.coordinates_model} rebuild failed')
+        finally:
+            os.remove(lock_path)
+            connection.close()
+
+    def update_delta(self):
+        '''
+        Write structures changed since the matrix version to its delta, return False if they are not known
+        or there are too many of them (the matrix should be rebuilt).
+        '''
+        matrix = self.get_matrix()
+        if matrix is None or self.version is None:
+            return False
+        # the version is read before the structures, so changes made during the update make the matrix stale
+        version = search_result_cache.get_version()
+        structure_ids = search_result_cache.get_changed_ids(self.version, version, self.scope)
+        if structure_ids is None:
+            return False
+        delta = matrix[5]
+        if len(structure_ids) + (0 if delta is None else len(delta['removed'])) > MAX_DELTA_ROWS:
+            return False
+        write_delta(apps.get_model(self.coordinates_model), matrix[0], structure_ids, version)
+        return True
+
+    def get_written_time(self):
+        '''Time when the current matrix was written (its directory is named by the time).'''
+        return int(self.name.rsplit('-', 1)[-1]) / 1e9
+
+    def search(self, query, owner=0, top_k=50, threshold=0.0):
+        '''
+        Return [(structure id, score), ...] of top_k structures most similar to the query fingerprint (bytes)
+        in descending order of scores, only common structures and structures of the owner are scored.
+        '''
+        matrix = self.get_matrix()
+        if matrix is None:
+            return []
+        directory, ids, owners, counts, fingerprints, delta = matrix
+        query = np.frombuffer(query, dtype=np.uint8)
+        removed = None if delta is None else delta['removed']
+        num_rows = len(ids)
+        processes = settings.SIMILARITY_PROCESSES
+        if num_rows < MIN_PARALLEL_ROWS or processes < 2:
+            rows, scores = score_rows(directory, 0, num_rows, query, owner, top_k, threshold, removed)
+        else:
+            step = -(-num_rows // processes)
+            results = list(get_executor().map(
+                score_rows,
+                *zip(*[
+                    (directory, start, min(start + step, num_rows), query, owner, top_k, threshold, removed)
+                    for start in range(0, num_rows, step)
+                ])
+            ))
+            rows, scores = top_rows(
+                np.concatenate([scores for rows, scores in results]),
+                np.concatenate([rows for rows, scores in results]),
+                top_k
+            )
+        # matrix rows are sorted by ids, so the ties are ordered by ids as by rows
+        found_ids = np.asarray(ids)[rows].astype(np.int64)
+        if delta is not None and len(delta['ids']):
+            query_count = int(popcount(query[np.newaxis])[0])
+            mask, delta_scores = score_fingerprints(
+                delta['fingerprints'], delta['counts'], delta['owners'], query, query_count, owner, threshold
+            )
+            delta_rows = np.flatnonzero(mask)
+            found_ids, scores = top_rows(
+                np.concatenate([scores, delta_scores[delta_rows]]),
+                np.concatenate([found_ids, delta['ids'][delta_rows].astype(np.int64)]),
+                top_k
+            )
+        return [(int(structure_id), round(float(score), 4)) for structure_id, score in zip(found_ids, scores)]
+
+    def get_size(self):
+        return 0 if self.get_matrix() is None else self.size
+
+
+executor = None
+executor_lock = threading.Lock()
+rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='similarity-rebuild')
+
+
+def get_executor():
+    '''Process pool of the similarity search, processes are started without a copy of the Django worker.'''
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                settings.SIMILARITY_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+            )
+        return executor
+
+
+structure_similarity = SimilarityIndex(get_matrix_path(qc=False), 'structure.CoordinatesBlock')
+qc_structure_similarity = SimilarityIndex(get_matrix_path(qc=True), 'qc_structure.QCCoordinatesBlock', qc=True)
+
+
+def get_similarity_index(qc=False):
+    if qc:
+        return qc_structure_similarity
+    return structure_similarity
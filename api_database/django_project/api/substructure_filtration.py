@@ -28,6 +28,8 @@
 
 from structure.management.commands.cif_db_update_modules._add_substructure_filtration import TEMPLATES, SET_ELEMENTS
 from django.conf import settings
+from modules.graph_pack.fingerprint import expand_template
+from modules.graph_pack.graph_pack import parse_template
 import cpplib
 
 NUM_ELEM_DICT = {
@@ -51,43 +53,46 @@ def set_substructure(template_graph, analyse_mol):
 
 
 def set_elements(analyse_mol):
+    '''
+    Return elements of the template atoms and the list of sets of alternative elements of multitype atoms.
+    '''
     elem_found = set()
-    mol_data = analyse_mol.split()
-    num_nodes = int(mol_data[1])
-    for idx, el in enumerate(mol_data[3:], start=1):
-        if idx < num_nodes * 4 and idx % 4 == 1:
-            if int(el) > 0:
-                element = NUM_ELEM_DICT[int(el)]
-                elem_found.add(element)
-            else:
-                return 0
-    return elem_found
+    multitypes = dict()
+    atoms, bonds, template_multitypes = parse_template(analyse_mol)
+    for atom_type, h_num, cord_min, cord_max in atoms:
+        if atom_type > 0:
+            elem_found.add(NUM_ELEM_DICT[atom_type])
+        else:
+            multitypes[atom_type] = {NUM_ELEM_DICT[value] for value in template_multitypes.get(atom_type, ())}
+    return elem_found, list(multitypes.values())
 
 
 def set_filter(analyse_mol, enable_substr_filtr=True, enable_elem_filtr=True):
+    '''
+    Return substructure and element flags which every structure found by the template has.
+    A template with multitype atoms is replaced by its expansions (see expand_template),
+    a flag is set if all expansions have it.
+    '''
     result = dict()  # {attr_name: [1, obj_name]}
 
     if enable_substr_filtr:
-        # check analyse_mol has multitypes
-        # TODO: добавить подструктурную фильтрацию (мультитипы преобразовать!!!)
-        multitypes = False
-        if '-' in analyse_mol:
-            multitypes = True
-        if not multitypes:
+        expansions = expand_template(analyse_mol)
+        # templates with too many combinations of multitypes are not filtered
+        if expansions is not None:
             for attr_name, data in TEMPLATES.items():
                 template_graph, obj_name = data
-                output = set_substructure(template_graph, analyse_mol)
-                if output:
-                    result[attr_name] = [True, obj_name]
-                else:
-                    result[attr_name] = [False, obj_name]
+                output = all(set_substructure(template_graph, expansion) for expansion in expansions)
+                result[attr_name] = [output, obj_name]
 
     if enable_elem_filtr:
-        elem_found = set_elements(analyse_mol)
-        # only if no multitypes
-        if elem_found:
+        elem_found, multitypes = set_elements(analyse_mol)
+        if elem_found or multitypes:
             for attr_name, elements in SET_ELEMENTS.items():
-                if elem_found.intersection(set(elements)):
+                elements = set(elements)
+                # a multitype atom requires the set if all its alternatives are in the set
+                if elem_found.intersection(elements) or any(
+                        alternatives and alternatives <= elements for alternatives in multitypes
+                ):
                     result[attr_name] = [True, 'Substructure1']
                 else:
                     result[attr_name] = [False, 'Substructure1']
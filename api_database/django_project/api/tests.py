@@ -27,24 +27,150 @@
 # *****************************************************************************************
 
 from django.test import TestCase
-from structure.models import StructureCode
-from .views import get_search_queryset_with_filtration, start_SearchMain, get_queryset_from_ids
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from structure.models import (StructureCode, CoordinatesBlock, Spacegroup, Cell, ReducedCell, CompoundName,
+                              ExperimentalInfo, RefinementInfo, CrystalAndStructureInfo, Other,
+                              get_elements_list, elem_models)
+from qc_structure.models import (QCStructureCode, QCCell, QCReducedCell, QCCompoundName, QCFormula,
+                                 QCCoordinatesBlock, QCProperties, QCProgram)
+from .models import SearchJob, User
+from .views import get_search_queryset_with_filtration, start_SearchMain, get_queryset_from_ids, get_sorted_ids
+from .query_planner import get_start_atom, get_statistics
+from .search_scheduler import search_scheduler
+from .filters import general_elements_filter, StructureFilter
+from .pagination import LimitPagination
+from .filter_planner import load_statistics
+from .facets import FACETS, HISTOGRAMS
+from .result_cache import SearchResultCache
+from .similarity import SimilarityIndex, write_matrix
+from django_filters.rest_framework import FilterSet
 from structure.management.commands.cif_db_update_modules._add_substructure_filtration import TEMPLATES
+from modules.graph_pack.graph_pack import unpack_graph, parse_template, pack_graph_string, graph_to_string
+from modules.graph_pack.graph_hash import get_template_component_hashes
+import os
+import tempfile
+from array import array
 from itertools import zip_longest
+from unittest.mock import patch
+import networkx as nx
 from progress.bar import IncrementalBar
+import cpplib
 
+THREADS = (1, 4)  # the number of search threads for the checks of results which must not depend on it
+TEST_CELL = {'a': 10.0, 'b': 11.0, 'c': 12.0, 'al': 90.0, 'be': 100.0, 'ga': 90.0}
 
-def get_analysed_data(template_graph, queryset, chunk_size, enable_substr_filtr, enable_elem_filtr):
+
+def get_analysed_data(template_graph, queryset, chunk_size, enable_substr_filtr, enable_elem_filtr, enable_fp_filtr=False):
     analyse_data = get_search_queryset_with_filtration(
         template_graph,
         queryset,
         enable_substr_filtr=enable_substr_filtr,
-        enable_elem_filtr=enable_elem_filtr
+        enable_elem_filtr=enable_elem_filtr,
+        enable_fp_filtr=enable_fp_filtr
     )
     analyse_data_split = list(zip_longest(*[iter(analyse_data)] * chunk_size, fillvalue=''))
     return analyse_data_split
 
 
+def add_structure_details(structure):
+    '''Add the data written to the cif file to the structure, return the space group of its cell.'''
+    spacegroup = Spacegroup.objects.create(
+        number=14, system=2, name='P21/c', symops='x,y,z;-x,1/2+y,1/2-z;-x,-y,-z;x,1/2-y,1/2+z'
+    )
+    Cell.objects.create(refcode=structure, spacegroup=spacegroup, zvalue=4, **TEST_CELL)
+    ReducedCell.objects.create(refcode=structure, volume=1300.0, **TEST_CELL)
+    CompoundName.objects.create(refcode=structure, systematic_name='test compound')
+    ExperimentalInfo.objects.create(refcode=structure)
+    RefinementInfo.objects.create(refcode=structure)
+    CrystalAndStructureInfo.objects.create(refcode=structure)
+    Other.objects.create(refcode=structure)
+    return spacegroup
+
+
+def add_qc_structure(coordinates_block, spacegroup):
+    '''QC structure with the coordinates of the experimental structure.'''
+    structure = QCStructureCode.objects.create(refcode='TEST-QC-1')
+    QCCell.objects.create(refcode=structure, spacegroup=spacegroup, zvalue=4, **TEST_CELL)
+    QCReducedCell.objects.create(refcode=structure, volume=1300.0, **TEST_CELL)
+    QCCompoundName.objects.create(refcode=structure, systematic_name='test compound')
+    QCFormula.objects.create(refcode=structure)
+    QCProperties.objects.create(refcode=structure)
+    QCProgram.objects.create(refcode=structure)
+    QCCoordinatesBlock.objects.create(
+        refcode=structure, coordinates=coordinates_block.coordinates, packed_graph=coordinates_block.packed_graph
+    )
+    return structure
+
+
+def get_paginated_refcodes(queryset, url, max_count):
+    '''Refcodes of the structures on the pages of the queryset following "next" links.'''
+    refcodes = []
+    while url and len(refcodes) < max_count:
+        paginator = LimitPagination()
+        page = paginator.paginate_queryset(queryset, Request(APIRequestFactory().get(url)))
+        data = [{'refcode': structure.refcode} for structure in page]
+        refcodes.extend(item['refcode'] for item in data)
+        url = paginator.get_paginated_response(data).data['next']
+    return refcodes[:max_count]
+
+
+def get_multitype_templates(template):
+    '''
+    Templates with one multitype atom (its element or another one) for every heavy atom of the template
+    and the template with all heavy atoms of C, N or O elements (too many expansions to be expanded).
+    '''
+    atoms, bonds, multitypes = parse_template(template)
+    if multitypes:
+        return []
+
+    def to_template(alternatives):
+        result = [1, len(atoms), len(bonds)]
+        for atom, (atom_type, h_num, cord_min, cord_max) in enumerate(atoms):
+            result.extend((-atom - 1 if atom in alternatives else atom_type, h_num, cord_min, cord_max))
+        for atom1, atom2 in bonds:
+            result.extend((atom1, atom2))
+        for atom, atom_types in alternatives.items():
+            result.extend((-atom - 1, *atom_types))
+        result.append(0)
+        return ' '.join(map(str, result))
+
+    heavy_atoms = [atom for atom, atom_data in enumerate(atoms) if atom_data[0] > 1]
+    templates = [
+        to_template({atom: (atoms[atom][0], 8 if atoms[atom][0] == 7 else 7)}) for atom in heavy_atoms
+    ]
+    templates.append(to_template({atom: (6, 7, 8) for atom in heavy_atoms}))
+    return templates
+
+
+def get_component_template(packed_graph):
+    '''Template of the largest component of the database graph with fixed coordination numbers (or None).'''
+    structure_id, types, h_nums, bonds = unpack_graph(packed_graph)
+    graph = nx.Graph()
+    for atom, atom_type in enumerate(types, 1):
+        graph.add_node(atom, type=atom_type, h_num=h_nums[atom - 1], cord=h_nums[atom - 1])
+    graph.add_edges_from(bonds)
+    for atom in graph:
+        graph.nodes[atom]['cord'] += graph.degree(atom)
+        if types[atom - 1] == 1:
+            for neighbour in graph[atom]:
+                graph.nodes[neighbour]['h_num'] += 1
+    graph.remove_nodes_from([atom for atom, atom_type in enumerate(types, 1) if atom_type == 1])
+    if not graph:
+        return None
+    component = graph.subgraph(max(nx.connected_components(graph), key=len))
+    positions = {atom: position for position, atom in enumerate(component, 1)}
+    result = [1, component.number_of_nodes(), component.number_of_edges()]
+    for atom in component:
+        node = component.nodes[atom]
+        result.extend((node['type'], node['h_num'], node['cord'], node['cord']))
+    for atom1, atom2 in component.edges:
+        result.extend((positions[atom1], positions[atom2]))
+    return ' '.join(map(str, result))
+
+
 class Test(TestCase):
     def test_substructure(self):
         only_substructure = False
@@ -105,3 +231,393 @@ than search with elements filtration!'''
                 )
             bar.next()
         bar.finish()
+
+    def test_fingerprint_filtration(self):
+        chunk_size = 10000
+        queryset = StructureCode.objects.all()
+        for group, template_graph in TEMPLATES.items():
+            template_graph = template_graph[0]
+            for exact in (False, True):
+                analyse_data = get_analysed_data(template_graph, queryset, chunk_size, False, False)
+                out_refcode_ids = start_SearchMain(template_graph, analyse_data, False, 0, exact)
+                without_filtration = set(out_refcode_ids)
+                analyse_data = get_analysed_data(template_graph, queryset, chunk_size, False, False, True)
+                out_refcode_ids = start_SearchMain(template_graph, analyse_data, False, 0, exact)
+                diff = without_filtration - set(out_refcode_ids)
+                self.assertEqual(
+                    len(diff),
+                    0,
+                    f'FingerprintFiltrationError: Search of {group} fragment (exact={exact}) '
+                    f'without filtration has found {len(diff)} structures more, than search with fingerprints!'
+                )
+
+    def test_multitype_fingerprint_filtration(self):
+        # structures found by a template with multitype atoms pass the prescreen by fingerprints of its expansions
+        chunk_size = 10000
+        queryset = StructureCode.objects.all()
+        for group, template_graph in TEMPLATES.items():
+            for template in get_multitype_templates(template_graph[0]):
+                for exact in (False, True):
+                    analyse_data = get_analysed_data(template, queryset, chunk_size, False, False)
+                    without_filtration = set(start_SearchMain(template, analyse_data, False, 0, exact))
+                    analyse_data = get_analysed_data(template, queryset, chunk_size, False, False, True)
+                    diff = without_filtration - set(start_SearchMain(template, analyse_data, False, 0, exact))
+                    self.assertEqual(
+                        len(diff),
+                        0,
+                        f'FingerprintFiltrationError: Search of {group} fragment with multitypes "{template}" '
+                        f'(exact={exact}) without filtration has found {len(diff)} structures more, '
+                        f'than search with fingerprints!'
+                    )
+
+    def test_batch_search(self):
+        # the batch search decodes each graph once for all templates and finds the same as separate searches
+        analyse_data = [bytes(graph) for graph in CoordinatesBlock.objects.filter(
+            packed_graph__isnull=False
+        ).order_by('refcode_id').values_list('packed_graph', flat=True)]
+        templates = [template_graph[0] for template_graph in TEMPLATES.values()]
+        templates += get_multitype_templates(templates[0])
+        start_atoms = [get_start_atom(template) for template in templates]
+        for exact in (False, True):
+            for num_threads in THREADS:
+                outputs = cpplib.SearchBatchPacked(templates, analyse_data, num_threads, exact, start_atoms)
+                self.assertEqual(len(outputs), len(templates), 'BatchSearchError: Wrong number of results!')
+                for template, start_atom, out_refcode_ids in zip(templates, start_atoms, outputs):
+                    self.assertListEqual(
+                        sorted(out_refcode_ids),
+                        sorted(cpplib.SearchMainPacked(template, analyse_data, 1, exact, 0, start_atom)),
+                        f'BatchSearchError: Batch search of "{template}" (exact={exact}, np={num_threads}) '
+                        f'differs from the search of the template!'
+                    )
+
+    def test_packed_graph(self):
+        # packed graphs hold the same graphs as the old string format and are found by the same templates
+        packed_graphs = [bytes(graph) for graph in CoordinatesBlock.objects.filter(
+            packed_graph__isnull=False
+        ).order_by('refcode_id').values_list('packed_graph', flat=True)]
+        graph_strings = [graph_to_string(graph) for graph in packed_graphs]
+        for packed_graph, graph_string in zip(packed_graphs, graph_strings):
+            self.assertEqual(
+                pack_graph_string(graph_string),
+                packed_graph,
+                f'PackedGraphError: Graph "{graph_string[:50]}..." is packed differently!'
+            )
+        for group, template_graph in TEMPLATES.items():
+            template_graph = template_graph[0]
+            for exact in (False, True):
+                self.assertListEqual(
+                    sorted(cpplib.SearchMainPacked(template_graph, packed_graphs, 1, exact)),
+                    sorted(cpplib.SearchMain(template_graph, graph_strings, 1, exact)),
+                    f'PackedGraphError: Search of {group} fragment (exact={exact}) in packed graphs '
+                    f'differs from the search in graph strings!'
+                )
+
+    def test_max_hits(self):
+        chunk_size = 50
+        queryset = StructureCode.objects.all()
+        for group, template_graph in TEMPLATES.items():
+            template_graph = template_graph[0]
+            analyse_data = get_search_queryset_with_filtration(
+                template_graph, queryset, enable_substr_filtr=False, enable_elem_filtr=False
+            )
+            data_ids = [unpack_graph(graph)[0] for graph in analyse_data]
+            self.assertListEqual(data_ids, sorted(data_ids), 'Graphs for search are not in the order of ids')
+            analyse_data_split = get_analysed_data(template_graph, queryset, chunk_size, False, False)
+            for exact in (False, True):
+                found_ids = set(cpplib.SearchMainPacked(template_graph, analyse_data, 1, exact))
+                first_ids = [structure_id for structure_id in data_ids if structure_id in found_ids]
+                for max_hits in {1, max(len(found_ids) // 2, 1)}:
+                    for num_threads in THREADS:
+                        # exactly the first max_hits matches in the data order
+                        out_refcode_ids = cpplib.SearchMainPacked(
+                            template_graph, analyse_data, num_threads, exact, max_hits
+                        )
+                        self.assertListEqual(
+                            sorted(out_refcode_ids),
+                            first_ids[:max_hits],
+                            f'MaxHitsError: Search of {group} fragment (exact={exact}, max_hits={max_hits}, '
+                            f'np={num_threads}) has found not the first structures!'
+                        )
+                        # the stopped search of the view finds the first structures in the order of ids
+                        with patch.multiple(search_scheduler, threads=num_threads, max_running=1):
+                            out_refcode_ids = start_SearchMain(
+                                template_graph, analyse_data_split, False, 0, exact, max_hits
+                            )
+                        self.assertListEqual(
+                            sorted(out_refcode_ids),
+                            sorted(found_ids)[:max_hits],
+                            f'MaxHitsError: Stopped search of {group} fragment (exact={exact}, max_hits={max_hits}, '
+                            f'np={num_threads}) has found not the first structures!'
+                        )
+
+    def test_query_planner(self):
+        chunk_size = 10000
+        queryset = StructureCode.objects.all()
+        statistics = get_statistics()
+        for group, template_graph in TEMPLATES.items():
+            template_graph = template_graph[0]
+            start_atom = get_start_atom(template_graph, statistics)
+            analyse_data = get_analysed_data(template_graph, queryset, chunk_size, False, False)
+            for exact in (False, True):
+                default_ids = set(start_SearchMain(template_graph, analyse_data, False, 0, exact))
+                planned_ids = set(start_SearchMain(template_graph, analyse_data, False, 0, exact, start_atom=start_atom))
+                self.assertSetEqual(
+                    default_ids,
+                    planned_ids,
+                    f'QueryPlannerError: Search of {group} fragment (exact={exact}) with the planned start atom '
+                    f'has found other structures!'
+                )
+
+    def test_hash_filtration(self):
+        chunk_size = 10000
+        queryset = StructureCode.objects.all()
+        packed_graphs = CoordinatesBlock.objects.filter(packed_graph__isnull=False).order_by('id')[:20]
+        for packed_graph in packed_graphs.values_list('packed_graph', flat=True):
+            template_graph = get_component_template(bytes(packed_graph))
+            if template_graph is None or get_template_component_hashes(template_graph) is None:
+                continue
+            analyse_data = get_analysed_data(template_graph, queryset, chunk_size, False, False, True)
+            scan_ids = set(start_SearchMain(template_graph, analyse_data, False, 0, True))
+            analyse_data = get_search_queryset_with_filtration(
+                template_graph, queryset, enable_substr_filtr=False, enable_elem_filtr=False, enable_hash_filtr=True
+            )
+            index_ids = set(start_SearchMain(template_graph, [analyse_data], False, 0, True))
+            self.assertSetEqual(
+                scan_ids,
+                index_ids,
+                f'HashFiltrationError: Exact search of {template_graph} by the hash index has found other structures!'
+            )
+
+    def test_elements_mask(self):
+        queryset = StructureCode.objects.all()
+        for i, elem_model in enumerate(elem_models, start=1):
+            for element in get_elements_list():
+                if not hasattr(elem_model, element):
+                    continue
+                joined_ids = set(queryset.filter(**{
+                    f'elements__element_set_{i}__{element}__isnull': False
+                }).values_list('id', flat=True))
+                mask_ids = set(general_elements_filter(queryset, element).values_list('id', flat=True))
+                self.assertSetEqual(
+                    joined_ids,
+                    mask_ids,
+                    f'ElementsMaskError: Structures with {element} found by the elements mask differ from ElementsSet!'
+                )
+
+    def test_filter_planner(self):
+        load_statistics(StructureCode)
+        queries = [
+            {'refcode': 'TST000', 'elements': 'S'},
+            {'refcode': 'TST001 TST002', 'elements': 'S', 'no_elements': 'Cl'},
+            {'elements': 'S', 'formula': 'O2', 'no_elements': 'Br'},
+        ]
+        for query in queries:
+            filterset = StructureFilter(query, queryset=StructureCode.objects.all())
+            planned_ids = list(filterset.qs.values_list('id', flat=True))
+            chained_queryset = FilterSet.filter_queryset(filterset, StructureCode.objects.all())
+            chained_ids = list(chained_queryset.values_list('id', flat=True))
+            self.assertListEqual(
+                sorted(planned_ids),
+                sorted(chained_ids),
+                f'FilterPlannerError: Structures found by {query} differ from chained filters!'
+            )
+            # underestimated filters find more than MAX_CANDIDATES structures, the rest of the filters are chained
+            with patch('api.filter_planner.MAX_CANDIDATES', 3), \
+                    patch.object(StructureFilter, 'get_selectivity', return_value=0.0001):
+                filterset = StructureFilter(query, queryset=StructureCode.objects.all())
+                planned_ids = list(filterset.qs.values_list('id', flat=True))
+            self.assertListEqual(
+                sorted(planned_ids),
+                sorted(chained_ids),
+                f'FilterPlannerError: Structures found by {query} with many candidates differ from chained filters!'
+            )
+
+    def test_ranked_pagination(self):
+        # structures sorted not by refcode (e.g. by the cell distance) keep their order on the next pages
+        queryset = StructureCode.objects.order_by('-refcode', 'id')
+        expected = list(queryset.values_list('refcode', flat=True)[:6])
+        refcodes = get_paginated_refcodes(queryset, '/api/v1/structures/?limit=2', len(expected))
+        self.assertListEqual(refcodes, expected, 'PaginationError: Next pages of ranked structures are out of order!')
+        # relevance of the text search is ordered by extra()
+        queryset = StructureCode.objects.extra(select={'text_rank': '-id'}, order_by=['text_rank', 'id'])
+        expected = list(queryset.values_list('refcode', flat=True)[:6])
+        refcodes = get_paginated_refcodes(queryset, '/api/v1/structures/?limit=2', len(expected))
+        self.assertListEqual(refcodes, expected, 'PaginationError: Next pages of text results are out of order!')
+
+    def test_hits_pagination(self):
+        # large search results are sorted by refcode and paginated after the refcode in the database
+        structure_ids = list(StructureCode.objects.order_by('id').values_list('id', flat=True))[::2]
+        expected = sorted(StructureCode.objects.filter(id__in=structure_ids).values_list('refcode', flat=True))
+        with patch('api.views.MAX_STRS_SIZE', 10):
+            queryset = get_queryset_from_ids(structure_ids, StructureCode)
+            refcodes = get_paginated_refcodes(queryset, '/api/v1/structures/?limit=7', len(expected))
+        self.assertListEqual(refcodes, expected, 'PaginationError: Pages of the search result are out of order!')
+
+    def test_search_job_access(self):
+        # jobs are available only to the user who submitted them, anonymous jobs only by their token
+        user = User.objects.create_user('search-job-user', password='search-job-password')
+        anonymous_job = SearchJob.objects.create(search_type='substructure', template='', status='done', token='secret')
+        user_job = SearchJob.objects.create(user=user, search_type='substructure', template='', status='done')
+        client = APIClient()
+        checks = (
+            (None, anonymous_job, '', 404),
+            (None, anonymous_job, '?token=wrong', 404),
+            (None, anonymous_job, '?token=secret', 200),
+            (None, user_job, '', 404),
+            (None, user_job, '?token=secret', 404),
+            (user, user_job, '', 200),
+            (user, anonymous_job, '', 404),
+        )
+        with patch('api.search_jobs.start_heartbeat'):
+            for request_user, job, params, expected in checks:
+                client.force_authenticate(request_user)
+                response = client.get(f'/api/v1/structures/search/jobs/{job.id}/{params}')
+                self.assertEqual(
+                    response.status_code,
+                    expected,
+                    f'SearchJobAccessError: Job of {job.user} is {response.status_code} for {request_user} ({params})!'
+                )
+
+    def test_search_job_pages(self):
+        # pages of the job result follow the refcode order, the keyset position is found by bisection
+        structure_ids = list(StructureCode.objects.order_by('-id').values_list('id', flat=True))[::3]
+        result = get_sorted_ids(structure_ids, StructureCode)
+        result_ids = array('I', [structure_id for refcode, structure_id in result])
+        positions = array('I', sorted(range(len(result_ids)), key=result_ids.__getitem__))
+        expected = [refcode for refcode, structure_id in result]
+        client = APIClient()
+        with patch('api.search_jobs.start_heartbeat'):
+            for job_positions in (positions.tobytes(), b''):
+                job = SearchJob.objects.create(
+                    search_type='substructure', template='', status='done', token='secret',
+                    result_ids=result_ids.tobytes(), result_positions=job_positions
+                )
+                refcodes = []
+                url = f'/api/v1/structures/search/jobs/{job.id}/?token=secret&limit=7'
+                while url:
+                    data = client.get(url).json()
+                    refcodes.extend(structure['refcode'] for structure in data['results'])
+                    url = data['next']
+                self.assertListEqual(refcodes, expected, 'SearchJobError: Pages of the job result are out of order!')
+                for position, structure_id in enumerate(result_ids):
+                    self.assertEqual(job.get_result_position(structure_id), position, 'SearchJobError: Wrong position!')
+                self.assertIsNone(job.get_result_position(0), 'SearchJobError: Absent structure was found!')
+
+    def test_similarity_delta(self):
+        # the matrix with the delta of changed structures finds the same as the matrix written after the changes
+        with tempfile.TemporaryDirectory() as path:
+            cache = SearchResultCache(os.path.join(path, 'cache.sqlite3'))
+            with patch('api.similarity.search_result_cache', cache):
+                write_matrix(CoordinatesBlock, os.path.join(path, 'matrix'))
+                index = SimilarityIndex(os.path.join(path, 'matrix'), 'structure.CoordinatesBlock')
+                blocks = list(CoordinatesBlock.objects.filter(fingerprint__isnull=False).order_by('refcode_id')[:3])
+                query = bytes(blocks[0].fingerprint)
+                blocks[1].fingerprint = blocks[0].fingerprint
+                blocks[2].fingerprint = None
+                CoordinatesBlock.objects.bulk_update(blocks[1:], ['fingerprint'])
+                cache.bump_version([block.refcode_id for block in blocks[1:]], 'exp')
+                self.assertTrue(index.is_stale(), 'SimilarityError: The matrix is not stale after the change!')
+                self.assertTrue(index.update_delta(), 'SimilarityError: The delta of known changes is not written!')
+                self.assertFalse(index.is_stale(), 'SimilarityError: The matrix is stale after the update!')
+                found = index.search(query, top_k=20)
+                write_matrix(CoordinatesBlock, os.path.join(path, 'rebuilt'))
+                expected = SimilarityIndex(os.path.join(path, 'rebuilt'), 'structure.CoordinatesBlock').search(
+                    query, top_k=20
+                )
+                self.assertListEqual(found, expected, 'SimilarityError: The updated matrix differs from the rebuilt one!')
+                self.assertEqual(
+                    index.get_size(),
+                    CoordinatesBlock.objects.filter(fingerprint__isnull=False).count(),
+                    'SimilarityError: Wrong size of the updated matrix!'
+                )
+
+    def test_facets(self):
+        # facet and histogram counts are the numbers of the filtered structures with the value or in the bin
+        structures = list(StructureCode.objects.filter(user__isnull=True).order_by('id')[:8])
+        spacegroups = [add_structure_details(structure) for structure in structures][:1]
+        spacegroups.append(Spacegroup.objects.create(number=2, system=1, name='P-1', symops='x,y,z;-x,-y,-z'))
+        for number, structure in enumerate(structures):
+            Cell.objects.filter(refcode=structure).update(spacegroup=spacegroups[number % 2], centring=number % 3 + 1)
+            ExperimentalInfo.objects.filter(refcode=structure).update(
+                structure_determination_temperature=100 + 20 * number, calculated_density_value=1.1 + 0.05 * number
+            )
+            RefinementInfo.objects.filter(refcode=structure).update(r_factor=0.03 + 0.01 * number if number % 3 else None)
+        bins = 4
+        queries = [dict(), {'elements': 'C'}, {'elements': 'N'}, {'no_elements': 'O'}, {'system': 2}]
+        client = APIClient()
+        for query in queries:
+            response = client.get('/api/v1/structures/facets/', {**query, 'bins': bins})
+            self.assertEqual(response.status_code, 200, f'FacetsError: Facets of {query} failed!')
+            data = response.json()
+            queryset = StructureFilter(query, queryset=StructureCode.objects.filter(user__isnull=True)).qs.distinct()
+            self.assertEqual(data['count'], queryset.count(), f'FacetsError: Wrong number of structures of {query}!')
+            element_counts = {item['value']: item['count'] for item in data['facets']['elements']}
+            for element in get_elements_list():
+                self.assertEqual(
+                    element_counts.get(element, 0),
+                    general_elements_filter(queryset, element).count(),
+                    f'FacetsError: Wrong number of structures of {query} with {element}!'
+                )
+            for name, (field, choices) in FACETS.items():
+                facet_counts = {item['value']: item['count'] for item in data['facets'][name]}
+                values = queryset.exclude(**{f'{field}__isnull': True}).values_list(field, flat=True).distinct()
+                self.assertSetEqual(set(facet_counts), set(values), f'FacetsError: Wrong {name} values of {query}!')
+                for value, count in facet_counts.items():
+                    self.assertEqual(
+                        count,
+                        queryset.filter(**{field: value}).count(),
+                        f'FacetsError: Wrong number of structures of {query} with {name} {value}!'
+                    )
+            for name, field in HISTOGRAMS.items():
+                histogram = data['histograms'][name]
+                values = list(queryset.exclude(**{f'{field}__isnull': True}).values_list(field, flat=True))
+                self.assertEqual(
+                    histogram['missing'],
+                    queryset.count() - len(values),
+                    f'FacetsError: Wrong number of structures of {query} without {name}!'
+                )
+                self.assertEqual(len(histogram['bins']), bins if values else 0, f'FacetsError: Wrong {name} bins!')
+                for number, histogram_bin in enumerate(histogram['bins']):
+                    is_last = number == bins - 1
+                    self.assertEqual(
+                        histogram_bin['count'],
+                        len([
+                            value for value in values
+                            if histogram_bin['start'] <= value < histogram_bin['end']
+                            or is_last and value == histogram_bin['end']
+                        ]),
+                        f'FacetsError: Wrong number of structures of {query} in the {name} bin {number}!'
+                    )
+
+    def test_query_counts(self):
+        # maximum number of queries per endpoint (see action_querysets of the viewsets)
+        structure = StructureCode.objects.filter(user__isnull=True, coordinates__isnull=False).first()
+        spacegroup = add_structure_details(structure)
+        qc_structure = add_qc_structure(structure.coordinates, spacegroup)
+        refcodes = list(StructureCode.objects.filter(user__isnull=True).values_list('refcode', flat=True)[:5])
+        endpoints = [
+            ('/api/v1/structures/', None, 2),
+            (f'/api/v1/structures/{structure.id}/', None, 4),
+            (f'/api/v1/structures/{structure.id}/download/', None, 3),
+            (f'/api/v1/structures/{structure.id}/export/2d/', None, 2),
+            ('/api/v1/structures/refcodes/', {'refcodes': refcodes + ['NOT-FOUND']}, 1),
+            ('/api/v1/structures/refcodes/', {'refcodes': [refcode[:3] for refcode in refcodes], 'exact': False}, 1),
+            ('/api/v1/qc_structures/', None, 2),
+            (f'/api/v1/qc_structures/{qc_structure.id}/', None, 3),
+            (f'/api/v1/qc_structures/{qc_structure.id}/export/cif/', None, 2),
+            (f'/api/v1/qc_structures/{qc_structure.id}/export/2d/', None, 1),
+            ('/api/v1/qc_structures/refcodes/', {'refcodes': [qc_structure.refcode, 'NOT-FOUND']}, 1),
+        ]
+        client = APIClient()
+        for url, data, max_queries in endpoints:
+            with CaptureQueriesContext(connection) as context:
+                if data is None:
+                    response = client.get(url)
+                else:
+                    response = client.post(url, data, format='json')
+            self.assertEqual(response.status_code, 200, f'QueryCountError: {url} failed!')
+            self.assertLessEqual(
+                len(context.captured_queries),
+                max_queries,
+                f'QueryCountError: {url} made {len(context.captured_queries)} queries (max {max_queries})!'
+            )
@@ -29,7 +29,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (StructureViewSet, QCStructureViewSet, structure_search_view,
-                    qc_structure_search_view, gen_img2d_view)
+                    qc_structure_search_view, structure_batch_search_view,
+                    qc_structure_batch_search_view, search_status_view, gen_img2d_view,
+                    structure_similarity_view, qc_structure_similarity_view)
+from .search_jobs import SearchJobViewSet, QCSearchJobViewSet
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -49,6 +52,8 @@ schema_view = get_schema_view(
 )
 
 router_v1 = DefaultRouter()
+router_v1.register(r'structures/search/jobs', SearchJobViewSet, 'search_job')
+router_v1.register(r'qc_structures/search/jobs', QCSearchJobViewSet, 'qc_search_job')
 router_v1.register(r'structures', StructureViewSet, 'structure')
 router_v1.register(r'qc_structures', QCStructureViewSet, 'qc_structure')
 
@@ -56,6 +61,11 @@ router_v1.register(r'qc_structures', QCStructureViewSet, 'qc_structure')
 urlpatterns = [
     path('v1/structures/search/', structure_search_view),
     path('v1/qc_structures/search/', qc_structure_search_view),
+    path('v1/structures/search/batch/', structure_batch_search_view),
+    path('v1/qc_structures/search/batch/', qc_structure_batch_search_view),
+    path('v1/structures/search/similarity/', structure_similarity_view),
+    path('v1/qc_structures/search/similarity/', qc_structure_similarity_view),
+    path('v1/search/status/', search_status_view),
     path('v1/generate/2d/', gen_img2d_view),
     url(r'^v1/redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path('v1/', include(router_v1.urls)),
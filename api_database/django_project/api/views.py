@@ -36,26 +36,37 @@ from qc_structure.vasp import save_coordinates as vasp_save_coordinates
 from qc_structure.export.cif import qc_get_cif_content
 from .serializers import (RefcodeShortSerializer, RefcodeFullSerializer, CifUploadSerializer,
                           SearchSerializer, QCRefcodeShortSerializer, QCRefcodeFullSerializer,
-                          VaspUploadSerializer, Gen2DImgSerializer)
+                          VaspUploadSerializer, Gen2DImgSerializer, SearchBatchSerializer,
+                          SimilaritySerializer)
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import StructureFilter, QCStructureFilter
 from .substructure_filtration import set_filter
+from .graph_store import get_graph_store, GraphChunks
+from .result_cache import search_result_cache, bump_dataset_version, get_result_cache_scope
+from .query_planner import get_start_atom
+from .search_scheduler import search_scheduler, SearchQueueFull
+from .similarity import get_similarity_index
+from .search_timings import SearchTimings, timed
+from .facets import FACETS, HISTOGRAMS, QC_FACETS, QC_HISTOGRAMS
+from modules.graph_pack.fingerprint import get_template_fingerprints, get_similarity_fingerprint
+from modules.graph_pack.graph_hash import get_template_component_hashes
+from django_project.loggers import search_logger
 from .viewsets import StructureModelViewSet
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 import networkx as nx
 from structure.management.commands.cif_db_update_modules._element_numbers import element_numbers
-from multiprocessing import cpu_count
 from django.conf import settings
-from itertools import chain, zip_longest
 from structure.management.commands.cif_db_update import main as add_cif_data
 import os
 from asgiref.sync import sync_to_async
 from .pagination import LimitPagination
+from .id_tables import filter_by_ids
 from rest_framework.views import APIView
 from rest_framework.renderers import JSONRenderer
 from django.core.cache import cache
@@ -73,15 +84,17 @@ from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from django.core.files.uploadedfile import TemporaryUploadedFile
 from pymatgen.core import Molecule
 import itertools
+import time
 
-NUM_OF_PROC = int(cpu_count() / 2)
 MAX_STRS_SIZE = 30000
+HITS_TABLE = 'search_hits'  # the temporary table with ids of large search results (see get_queryset_from_ids)
 CHUNK_SIZE = 10000  # the number of structures for search in
 R_H_DIST = 0.95  # distance of R-H bonds in angstroms
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
 
 
-@sync_to_async(thread_sensitive=False)
-def get_queryset(request, qc):
+def get_user_queryset(request, qc):
+    '''Structures available to the user: common ones and uploaded by the user.'''
     queryset = StructureCode.objects.all()
     if qc:
         queryset = QCStructureCode.objects.all()
@@ -92,6 +105,9 @@ def get_queryset(request, qc):
     return queryset.filter(user__isnull=True)
 
 
+get_queryset = sync_to_async(get_user_queryset, thread_sensitive=False)
+
+
 async def qc_structure_search_view(request):
     view = APIView()
     request = view.initialize_request(request)
@@ -102,14 +118,17 @@ async def qc_structure_search_view(request):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
-    response = await structure_search(
-        request,
-        serializer,
-        queryset,
-        out_serializer_model=QCRefcodeShortSerializer,
-        structure_code_model=QCStructureCode,
-        qc=True
-    )
+    try:
+        response = await structure_search(
+            request,
+            serializer,
+            queryset,
+            out_serializer_model=QCRefcodeShortSerializer,
+            structure_code_model=QCStructureCode,
+            qc=True
+        )
+    except SearchQueueFull as error:
+        return get_queue_full_response(error)
     return response
 
 
@@ -128,37 +147,358 @@ async def structure_search_view(request):
         response.renderer_context = {}
         response.render()
         return response
-    response = await structure_search(request, serializer, queryset)
+    try:
+        response = await structure_search(request, serializer, queryset)
+    except SearchQueueFull as error:
+        return get_queue_full_response(error)
     return response
 
 
-def start_SearchMain(template_data, analyse_data_split, partial, iter_num, exact):
+def get_queue_full_response(error):
+    search_logger.warning(f'Search was rejected: {error}')
+    response = Response(
+        {'errors': 'Too many searches are running, try again later'},
+        status=status.HTTP_429_TOO_MANY_REQUESTS
+    )
+    response['Retry-After'] = str(error.retry_after)
+    return render_response(response)
+
+
+@api_view(['GET'])
+def search_status_view(request):
+    '''Search scheduler state: running and waiting searches, thread budget and queue wait time.'''
+    return Response(search_scheduler.get_status())
+
+
+def similarity_search(
+        request,
+        qc=False,
+        out_serializer_model=RefcodeShortSerializer,
+        structure_code_model=StructureCode
+):
+    '''
+    Return top_k structures most similar to the query (Tanimoto similarity of fingerprints) in descending order
+    of scores. The query is a structure of the database ("refcode") or the drawn graph ("nodes", "edges").
+    "stale" is set if structures were changed after the matrix was written, the matrix is updated
+    in the background then and changed structures are found after the update.
+    '''
+    serializer = SimilaritySerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    queryset = get_user_queryset(request, qc)
+    refcode = serializer.data.get('refcode')
+    if refcode:
+        fingerprint = queryset.filter(refcode=refcode).values_list(
+            f'{"qc_" if qc else ""}coordinates__fingerprint', flat=True
+        ).first()
+        if not fingerprint:
+            return Response(
+                {'errors': f'Structure {refcode} is not found or has no fingerprint'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        fingerprint = bytes(fingerprint)
+    else:
+        graph = nx.Graph()
+        graph.add_nodes_from(serializer.data.get('nodes'))
+        graph.add_edges_from(serializer.data.get('edges') or [])
+        fingerprint = get_similarity_fingerprint(get_template_graph(graph))
+    start = time.time()
+    similarity_index = get_similarity_index(qc)
+    stale = similarity_index.rebuild_if_stale()
+    found = similarity_index.search(
+        fingerprint,
+        request.user.id if request.user.is_authenticated else 0,
+        serializer.data.get('top_k'),
+        serializer.data.get('threshold')
+    )
+    structures = structure_code_model.objects.in_bulk([structure_id for structure_id, score in found])
+    results = []
+    for structure_id, score in found:
+        # structures deleted after the matrix rebuild are skipped
+        if structure_id in structures:
+            results.append({**out_serializer_model(structures[structure_id]).data, 'score': score})
+    search_logger.info(
+        f'Similarity search ({"qc" if qc else "exp"}): {len(results)} structures, '
+        f'{similarity_index.get_size()} fingerprints scored in {time.time() - start:.3f} s'
+    )
+    return Response({
+        'count': len(results),
+        'matrix_size': similarity_index.get_size(),
+        'stale': stale,
+        'results': results
+    })
+
+
+@api_view(['GET', 'POST'])
+def structure_similarity_view(request):
+    return similarity_search(request)
+
+
+@api_view(['GET', 'POST'])
+def qc_structure_similarity_view(request):
+    return similarity_search(
+        request, True, out_serializer_model=QCRefcodeShortSerializer, structure_code_model=QCStructureCode
+    )
+
+
+def render_response(response):
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = "application/json"
+    response.renderer_context = {}
+    response.render()
+    return response
+
+
+async def structure_batch_search_view(request):
+    view = APIView()
+    request = view.initialize_request(request)
+    serializer = SearchBatchSerializer(data=request.data)
+    queryset = await get_queryset(request, False)
+    if not serializer.is_valid():
+        return render_response(Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST))
+    try:
+        return await structure_batch_search(request, serializer, queryset)
+    except SearchQueueFull as error:
+        return get_queue_full_response(error)
+
+
+async def qc_structure_batch_search_view(request):
+    view = APIView()
+    request = view.initialize_request(request)
+    serializer = SearchBatchSerializer(data=request.data)
+    queryset = await get_queryset(request, True)
+    if not serializer.is_valid():
+        return render_response(Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST))
+    try:
+        return await structure_batch_search(
+            request,
+            serializer,
+            queryset,
+            out_serializer_model=QCRefcodeShortSerializer,
+            structure_code_model=QCStructureCode,
+            qc=True
+        )
+    except SearchQueueFull as error:
+        return get_queue_full_response(error)
+
+
+@sync_to_async(thread_sensitive=False)
+def structure_batch_search(
+        request,
+        serializer,
+        queryset,
+        qc=False,
+        out_serializer_model=RefcodeShortSerializer,
+        structure_code_model=StructureCode
+):
+    '''
+    Search several templates in one pass over the graphs. Results are returned in the order of templates,
+    "limit" parameter limits the number of structures (sorted by refcode) returned for every template.
+    '''
+    limit = request.query_params.get('limit')
+    if limit is not None and (not limit.isdigit() or int(limit) == 0):
+        return render_response(Response(
+            {'errors': 'Unsupported value of "limit" parameter. Use positive integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        ))
+    exact = serializer.data.get('search_type') == 'exact'
+    templates = []
+    for template in serializer.data.get('templates'):
+        graph = nx.Graph()
+        graph.add_nodes_from(template.get('nodes'))
+        graph.add_edges_from(template.get('edges'))
+        templates.append(get_template_graph(graph))
+    structure_ids = queryset.filter(
+        **{f'{"qc_" if qc else ""}coordinates__isnull': False}
+    ).order_by('id').values_list('id', flat=True)
+    # structures which can not contain any of the templates are skipped
+    prescreen = dict()
+    fingerprints = [fingerprint for template in templates for fingerprint in get_template_fingerprints(template)]
+    analyse_data = get_graph_store(qc).get_graphs(structure_ids, fingerprints, prescreen)
+    # every template is searched from its rarest atom in the database
+    start_atoms = [get_start_atom(template, qc=qc) for template in templates]
+    with search_scheduler.slot():
+        outputs = cpplib.SearchBatchPacked(
+            templates, analyse_data, search_scheduler.get_threads(), exact, start_atoms
+        )
+    results = []
+    for out_refcode_ids in outputs:
+        structures = get_queryset_from_ids(out_refcode_ids, structure_code_model)
+        if limit is not None:
+            structures = structures[:int(limit)]
+        results.append({
+            'count': len(out_refcode_ids),
+            'results': out_serializer_model(structures, many=True).data
+        })
+    search_logger.info(
+        f'Batch search of {len(templates)} templates ({"qc" if qc else "exp"}): '
+        f'{prescreen["passed"]} of {prescreen["candidates"]} structures passed the prescreen'
+    )
+    return render_response(Response({'prescreen': prescreen, 'results': results}))
+
+
+def start_SearchMain(template_data, analyse_data_split, partial, iter_num, exact, max_hits=0, timings=None,
+                     start_atom=0):
+    '''
+    With max_hits the search stops after max_hits structures found in the order of chunks (structure ids).
+    start_atom is the template atom to start the search from (see query_planner.get_start_atom).
+    Time of getting graphs and of the search is added to timings ("graphs" and "search" phases).
+    '''
     out_refcode_ids = []
-    for analyse_data in analyse_data_split:
+    for index in range(len(analyse_data_split)):
         # if partial return is needed
         if partial and iter_num < len(analyse_data_split):
-            analyse_data = analyse_data_split[iter_num]
-        output = cpplib.SearchMain(template_data, list(analyse_data), NUM_OF_PROC, exact)
-        out_refcode_ids.extend(output)
+            index = iter_num
+        with timed(timings, 'graphs'):
+            analyse_data = [data for data in analyse_data_split[index] if data]
+        # structures of a planned chunk can be deleted before it is searched
+        if analyse_data:
+            with timed(timings, 'search'):
+                output = cpplib.SearchMainPacked(
+                    template_data, analyse_data, search_scheduler.get_threads(), exact,
+                    max_hits - len(out_refcode_ids) if max_hits else 0, start_atom
+                )
+            out_refcode_ids.extend(output)
         # break if partial
         if partial:
             return out_refcode_ids
+        if max_hits and len(out_refcode_ids) >= max_hits:
+            break
     return out_refcode_ids
 
 
-def get_queryset_from_ids(out_refcode_ids, structure_code_model):
-    refcodes = structure_code_model.objects.none()
-    if len(out_refcode_ids) > MAX_STRS_SIZE:
-        for i in range(0, len(out_refcode_ids), MAX_STRS_SIZE):
-            qset = structure_code_model.objects.filter(id__in=out_refcode_ids[i:i + MAX_STRS_SIZE])
-            refcodes = sorted(
-                chain(refcodes, qset),
-                key=lambda structure: structure.refcode, reverse=False)
+def get_stream_format(request, serializer):
+    '''Return "ndjson" or "sse" if the streamed search is requested by parameter or Accept header.'''
+    stream_format = serializer.data.get('stream')
+    if stream_format:
+        return stream_format
+    accept = request.META.get('HTTP_ACCEPT', '')
+    for stream_format, content_type in STREAM_FORMATS.items():
+        if content_type in accept:
+            return stream_format
+    return ''
+
+
+def format_stream_record(record_type, data, stream_format):
+    data = JSONRenderer().render(data)
+    if stream_format == 'sse':
+        return b'event: ' + record_type.encode() + b'\ndata: ' + data + b'\n\n'
+    return b'{"type":"' + record_type.encode() + b'",' + data[1:] + b'\n'
+
+
+def search_chunk(template_data, analyse_data, exact, structure_code_model, out_serializer_model, max_hits=0,
+                 start_atom=0):
+    analyse_data = [data for data in analyse_data if data]
+    if not analyse_data:
+        return []
+    with search_scheduler.slot(reject=False):
+        out_refcode_ids = cpplib.SearchMainPacked(
+            template_data, analyse_data, search_scheduler.get_threads(), exact, max_hits, start_atom
+        )
+    refcodes = structure_code_model.objects.filter(id__in=out_refcode_ids).order_by('refcode')
+    return out_serializer_model(refcodes, many=True).data
+
+
+def serialize_ids(out_refcode_ids, structure_code_model, out_serializer_model):
+    return out_serializer_model(get_queryset_from_ids(out_refcode_ids, structure_code_model), many=True).data
+
+
+def stream_search(template_data, analyse_data_split, exact, stream_format, prescreen, structure_code_model,
+                  out_serializer_model, save_result=None, max_hits=0, start_atom=0):
+    '''
+    Yield found structures chunk by chunk ("hits" records, sorted by refcode inside each chunk)
+    and the final "summary" record. Chunks are searched while the response is iterated, so records are sent
+    as they are found only with WSGI (see get_stream_response).
+    With max_hits the stream ends after max_hits structures.
+    If the whole search is streamed, found ids are passed to save_result.
+    '''
+    start = time.time()
+    out_refcode_ids = []
+    count = 0
+    max_iter_num = len(analyse_data_split) - 1
+    for iter_num, analyse_data in enumerate(analyse_data_split):
+        if max_hits and count >= max_hits:
+            break
+        results = search_chunk(
+            template_data, analyse_data, exact, structure_code_model, out_serializer_model,
+            max_hits - count if max_hits else 0, start_atom
+        )
+        count += len(results)
+        out_refcode_ids.extend(result['id'] for result in results)
+        yield format_stream_record('hits', {
+            'iter_num': iter_num,
+            'max_iter_num': max_iter_num,
+            'results': results
+        }, stream_format)
+    yield format_stream_record('summary', {
+        'count': count,
+        'max_iter_num': max_iter_num,
+        'max_hits_reached': bool(max_hits) and count >= max_hits,
+        'prescreen': prescreen,
+        'time': round(time.time() - start, 3)
+    }, stream_format)
+    if save_result is not None:
+        save_result(out_refcode_ids)
+
+
+def stream_cached_result(out_refcode_ids, stream_format, structure_code_model, out_serializer_model):
+    '''Yield cached search result as one "hits" record and the "summary" record.'''
+    start = time.time()
+    results = serialize_ids(out_refcode_ids, structure_code_model, out_serializer_model)
+    yield format_stream_record('hits', {'iter_num': 0, 'max_iter_num': 0, 'results': results}, stream_format)
+    yield format_stream_record('summary', {
+        'count': len(results),
+        'max_iter_num': 0,
+        'cached': True,
+        'time': round(time.time() - start, 3)
+    }, stream_format)
+
+
+def get_stream_response(request, streaming_content, stream_format):
+    '''
+    Streaming is WSGI-only: the ASGI handler of Django 3.2 iterates streaming responses synchronously
+    in the event loop, so with ASGI all records are collected in the search thread and sent at once.
+    '''
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        response = HttpResponse(b''.join(streaming_content), content_type=STREAM_FORMATS[stream_format])
     else:
-        refcodes = structure_code_model.objects.filter(id__in=out_refcode_ids).order_by('refcode')
+        response = StreamingHttpResponse(streaming_content, content_type=STREAM_FORMATS[stream_format])
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def get_sorted_ids(out_refcode_ids, structure_code_model):
+    '''Return (refcode, id) pairs of the found structures sorted by refcode.'''
+    refcodes = []
+    for i in range(0, len(out_refcode_ids), MAX_STRS_SIZE):
+        refcodes.extend(
+            structure_code_model.objects.filter(id__in=out_refcode_ids[i:i + MAX_STRS_SIZE]).values_list('refcode', 'id')
+        )
+    refcodes.sort()
     return refcodes
 
 
+def get_structures_in_order(structure_ids, structure_code_model):
+    '''Return structures with the given ids in the same order.'''
+    structures = []
+    for i in range(0, len(structure_ids), MAX_STRS_SIZE):
+        chunk = structure_ids[i:i + MAX_STRS_SIZE]
+        chunk_structures = structure_code_model.objects.in_bulk(chunk)
+        structures.extend(chunk_structures[structure_id] for structure_id in chunk if structure_id in chunk_structures)
+    return structures
+
+
+def get_queryset_from_ids(out_refcode_ids, structure_code_model):
+    '''
+    Return the queryset of the found structures sorted by refcode, so they are sorted and paginated
+    by the database (ids of large results are written to the temporary table HITS_TABLE, see filter_by_ids).
+    '''
+    return filter_by_ids(
+        structure_code_model.objects.order_by('refcode'), out_refcode_ids, HITS_TABLE, MAX_STRS_SIZE
+    )
+
+
 @sync_to_async(thread_sensitive=False)
 def structure_search(
         request,
@@ -170,6 +510,7 @@ def structure_search(
 ):
     chunk_size = serializer.data.get('chunk_size')
     iter_num = serializer.data.get('iter_num')
+    max_hits = serializer.data.get('max_hits')
     search_type = serializer.data.get('search_type')
     partial = True
     if not chunk_size:
@@ -189,44 +530,142 @@ def structure_search(
             {'errors': 'Unsupported value of "search_type" parameter. Use exact or substructure keywords'},
             status=status.HTTP_400_BAD_REQUEST
         )
-    analyse_data_split = list()
+    analyse_data_split = None
+    prescreen = dict()
+    stream_format = get_stream_format(request, serializer)
+    if stream_format:
+        partial = False
+    timings = SearchTimings(scope='qc' if qc else 'exp', search_type=search_type)
+    show_timings = serializer.data.get('timings')
+    # shared result cache (the whole result is returned as the single iteration in the partial mode)
+    with timings.phase('cache'):
+        cache_scope = get_result_cache_scope(request, queryset, qc)
+        cache_version = search_result_cache.get_version()
+        out_refcode_ids = None
+        if not partial or iter_num == 0:
+            out_refcode_ids = search_result_cache.get(template_data, search_type, cache_scope)
+        # stored results are complete, a result with more than max_hits structures is not the result
+        # of the stopped search, so it is searched (as it is saved, see save_result)
+        if out_refcode_ids is not None and max_hits and len(out_refcode_ids) > max_hits:
+            out_refcode_ids = None
+    if out_refcode_ids is not None:
+        search_logger.info(f'Search result cache hit ({search_type}, {cache_scope}): {len(out_refcode_ids)} structures')
+        if stream_format:
+            response = get_stream_response(
+                request,
+                stream_cached_result(out_refcode_ids, stream_format, structure_code_model, out_serializer_model),
+                stream_format
+            )
+            response['X-Search-Cache'] = 'hit'
+            return response
+        timings.count(cache='hit')
+        return get_search_response(
+            request, out_refcode_ids, structure_code_model, out_serializer_model,
+            max_iter_num=0 if partial else None, cache_status='hit', max_hits=max_hits,
+            timings=timings, show_timings=show_timings
+        )
+
+    def save_result(found_ids):
+        # the result of the stopped search is incomplete
+        if not max_hits or len(found_ids) < max_hits:
+            search_result_cache.set(template_data, search_type, cache_scope, found_ids, cache_version)
+
+    # reject the search before the prescreen if the search queue is full
+    search_scheduler.check()
+
     if partial and request.user.is_authenticated:
         data = cache.get(f'{request.user}-cache')
         if (
                 data and
                 data['template_data'] == template_data and
                 data['search_type'] == search_type and
-                data['chunk_size'] == chunk_size
+                data['chunk_size'] == chunk_size and
+                data['qc'] == qc
         ):
-            analyse_data_split = data['analyse_data_split']
-    if not analyse_data_split:
-        if not qc:
-            analyse_data = get_search_queryset_with_filtration(template_data, queryset)
-        else:
-            analyse_data = get_search_queryset_with_filtration(template_data, queryset, 'qc_')
-        # split search for chunk_size structures parts and then merge the result
-        analyse_data_split = list(zip_longest(*[iter(analyse_data)] * chunk_size, fillvalue=''))
+            analyse_data_split = GraphChunks(data['structure_ids'], chunk_size, qc)
+    if analyse_data_split is None:
+        structure_ids = get_search_ids_with_filtration(
+            template_data,
+            queryset,
+            'qc_' if qc else '',
+            enable_substr_filtr=False,
+            enable_fp_filtr=True,
+            enable_hash_filtr=exact,
+            stats=prescreen,
+            timings=timings
+        )
+        timings.count(candidates=prescreen['candidates'], passed=prescreen['passed'])
+        prescreen_name = 'Hash index' if prescreen['index'] else 'Fingerprint'
+        search_logger.info(
+            f'{prescreen_name} prescreen ({search_type}, {"qc" if qc else "exp"}): '
+            f'{prescreen["passed"]} of {prescreen["candidates"]} structures passed, '
+            f'selectivity {prescreen["selectivity"]}'
+        )
+        # split search for chunk_size structures parts and then merge the result,
+        # graphs of a chunk are taken from the graph store when it is searched
+        analyse_data_split = GraphChunks(structure_ids, chunk_size, qc)
+        if stream_format:
+            response = get_stream_response(
+                request,
+                stream_search(
+                    template_data, analyse_data_split, exact, stream_format, prescreen,
+                    structure_code_model, out_serializer_model, save_result, max_hits,
+                    get_start_atom(template_data, qc=qc)
+                ),
+                stream_format
+            )
+            response['X-Search-Cache'] = 'miss'
+            return response
         if partial and request.user.is_authenticated:
+            # only ids of candidate structures are cached
             cache.set(f'{request.user}-cache', {
-                'analyse_data_split': analyse_data_split,
+                'structure_ids': analyse_data_split.structure_ids,
                 'search_type': search_type,
                 'template_data': template_data,
-                'chunk_size': chunk_size
+                'chunk_size': chunk_size,
+                'qc': qc
             })
     # run search
-    out_refcode_ids = start_SearchMain(template_data, analyse_data_split, partial, iter_num, exact)
-    # get queryset on search result
-    refcodes = get_queryset_from_ids(out_refcode_ids, structure_code_model)
+    with search_scheduler.slot():
+        out_refcode_ids = start_SearchMain(
+            template_data, analyse_data_split, partial, iter_num, exact, max_hits, timings,
+            get_start_atom(template_data, qc=qc)
+        )
+    if not partial:
+        save_result(out_refcode_ids)
+    timings.count(cache='miss')
+    return get_search_response(
+        request, out_refcode_ids, structure_code_model, out_serializer_model,
+        max_iter_num=len(analyse_data_split) - 1 if partial else None, prescreen=prescreen, cache_status='miss',
+        max_hits=max_hits, timings=timings, show_timings=show_timings
+    )
+
+
+def get_search_response(request, out_refcode_ids, structure_code_model, out_serializer_model, max_iter_num=None,
+                        prescreen=None, cache_status='', max_hits=0, timings=None, show_timings=False):
+    # found structures are sorted by refcode in the database, only structures of the page are loaded
+    with timed(timings, 'sort'):
+        queryset = get_queryset_from_ids(out_refcode_ids, structure_code_model)
     # pagination
-    paginator = LimitPagination()
-    pages = paginator.paginate_queryset(refcodes, request)
-    out_serializer = out_serializer_model(pages, many=True)
-    response = paginator.get_paginated_response(out_serializer.data)
+    with timed(timings, 'serialize'):
+        paginator = LimitPagination()
+        page = paginator.paginate_queryset(queryset, request)
+        out_serializer = out_serializer_model(page, many=True)
+        response = paginator.get_paginated_response(out_serializer.data)
     response.accepted_renderer = JSONRenderer()
     response.accepted_media_type = "application/json"
-    if partial:
-        response.data.update({'max_iter_num': len(analyse_data_split) - 1})
+    if prescreen:
+        response.data.update({'prescreen': prescreen})
+    if max_hits:
+        response.data.update({'max_hits_reached': len(out_refcode_ids) >= max_hits})
+    if max_iter_num is not None:
+        response.data.update({'max_iter_num': max_iter_num})
         response.data.move_to_end('max_iter_num', last=False)
+    if cache_status:
+        response['X-Search-Cache'] = cache_status
+    if timings is not None:
+        timings.count(hits=len(out_refcode_ids))
+        timings.add_to_response(response, body=show_timings)
     response.renderer_context = {}
     response.render()
     return response
@@ -367,13 +806,43 @@ def gen_img2d_view(request):
 class StructureViewSet(StructureModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = StructureFilter
+    graph_store = get_graph_store()
+    short_serializer_class = RefcodeShortSerializer
+    facet_fields = FACETS
+    histogram_fields = HISTOGRAMS
+
+    action_querysets = {
+        'list': {'only': ('id', 'refcode')},
+        'refcodes': {'only': ('id', 'refcode')},
+        'retrieve': {
+            'select_related': (
+                'cell__spacegroup', 'name', 'formula', 'experimental_info', 'refinement_info', 'coordinates',
+                'crystal_and_structure_info', 'publication__publication__journal'
+            ),
+            'prefetch_related': ('authors', 'reduced_cells', 'inchi'),
+            'defer': ('coordinates__packed_graph', 'coordinates__fingerprint'),
+        },
+        'download': {
+            'select_related': (
+                'cell__spacegroup', 'name', 'formula', 'experimental_info', 'refinement_info', 'coordinates',
+                'crystal_and_structure_info', 'publication__publication__journal', 'characteristics'
+            ),
+            'prefetch_related': ('authors', 'reduced_cells'),
+            'defer': ('coordinates__packed_graph', 'coordinates__fingerprint'),
+        },
+        'export_2d': {
+            'select_related': ('coordinates', ),
+            'prefetch_related': ('inchi', ),
+            'defer': ('coordinates__packed_graph', 'coordinates__fingerprint'),
+        },
+    }
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
             queryset = (StructureCode.objects.filter(user=self.request.user) |
                         StructureCode.objects.filter(user__isnull=True))
-            return queryset
-        return StructureCode.objects.filter(user__isnull=True)
+            return self.optimize_queryset(queryset)
+        return self.optimize_queryset(StructureCode.objects.filter(user__isnull=True))
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -385,7 +854,7 @@ class StructureViewSet(StructureModelViewSet):
         methods=['GET']
     )
     def download(self, request, pk):
-        structure = get_object_or_404(StructureCode, pk=pk)
+        structure = get_object_or_404(self.optimize_queryset(StructureCode.objects.all()), pk=pk)
         filename = f'{structure.refcode}.cif'
         content = create_cif_text(structure)
         response = HttpResponse(content, content_type='text/plain')
@@ -398,7 +867,7 @@ class StructureViewSet(StructureModelViewSet):
         url_path='export/2d'
     )
     def export_2d(self, request, pk):
-        structure = get_object_or_404(StructureCode, pk=pk)
+        structure = get_object_or_404(self.optimize_queryset(StructureCode.objects.all()), pk=pk)
         return get_img2d(structure, request)
 
     @action(
@@ -421,7 +890,7 @@ class StructureViewSet(StructureModelViewSet):
         cif_file_obj = CifFile.objects.create(refcode=refcode_obj, file=file, old_file_name=file.name)
         cif_file_path = os.path.join(settings.BASE_DIR, 'media', str(cif_file_obj.file))
         try:
-            add_cif_data(
+            version = add_cif_data(
                 args=(cif_file_path,),
                 all_data=True,
                 user_refcodes={cif_file_path: refcode, }
@@ -433,6 +902,7 @@ class StructureViewSet(StructureModelViewSet):
                 {'errors': f'Structure information was not added! {error_message}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        self.graph_store.update([refcode_obj.id], version)
         out_serializer = RefcodeFullSerializer(refcode_obj)
         return Response(
             out_serializer.data,
@@ -443,13 +913,38 @@ class StructureViewSet(StructureModelViewSet):
 class QCStructureViewSet(StructureModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = QCStructureFilter
+    graph_store = get_graph_store(qc=True)
+    short_serializer_class = QCRefcodeShortSerializer
+    qc = True
+    facet_fields = QC_FACETS
+    histogram_fields = QC_HISTOGRAMS
+
+    action_querysets = {
+        'list': {'only': ('id', 'refcode')},
+        'refcodes': {'only': ('id', 'refcode')},
+        'retrieve': {
+            'select_related': (
+                'qc_cell__spacegroup', 'qc_name', 'qc_formula', 'qc_coordinates', 'qc_properties', 'qc_prog'
+            ),
+            'prefetch_related': ('qc_reduced_cells', 'qc_inchi'),
+            'defer': ('qc_coordinates__fingerprint', ),
+        },
+        'export_cif': {
+            'select_related': (
+                'qc_cell__spacegroup', 'qc_name', 'qc_formula', 'qc_coordinates', 'qc_properties'
+            ),
+            'prefetch_related': ('qc_reduced_cells', ),
+            'defer': ('qc_coordinates__packed_graph', 'qc_coordinates__fingerprint'),
+        },
+        'download': {'select_related': ('vasp_file', )},
+    }
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
             queryset = (QCStructureCode.objects.filter(user=self.request.user) |
                         QCStructureCode.objects.filter(user__isnull=True))
-            return queryset
-        return QCStructureCode.objects.filter(user__isnull=True)
+            return self.optimize_queryset(queryset)
+        return self.optimize_queryset(QCStructureCode.objects.filter(user__isnull=True))
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -462,7 +957,7 @@ class QCStructureViewSet(StructureModelViewSet):
         url_path='export/cif'
     )
     def export_cif(self, request, pk):
-        qc_structure = get_object_or_404(QCStructureCode, pk=pk)
+        qc_structure = get_object_or_404(self.optimize_queryset(QCStructureCode.objects.all()), pk=pk)
         filename = f'{qc_structure.refcode}.cif'
         content = qc_get_cif_content(qc_structure)
         response = HttpResponse(content, content_type='text/plain')
@@ -474,7 +969,7 @@ class QCStructureViewSet(StructureModelViewSet):
         methods=['GET'],
     )
     def download(self, request, pk):
-        qc_structure = get_object_or_404(QCStructureCode, pk=pk)
+        qc_structure = get_object_or_404(self.optimize_queryset(QCStructureCode.objects.all()), pk=pk)
         filename = f'{qc_structure.refcode}.txt'
         vasp_file = open(os.path.join(settings.BASE_DIR, 'media', str(qc_structure.vasp_file.file)), 'r')
         content = vasp_file.readlines()
@@ -488,7 +983,7 @@ class QCStructureViewSet(StructureModelViewSet):
         url_path='export/2d'
     )
     def export_2d(self, request, pk):
-        structure = get_object_or_404(QCStructureCode, pk=pk)
+        structure = get_object_or_404(self.optimize_queryset(QCStructureCode.objects.all()), pk=pk)
         return get_img2d(structure, request)
 
     @action(
@@ -517,6 +1012,8 @@ class QCStructureViewSet(StructureModelViewSet):
                 {'errors': f'Structure information was not added! {error_message}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        version = bump_dataset_version([refcode_obj.id], qc=True)
+        self.graph_store.update([refcode_obj.id], version)
         out_serializer = QCRefcodeFullSerializer(refcode_obj)
         return Response(
             out_serializer.data,
@@ -524,8 +1021,25 @@ class QCStructureViewSet(StructureModelViewSet):
         )
 
 
-def get_search_queryset_with_filtration(template, queryset, qc='', enable_substr_filtr=True, enable_elem_filtr=True):
-    graphs = queryset.filter(**{f'{qc}coordinates__graph__isnull': False})
+def get_search_ids_with_filtration(
+        template,
+        queryset,
+        qc='',
+        enable_substr_filtr=True,
+        enable_elem_filtr=True,
+        enable_fp_filtr=False,
+        enable_hash_filtr=False,
+        stats=None,
+        timings=None
+):
+    '''
+    Filter structures and return ids (array of uint32, in the order of ids) of structures with graphs.
+    With enable_fp_filtr structures are prescreened by fingerprints, "stats" gets the prescreen selectivity.
+    With enable_hash_filtr (exact search) structures are selected by the index of component hashes
+    if the template allows it, the search confirms the result on these few structures.
+    Time of the database query and of the prescreen is added to timings ("filter" and "prescreen" phases).
+    '''
+    graphs = queryset.filter(**{f'{qc}coordinates__isnull': False})
     filtrs = dict()
     if enable_substr_filtr or enable_elem_filtr:
         filters = set_filter(template, enable_substr_filtr, enable_elem_filtr)
@@ -534,8 +1048,32 @@ def get_search_queryset_with_filtration(template, queryset, qc='', enable_substr
             if is_true:
                 filtrs[f'{qc}{obj_name.lower()}__{filtr}'] = is_true
     structures = graphs.filter(**filtrs)
-    analyse_data = structures.values_list(f'{qc}coordinates__graph', flat=True)
-    return analyse_data
+    if stats is None:
+        stats = dict()
+    component_hashes = get_template_component_hashes(template) if enable_hash_filtr else None
+    stats['index'] = component_hashes is not None
+    if component_hashes is not None:
+        for component_hash in set(component_hashes):
+            structures = structures.filter(**{f'{qc}component_hashes__hash': component_hash})
+    with timed(timings, 'filter'):
+        structure_ids = list(structures.order_by('id').values_list('id', flat=True))
+    with timed(timings, 'prescreen'):
+        fingerprints = get_template_fingerprints(template) if enable_fp_filtr else None
+        structure_ids = get_graph_store(bool(qc)).get_ids(structure_ids, fingerprints, stats)
+    if stats['candidates']:
+        stats['selectivity'] = round(stats['passed'] / stats['candidates'], 4)
+    else:
+        stats['selectivity'] = 1.0
+    return structure_ids
+
+
+def get_search_queryset_with_filtration(template, queryset, qc='', **kwargs):
+    '''
+    Filter structures and return their graphs from the graph store (graph column is not read),
+    see get_search_ids_with_filtration for arguments.
+    '''
+    structure_ids = get_search_ids_with_filtration(template, queryset, qc, **kwargs)
+    return get_graph_store(bool(qc)).get_graphs(structure_ids)
 
 
 def get_template_graph(graph, cord_num=True):
@@ -560,11 +1098,10 @@ def get_template_graph(graph, cord_num=True):
             result.append(graph.nodes[atom_idx]['cord_max'])
         nodes_order.append(atom_idx)
     # add bonds
+    positions = {atom_idx: position + 1 for position, atom_idx in enumerate(nodes_order)}
     for atom1, atom2 in graph.edges:
-        order_id_1 = nodes_order.index(atom1) + 1
-        order_id_2 = nodes_order.index(atom2) + 1
-        result.append(order_id_1)
-        result.append(order_id_2)
+        result.append(positions[atom1])
+        result.append(positions[atom2])
     # if multitypes
     if multitype_atoms:
         for multitype_atom, atoms in multitype_atoms.items():
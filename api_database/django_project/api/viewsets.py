@@ -27,7 +27,15 @@
 # *****************************************************************************************
 
 from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from .facets import DEFAULT_BINS, MAX_BINS, get_facets_cache_key, get_cached_facets
+from .filters import filter_refcodes
+from .result_cache import bump_dataset_version, search_result_cache, get_result_cache_scope
+from .serializers import RefcodeLookupSerializer
+
+LOOKUP_CHUNK_SIZE = 500  # the number of refcodes resolved by one query
+MAX_LOOKUP_RESULTS = 20000  # the number of structures returned by one lookup request
 
 
 class StructureModelViewSet(
@@ -41,14 +49,112 @@ class StructureModelViewSet(
     '''
     A viewset that provides default `retrieve()`, `destroy()` and `list()` actions.
     '''
+    graph_store = None
+    short_serializer_class = None
+    qc = False
+    facet_fields = dict()
+    histogram_fields = dict()
+    # {action: {'select_related': (...), 'prefetch_related': (...), 'only': (...), 'defer': (...)}}
+    action_querysets = dict()
+
+    def optimize_queryset(self, queryset, action=None):
+        '''Apply related objects loading and deferred fields declared in action_querysets for the action.'''
+        options = self.action_querysets.get(action or self.action, dict())
+        if options.get('select_related'):
+            queryset = queryset.select_related(*options['select_related'])
+        if options.get('prefetch_related'):
+            queryset = queryset.prefetch_related(*options['prefetch_related'])
+        if options.get('only'):
+            queryset = queryset.only(*options['only'])
+        if options.get('defer'):
+            queryset = queryset.defer(*options['defer'])
+        return queryset
 
     def destroy(self, request, *args, **kwargs):
         ''' Delete structure on request. Delete only authenticated users' structure!'''
         if request.user.is_authenticated:
             instance = self.get_object()
             if instance.user == request.user:
+                structure_id = instance.id
                 instance.delete()
+                version = bump_dataset_version([structure_id], self.qc)
+                if self.graph_store is not None:
+                    self.graph_store.remove([structure_id], version)
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(status=status.HTTP_403_FORBIDDEN)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+
+    @action(
+        detail=False,
+        methods=['POST'],
+        serializer_class=RefcodeLookupSerializer,
+    )
+    def refcodes(self, request):
+        '''
+        Resolve a list of refcodes (or refcode prefixes) at once and report the codes which were not found.
+        At most MAX_LOOKUP_RESULTS structures are returned in the order of refcodes ("truncated" is set if
+        there are more), codes after the last returned refcode are not reported as missing then.
+        '''
+        serializer = RefcodeLookupSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        refcodes = list(dict.fromkeys(refcode.strip() for refcode in serializer.data['refcodes']))
+        refcodes = [refcode for refcode in refcodes if refcode]
+        exact = serializer.data['exact']
+        queryset = self.get_queryset()
+        structures = []
+        for i in range(0, len(refcodes), LOOKUP_CHUNK_SIZE):
+            chunk = filter_refcodes(queryset, refcodes[i:i + LOOKUP_CHUNK_SIZE], exact)
+            structures.extend(chunk.order_by('refcode_upper', 'id')[:MAX_LOOKUP_RESULTS + 1])
+            # the same structure can be found by refcodes of different chunks
+            structures = sorted(
+                {structure.id: structure for structure in structures}.values(),
+                key=lambda structure: (structure.refcode.upper(), structure.id)
+            )[:MAX_LOOKUP_RESULTS + 1]
+        truncated = len(structures) > MAX_LOOKUP_RESULTS
+        structures = structures[:MAX_LOOKUP_RESULTS]
+        found = {structure.refcode.upper() for structure in structures}
+        if not exact:
+            # every prefix of the found refcodes is found
+            found = {refcode[:length] for refcode in found for length in range(1, len(refcode) + 1)}
+        # all structures up to the last returned refcode are found
+        last_refcode = structures[-1].refcode.upper() if truncated else None
+        return Response({
+            'count': len(structures),
+            'truncated': truncated,
+            'results': self.short_serializer_class(structures, many=True).data,
+            'missing': [
+                refcode for refcode in refcodes
+                if refcode.upper() not in found and (last_refcode is None or refcode.upper() < last_refcode)
+            ],
+        })
+
+    @action(
+        detail=False,
+        methods=['GET'],
+    )
+    def facets(self, request):
+        '''
+        Facet counts (elements, crystal system, space group, centring) and histograms of numeric fields of
+        the structures found by the same filter parameters as the list. "bins" sets the number of histogram bins.
+        '''
+        try:
+            bins = int(request.query_params.get('bins', DEFAULT_BINS))
+        except ValueError:
+            bins = 0
+        if not 0 < bins <= MAX_BINS:
+            return Response(
+                {'errors': f'"bins" should be an integer from 1 to {MAX_BINS}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        user_queryset = self.get_queryset()
+        # the dataset version is read before the calculation, so facets of changed structures are not reused
+        key = get_facets_cache_key(
+            user_queryset.model,
+            request.query_params,
+            get_result_cache_scope(request, user_queryset, self.qc),
+            search_result_cache.get_version()
+        )
+        return Response(get_cached_facets(
+            key, self.filter_queryset(user_queryset), self.facet_fields, self.histogram_fields, bins
+        ))
@@ -33,3 +33,6 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings')
 
 application = get_asgi_application()
+
+from api.graph_store import preload_graph_stores  # noqa: E402
+preload_graph_stores()
@@ -27,6 +27,7 @@
 # *****************************************************************************************
 
 import logging
+from logging.handlers import RotatingFileHandler
 import sys
 import os
 from django.conf import settings
@@ -88,3 +89,19 @@ cif_db_update_main_handler = logging.FileHandler(os.path.join(settings.BASE_DIR,
 formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
 cif_db_update_main_handler.setFormatter(formatter)
 cif_db_update_main_logger.addHandler(cif_db_update_main_handler)
+
+search_logger = logging.getLogger('search_logger')
+search_logger.setLevel(level)
+search_handler = logging.FileHandler(os.path.join(settings.BASE_DIR, 'logs', 'search.log'), mode='a')
+formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+search_handler.setFormatter(formatter)
+search_logger.addHandler(search_handler)
+
+# search phase timings, one JSON record per line (see api/search_timings.py), written at any log level
+SEARCH_TIMINGS_LOG = os.path.join(settings.BASE_DIR, 'logs', 'search_timings.log')
+search_timings_logger = logging.getLogger('search_timings_logger')
+search_timings_logger.setLevel(logging.INFO)
+search_timings_logger.propagate = False
+search_timings_handler = RotatingFileHandler(SEARCH_TIMINGS_LOG, maxBytes=10 * 1024 * 1024, backupCount=1)
+search_timings_handler.setFormatter(logging.Formatter('%(message)s'))
+search_timings_logger.addHandler(search_timings_handler)
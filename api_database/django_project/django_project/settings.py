@@ -134,6 +134,27 @@ CACHES = {
     }
 }
 
+# Load structure graphs into the in-process graph store at worker startup (see api/graph_store.py)
+GRAPH_STORE_PRELOAD = True
+# Number of background search jobs running at once (see api/search_jobs.py)
+SEARCH_JOB_WORKERS = 2
+# Seconds between confirmations of the active search jobs by their process, jobs which were not confirmed
+# for several intervals (their process was stopped) are marked as failed
+SEARCH_JOB_HEARTBEAT_INTERVAL = 30
+# Search result cache shared by all workers (see api/result_cache.py), size of stored ids in bytes
+SEARCH_RESULT_CACHE_PATH = os.path.join(BASE_DIR, 'search_cache.sqlite3')
+SEARCH_RESULT_CACHE_SIZE = 64 * 1024 * 1024
+# Search threads of the worker, the number of searches running at once (each of them gets
+# SEARCH_THREADS // SEARCH_MAX_RUNNING threads) and waiting in the queue, requests over the queue get 429 response
+# (see api/search_scheduler.py)
+SEARCH_THREADS = max(os.cpu_count() // 2, 1)
+SEARCH_MAX_RUNNING = 4
+SEARCH_QUEUE_SIZE = 16
+# Memory-mapped fingerprint matrices of the similarity search written by the "similarity_matrix_rebuild"
+# command and the number of processes scoring them (see api/similarity.py)
+SIMILARITY_MATRIX_DIR = os.path.join(BASE_DIR, 'similarity')
+SIMILARITY_PROCESSES = max(os.cpu_count() // 2, 1)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
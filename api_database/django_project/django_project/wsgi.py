@@ -33,3 +33,6 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings')
 
 application = get_wsgi_application()
+
+from api.graph_store import preload_graph_stores  # noqa: E402
+preload_graph_stores()
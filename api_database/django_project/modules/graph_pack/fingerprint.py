@@ -0,0 +1,219 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from zlib import crc32
+from .graph_pack import unpack_graph, parse_template
+
+FP_BITS = 1024  # fingerprint length in bits
+FP_BYTES = FP_BITS // 8
+MAX_PATH_ATOMS = 6  # atom-type paths and rings are collected up to this number of atoms
+MAX_THRESHOLD = 8  # H-count and coordination features are collected up to this value
+MAX_PATHS = 50000  # if a graph has more paths (dense clusters), all fingerprint bits are set
+MAX_EXPANSIONS = 64  # templates with more combinations of multitype atom types are not expanded
+FULL_FINGERPRINT = b'\xff' * FP_BYTES
+
+
+def _canonical_path(seq):
+    reverse = seq[::-1]
+    return seq if seq <= reverse else reverse
+
+
+def _canonical_ring(seq):
+    size = len(seq)
+    variants = []
+    for items in (seq, seq[::-1]):
+        for i in range(size):
+            variants.append(items[i:] + items[:i])
+    return min(variants)
+
+
+def _add_path_features(types, adjacency, atoms, features):
+    '''
+    Add atom-type paths and rings (up to MAX_PATH_ATOMS atoms) of atoms with usable types.
+    Return False if the graph has more than MAX_PATHS paths.
+    '''
+    num_paths = 0
+    for start in atoms:
+        stack = [(start, (start,), (types[start],))]
+        while stack:
+            atom, path, seq = stack.pop()
+            num_paths += 1
+            if num_paths > MAX_PATHS:
+                return False
+            features.add((b'p', _canonical_path(seq)))
+            if len(path) == MAX_PATH_ATOMS:
+                continue
+            for neighbour in adjacency[atom]:
+                if neighbour == start and len(path) > 2:
+                    features.add((b'r', _canonical_ring(seq)))
+                elif neighbour not in path:
+                    stack.append((neighbour, path + (neighbour,), seq + (types[neighbour],)))
+    return True
+
+
+def _to_bits(features):
+    bits = 0
+    for prefix, values in features:
+        bits |= 1 << (crc32(prefix + bytes(values)) % FP_BITS)
+    return bits.to_bytes(FP_BYTES, 'little')
+
+
+def get_fingerprint(packed_graph):
+    '''
+    Return packed bitset (FP_BYTES bytes) of the database graph. Bits are set for atom-type paths and rings,
+    and for each atom "H-count >= k", "coordination >= k" and "coordination <= k" thresholds.
+    '''
+    structure_id, types, h_nums, bonds = unpack_graph(packed_graph)
+    return _get_graph_fingerprint(types, h_nums, bonds)
+
+
+def get_similarity_fingerprint(template):
+    '''
+    Return the fingerprint of the request template ("1 n b (type H cmin cmax)*n (a b)*b ...") built as
+    for a database graph, so it can be compared with fingerprints of structures (similarity search).
+    Hydrogens are added as explicit atoms, multitype atoms are skipped.
+    '''
+    values = [int(value) for value in template.split()]
+    num_atoms, num_bonds = values[1], values[2]
+    types = []
+    positions = dict()
+    bonds = []
+    for atom in range(1, num_atoms + 1):
+        atom_type, h_num = values[atom * 4 - 1:atom * 4 + 1]
+        if atom_type < 1:
+            continue
+        types.append(atom_type)
+        positions[atom] = len(types)
+        for _ in range(h_num):
+            types.append(1)
+            bonds.append((positions[atom], len(types)))
+    bonds_start = 3 + num_atoms * 4
+    for i in range(bonds_start, bonds_start + num_bonds * 2, 2):
+        atom1, atom2 = values[i], values[i + 1]
+        if atom1 in positions and atom2 in positions:
+            bonds.append((positions[atom1], positions[atom2]))
+    return _get_graph_fingerprint(types, [0] * len(types), bonds)
+
+
+def _get_graph_fingerprint(types, h_nums, bonds):
+    types = [0] + types
+    h_nums = [0] + h_nums
+    adjacency = [[] for _ in types]
+    for atom1, atom2 in bonds:
+        adjacency[atom1].append(atom2)
+        adjacency[atom2].append(atom1)
+    features = set()
+    atoms = range(1, len(types))
+    for atom in atoms:
+        atom_type = types[atom]
+        coord = h_nums[atom] + len(adjacency[atom])
+        # explicit hydrogen neighbours are counted as attached hydrogens by the search
+        h_num = h_nums[atom] + sum(1 for neighbour in adjacency[atom] if types[neighbour] == 1)
+        for value in range(1, min(h_num, MAX_THRESHOLD) + 1):
+            features.add((b'h', (atom_type, value)))
+        for value in range(2, min(coord, MAX_THRESHOLD) + 1):
+            features.add((b'c', (atom_type, value)))
+        for value in range(max(coord, 1), MAX_THRESHOLD):
+            features.add((b'C', (atom_type, value)))
+    if not _add_path_features(types, adjacency, atoms, features):
+        return FULL_FINGERPRINT
+    return _to_bits(features)
+
+
+def expand_template(template, max_expansions=MAX_EXPANSIONS):
+    '''
+    Return the list of templates without multitype atoms: one template for each combination of types
+    of multitype atoms ("-k t1 t2 ... 0" part). Return None if there are more than max_expansions combinations.
+    '''
+    atoms, bonds, multitypes = parse_template(template)
+    values = template.split()
+    templates = [values[:3 + len(atoms) * 4 + len(bonds) * 2]]
+    for atom, atom_data in enumerate(atoms):
+        atom_types = multitypes.get(atom_data[0])
+        if atom_types is None:
+            continue
+        if len(templates) * len(atom_types) > max_expansions:
+            return None
+        expanded = []
+        for item in templates:
+            for atom_type in atom_types:
+                expanded_item = item.copy()
+                expanded_item[3 + atom * 4] = str(atom_type)
+                expanded.append(expanded_item)
+        templates = expanded
+    return [' '.join(item) for item in templates]
+
+
+def get_template_fingerprints(template):
+    '''
+    Return the list of fingerprints of the template expansions (see expand_template): a structure found by
+    the template with multitype atoms has all bits of at least one of them.
+    If there are too many expansions, the only fingerprint with skipped multitype atoms is returned.
+    '''
+    expansions = expand_template(template) or [template]
+    return [get_template_fingerprint(expansion) for expansion in expansions]
+
+
+def get_template_fingerprint(template):
+    '''
+    Return packed bitset of the request template ("1 n b (type H cmin cmax)*n (a b)*b ...").
+    Only features which every matching structure has are set: explicit H and multitype atoms are skipped,
+    H-count and coordination are used as lower/upper bounds.
+    '''
+    values = [int(value) for value in template.split()]
+    num_atoms, num_bonds = values[1], values[2]
+    types = [0]
+    h_nums = [0]
+    coord_ranges = [(0, 0)]
+    for i in range(3, 3 + num_atoms * 4, 4):
+        atom_type, h_num, cord_min, cord_max = values[i:i + 4]
+        types.append(atom_type)
+        h_nums.append(h_num)
+        coord_ranges.append((cord_min, cord_max))
+    usable = [atom_type > 1 for atom_type in types]
+    adjacency = [[] for _ in types]
+    bonds_start = 3 + num_atoms * 4
+    for i in range(bonds_start, bonds_start + num_bonds * 2, 2):
+        atom1, atom2 = values[i], values[i + 1]
+        if usable[atom1] and usable[atom2]:
+            adjacency[atom1].append(atom2)
+            adjacency[atom2].append(atom1)
+    features = set()
+    atoms = [atom for atom in range(1, len(types)) if usable[atom]]
+    for atom in atoms:
+        atom_type = types[atom]
+        cord_min, cord_max = coord_ranges[atom]
+        if h_nums[atom] > 0:
+            features.add((b'h', (atom_type, min(h_nums[atom], MAX_THRESHOLD))))
+        if cord_min > 1:
+            features.add((b'c', (atom_type, min(cord_min, MAX_THRESHOLD))))
+        if 0 < cord_max < MAX_THRESHOLD:
+            features.add((b'C', (atom_type, cord_max)))
+    if not _add_path_features(types, adjacency, atoms, features):
+        return bytes(FP_BYTES)
+    return _to_bits(features)
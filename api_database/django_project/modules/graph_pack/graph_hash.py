@@ -0,0 +1,109 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import hashlib
+import networkx as nx
+from .graph_pack import unpack_graph, parse_template
+
+WL_ITERATIONS = 3  # iterations of Weisfeiler-Lehman hash of the component graph
+HASH_LENGTH = 32  # length of hex hashes
+
+
+def _get_hashes(labels, bonds):
+    '''
+    Return sorted hashes of connected components of the graph ({atom: label}, [(atom1, atom2), ...]).
+    Hashes do not depend on the atom order, different components may rarely get the same hash (collision).
+    '''
+    graph = nx.Graph()
+    for atom, label in labels.items():
+        graph.add_node(atom, label=label)
+    graph.add_edges_from(bonds)
+    hashes = []
+    for atoms in nx.connected_components(graph):
+        hashes.append(nx.weisfeiler_lehman_graph_hash(
+            graph.subgraph(atoms), node_attr='label', iterations=WL_ITERATIONS, digest_size=HASH_LENGTH // 2
+        ))
+    return sorted(hashes)
+
+
+def get_structure_hash(component_hashes):
+    '''Hash of the whole structure graph calculated from hashes of its components.'''
+    return hashlib.md5(' '.join(sorted(component_hashes)).encode()).hexdigest()
+
+
+def get_component_hashes(packed_graph):
+    '''
+    Return sorted hashes of connected components of the database graph.
+    Explicit hydrogen atoms are removed and counted as attached hydrogens like the exact search does,
+    so each atom is labelled by its type and the total number of hydrogens.
+    '''
+    structure_id, types, h_nums, bonds = unpack_graph(packed_graph)
+    h_nums = list(h_nums)
+    heavy_bonds = []
+    for atom1, atom2 in bonds:
+        if types[atom1 - 1] == 1 and types[atom2 - 1] != 1:
+            h_nums[atom2 - 1] += 1
+        elif types[atom2 - 1] == 1 and types[atom1 - 1] != 1:
+            h_nums[atom1 - 1] += 1
+        elif types[atom1 - 1] != 1:
+            heavy_bonds.append((atom1, atom2))
+    labels = {atom: f'{atom_type}:{h_nums[atom - 1]}' for atom, atom_type in enumerate(types, 1) if atom_type != 1}
+    return _get_hashes(labels, heavy_bonds)
+
+
+def get_template_component_hashes(template):
+    '''
+    Return sorted hashes of connected components of the template ("1 n b (type H cmin cmax)*n (a b)*b [multitypes]")
+    if the exact search result can be found by component hashes, otherwise None.
+    Each template component found by the exact search is a whole component of the database graph only if
+    the template has no hydrogen and multitype atoms and all its atoms have fixed coordination numbers
+    equal to the number of hydrogens and neighbours.
+    '''
+    atoms, bonds, multitypes = parse_template(template)
+    if not atoms or multitypes:
+        return None
+    degrees = [0] * (len(atoms) + 1)
+    for atom1, atom2 in bonds:
+        degrees[atom1] += 1
+        degrees[atom2] += 1
+    labels = dict()
+    for atom, (atom_type, h_num, cord_min, cord_max) in enumerate(atoms, 1):
+        if atom_type <= 1 or not cord_min == cord_max == h_num + degrees[atom]:
+            return None
+        labels[atom] = f'{atom_type}:{h_num}'
+    return _get_hashes(labels, bonds)
+
+
+def set_graph_hashes(coord_block, hash_model):
+    '''
+    Set graph_hash of the coordinates block (not saved) and replace hashes of its components in hash_model table.
+    '''
+    hashes = get_component_hashes(bytes(coord_block.packed_graph))
+    coord_block.graph_hash = get_structure_hash(hashes)
+    hash_model.objects.filter(refcode_id=coord_block.refcode_id).delete()
+    hash_model.objects.bulk_create([hash_model(refcode_id=coord_block.refcode_id, hash=value) for value in set(hashes)])
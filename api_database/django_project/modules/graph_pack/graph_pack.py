@@ -0,0 +1,121 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import struct
+import sys
+from array import array
+
+# header: magic, version, flags, structure id, number of atoms, number of bonds (see cpplib MoleculeGraph.h)
+HEADER = struct.Struct('<2sBBiII')
+MAGIC = b'AG'
+VERSION = 1
+WIDE_FLAG = 1  # bonds are stored as uint32 pairs instead of uint16 ones
+MAX_NARROW_INDEX = 0xFFFF
+
+
+def _to_little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_graph(structure_id, graph_str):
+    '''
+    Pack graph string returned by cpplib ("nAtoms nBonds (type H)*nAtoms (a b)*nBonds")
+    into bytes which can be passed to cpplib.SearchMainPacked.
+    '''
+    values = [int(value) for value in graph_str.split()]
+    num_atoms, num_bonds = values[0], values[1]
+    atoms = values[2:2 + num_atoms * 2]
+    bonds = values[2 + num_atoms * 2:2 + num_atoms * 2 + num_bonds * 2]
+    flags = 0
+    bond_type = 'H'
+    if num_atoms > MAX_NARROW_INDEX:
+        flags |= WIDE_FLAG
+        bond_type = 'I'
+    header = HEADER.pack(MAGIC, VERSION, flags, int(structure_id), num_atoms, num_bonds)
+    return header + bytes(atoms) + _to_little_endian(array(bond_type, bonds)).tobytes()
+
+
+def pack_graph_string(graph_string):
+    '''Pack graph in the old database format ("id nAtoms nBonds ...").'''
+    structure_id, graph_str = graph_string.split(maxsplit=1)
+    return pack_graph(structure_id, graph_str)
+
+
+def unpack_graph(data):
+    '''Return structure id, atom types, H numbers and bonds (1-based atom indices) of packed graph.'''
+    data = bytes(data)
+    magic, version, flags, structure_id, num_atoms, num_bonds = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Unsupported packed graph format')
+    atoms_end = HEADER.size + num_atoms * 2
+    atoms = data[HEADER.size:atoms_end]
+    bonds = array('I' if flags & WIDE_FLAG else 'H')
+    bonds.frombytes(data[atoms_end:])
+    bonds = _to_little_endian(bonds)
+    return (
+        structure_id,
+        list(atoms[0::2]),
+        list(atoms[1::2]),
+        list(zip(bonds[0::2], bonds[1::2]))
+    )
+
+
+def graph_to_string(data):
+    '''Convert packed graph to the old database string format.'''
+    structure_id, types, h_nums, bonds = unpack_graph(data)
+    result = [structure_id, len(types), len(bonds)]
+    for atom_type, h_num in zip(types, h_nums):
+        result.extend((atom_type, h_num))
+    for atom1, atom2 in bonds:
+        result.extend((atom1, atom2))
+    return ' '.join(map(str, result))
+
+
+def parse_template(template):
+    '''
+    Parse the request template ("1 n b (type H cmin cmax)*n (a b)*b [multitypes]").
+    Return atoms as a list of (type, H number, min coordination, max coordination), bonds as a list of
+    (a, b) pairs (1-based atom indices) and multitypes {negative atom type: [alternative types]}
+    of the "-k t1 t2 ... 0" part.
+    '''
+    values = [int(value) for value in template.split()]
+    num_atoms, num_bonds = values[1], values[2]
+    bonds_start = 3 + num_atoms * 4
+    atoms = [tuple(values[i:i + 4]) for i in range(3, bonds_start, 4)]
+    bonds = [(values[i], values[i + 1]) for i in range(bonds_start, bonds_start + num_bonds * 2, 2)]
+    multitypes = dict()
+    multitype = None
+    for value in values[bonds_start + num_bonds * 2:]:
+        if value < 0:
+            multitype = value
+            multitypes[multitype] = []
+        elif value and multitype is not None:
+            multitypes[multitype].append(value)
+    return atoms, bonds, multitypes
@@ -31,6 +31,7 @@ from .models import (QCStructureCode, QCCell, QCProgram,
                      QCCoordinatesBlock, QCProperties,
                      QCSubstructure1, QCSubstructure2, QCInChI)
 from django.contrib import admin
+from modules.graph_pack.graph_pack import graph_to_string
 
 
 @admin.register(QCStructureCode)
@@ -68,6 +69,11 @@ class QCCoordinatesBlockAdmin(admin.ModelAdmin):
     search_fields = ('refcode__qc_refcode__startswith', 'smiles')
     empty_value_display = '-empty-'
 
+    @admin.display(description='Graph')
+    def graph(self, obj):
+        if obj.packed_graph:
+            return graph_to_string(obj.packed_graph)
+
 
 @admin.register(QCSubstructure1)
 class QCSubstructure1Admin(admin.ModelAdmin):
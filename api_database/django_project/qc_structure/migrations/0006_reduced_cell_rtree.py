@@ -0,0 +1,25 @@
+# Generated by Django 3.2.24 on 2026-10-17 02:10
+
+from django.db import migrations
+from structure.cell_index import create_cell_index, drop_cell_index
+
+CELL_TABLE = 'qc_structure_qcreducedcell'
+
+
+def create_index(apps, schema_editor):
+    create_cell_index(schema_editor, CELL_TABLE)
+
+
+def drop_index(apps, schema_editor):
+    drop_cell_index(schema_editor, CELL_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qc_structure', '0005_elements_mask'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-17 02:55
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qc_structure', '0007_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='qcstructurecode',
+            index=models.Index(django.db.models.functions.text.Upper('refcode'), name='qc_structure_refcode_upper_idx'),
+        ),
+    ]
@@ -32,8 +32,10 @@ from structure.models import (Spacegroup, AbstractCell, AbstractReducedCell,
                               AbstractFormula, AbstractElementsManager,
                               AbstractStructureCode, ElementsSet1, ElementsSet2,
                               ElementsSet3, ElementsSet4, ElementsSet5,
-                              ElementsSet6, ElementsSet7, ElementsSet8, AbstractInChI)
+                              ElementsSet6, ElementsSet7, ElementsSet8, AbstractInChI,
+                              AbstractComponentHash)
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth import get_user_model
 import os
 
@@ -60,6 +62,8 @@ class QCStructureCode(AbstractStructureCode):
     class Meta:
         verbose_name_plural = 'QCStructureCodes'
         ordering = ['refcode']
+        # case-insensitive refcode lookups (see api.filters.get_refcodes_filter)
+        indexes = [models.Index(Upper('refcode'), name='qc_structure_refcode_upper_idx')]
 
     def __str__(self):
         return self.refcode
@@ -288,3 +292,15 @@ class QCInChI(AbstractInChI):
 
     class Meta:
         verbose_name_plural = 'QCInChI graphs'
+
+
+class QCComponentHash(AbstractComponentHash):
+    '''Canonical hashes of connected components of structure graphs.'''
+    refcode = models.ForeignKey(
+        QCStructureCode,
+        related_name='qc_component_hashes',
+        on_delete=models.CASCADE
+    )
+
+    class Meta:
+        verbose_name_plural = 'QCComponent hashes'
@@ -38,14 +38,19 @@ from math import cos, sqrt, radians
 import networkx as nx
 import re
 from structure.management.commands.cif_db_update_modules._element_numbers import element_numbers
-from structure.management.commands.cif_db_update_modules._make_graphs_c import make_graph_c
-from structure.management.commands.cif_db_update_modules._add_substructure_filtration import (TEMPLATES, start_dll_and_write,
+from structure.management.commands.cif_db_update_modules._make_graphs_c import make_graph_c, make_networkx_graph
+from modules.graph_pack.graph_pack import pack_graph
+from modules.graph_pack.fingerprint import get_fingerprint
+from modules.graph_pack.graph_hash import set_graph_hashes
+from structure.search_text import update_text_index
+from api.query_planner import count_atoms_change, add_atom_statistics
+from structure.management.commands.cif_db_update_modules._add_substructure_filtration import (start_dll_and_write,
                                                                                               set_only_CHNO, set_no_C,
                                                                                               set_elements, SET_ELEMENTS)
-from qc_structure.models import (QCStructureCode, QCCell, QCReducedCell, QCFormula,
-                                 QCCompoundName, QCElementsManager, QCProperties,
+from qc_structure.models import (QCCell, QCReducedCell, QCFormula, QCCompoundName,
+                                 QCElementsManager, QCProperties,
                                  QCCoordinatesBlock, QCSubstructure1, QCSubstructure2,
-                                 QCProgram, QCInChI)
+                                 QCProgram, QCInChI, QCComponentHash)
 
 
 def save_program(struct_obj):
@@ -219,11 +224,14 @@ def save_graph(struct_obj):
         params, atoms_coords_types, atoms_types,
         struct_obj, vasp_logger, symops
     )
-    graph_str = str(struct_obj.id) + ' ' + graph_str
     # save graph
     if graph_str:
-        struct_obj.qc_coordinates.graph = graph_str
+        old_graph = struct_obj.qc_coordinates.packed_graph
+        struct_obj.qc_coordinates.packed_graph = pack_graph(struct_obj.id, graph_str)
+        struct_obj.qc_coordinates.fingerprint = get_fingerprint(struct_obj.qc_coordinates.packed_graph)
+        set_graph_hashes(struct_obj.qc_coordinates, QCComponentHash)
         struct_obj.qc_coordinates.save()
+        add_atom_statistics(count_atoms_change(old_graph, struct_obj.qc_coordinates.packed_graph), qc=True)
     return smiles, inchi
 
 
@@ -259,30 +267,11 @@ def save_smiles_inchi(structure_obj, qc_smiles, qc_inchi):
 
 
 def save_formula(structure_obj, symmed_vasp_struct):
-
-    def make_networkx_graph(graph_string):
-        graph = nx.Graph()
-        string_graph = graph_string.split()
-        num_nodes = int(string_graph[1])
-        for idx, el in enumerate(string_graph[3:], start=1):
-            # nodes
-            if idx < num_nodes * 2 and idx % 2 == 1:
-                for key, value in element_numbers.items():
-                    if value == int(el):
-                        element = key
-                        break
-                graph.add_nodes_from([(int((idx + 1) / 2), {'element': element, 'h_num': int(string_graph[idx + 3])}), ])
-            # edges
-            elif idx > num_nodes * 2 and idx % 2 == 1:
-                graph.add_edge(int(el), int(string_graph[idx + 3]))
-        return graph
-
     vasp_logger.info('Add formula...')
     sum_formula = symmed_vasp_struct.composition
 
     # moiety_formula
-    graph_string = structure_obj.qc_coordinates.graph
-    graph = make_networkx_graph(graph_string)
+    graph = make_networkx_graph(structure_obj.qc_coordinates.packed_graph)
     molecules = [graph.subgraph(c).copy() for c in nx.connected_components(graph)]
     moiety_formula = list()
     for mol in molecules:
@@ -329,11 +318,9 @@ def save_substructure(structure_obj):
     vasp_logger.info('Add substructure filtration...')
     models = {'Substructure1': QCSubstructure1,
               'Substructure2': QCSubstructure2}
-    graph = structure_obj.qc_coordinates.graph
+    graph = structure_obj.qc_coordinates.packed_graph
     if graph:
-        for attr_name, data in TEMPLATES.items():
-            template_graph, obj_name = data
-            start_dll_and_write(template_graph, [graph, ], 1, attr_name, models[obj_name], QCStructureCode)
+        start_dll_and_write([graph, ], 1, models)
 
     graph_query = QCCoordinatesBlock.objects.filter(refcode=structure_obj)
     set_only_CHNO(graph_query, QCSubstructure1, 'refcode__qc_elements__element_set')
@@ -358,3 +345,4 @@ def vasp_parser(structure_obj, file: str, syst_name='', triv_name=''):
     save_formula(structure_obj, symmed_vasp_struct)
     save_element_sets(structure_obj)
     save_substructure(structure_obj)
+    update_text_index([structure_obj.id], qc=True)
@@ -0,0 +1,114 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from functools import lru_cache
+from django.db import connection
+
+# R*Tree tables are limited to 5 dimensions, so gamma is checked by the ordinary range filter
+INDEX_COLUMNS = (('a', 'LengthA'), ('b', 'LengthB'), ('c', 'LengthC'), ('al', 'AngleAlpha'), ('be', 'AngleBeta'))
+
+
+def get_index_table(cell_table):
+    '''Return the name of the R*Tree table of the reduced cell table.'''
+    return f'{cell_table}_rtree'
+
+
+def get_create_sql(cell_table):
+    '''Return SQL statements creating the R*Tree index of the reduced cell table, its triggers and its content.'''
+    index_table = get_index_table(cell_table)
+    bounds = ', '.join(f'{name}_min, {name}_max' for name, _ in INDEX_COLUMNS)
+    values = ', '.join(f'new.{column}, new.{column}' for _, column in INDEX_COLUMNS)
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {index_table} USING rtree(id, {bounds})',
+        f'CREATE TRIGGER IF NOT EXISTS {index_table}_insert AFTER INSERT ON {cell_table} BEGIN '
+        f'INSERT INTO {index_table} VALUES (new.id, {values}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {index_table}_update AFTER UPDATE ON {cell_table} BEGIN '
+        f'DELETE FROM {index_table} WHERE id = old.id; INSERT INTO {index_table} VALUES (new.id, {values}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {index_table}_delete AFTER DELETE ON {cell_table} BEGIN '
+        f'DELETE FROM {index_table} WHERE id = old.id; END',
+        get_fill_sql(cell_table),
+    ]
+
+
+def get_fill_sql(cell_table):
+    '''Return SQL statement copying all reduced cells to the R*Tree index.'''
+    values = ', '.join(f'{column}, {column}' for _, column in INDEX_COLUMNS)
+    return f'INSERT INTO {get_index_table(cell_table)} SELECT id, {values} FROM {cell_table}'
+
+
+def get_drop_sql(cell_table):
+    '''Return SQL statements removing the R*Tree index of the reduced cell table.'''
+    index_table = get_index_table(cell_table)
+    return [f'DROP TRIGGER IF EXISTS {index_table}_{event}' for event in ('insert', 'update', 'delete')] + [
+        f'DROP TABLE IF EXISTS {index_table}'
+    ]
+
+
+def create_cell_index(schema_editor, cell_table):
+    '''Create the R*Tree index of the reduced cell table (SQLite only).'''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in get_create_sql(cell_table):
+        schema_editor.execute(sql)
+
+
+def drop_cell_index(schema_editor, cell_table):
+    '''Remove the R*Tree index of the reduced cell table (SQLite only).'''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in get_drop_sql(cell_table):
+        schema_editor.execute(sql)
+
+
+def rebuild_cell_index(cell_table):
+    '''Refill the R*Tree index of the reduced cell table and return the number of cells.'''
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {get_index_table(cell_table)}')
+        cursor.execute(get_fill_sql(cell_table))
+        cursor.execute(f'SELECT count(*) FROM {get_index_table(cell_table)}')
+        return cursor.fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def has_cell_index(cell_table):
+    '''Check if the R*Tree index of the reduced cell table exists.'''
+    if connection.vendor != 'sqlite':
+        return False
+    return get_index_table(cell_table) in connection.introspection.table_names()
+
+
+def get_cell_index_query(cell_table, ranges):
+    '''
+    Return SQL and parameters selecting ids of the reduced cells inside the box.
+    ranges - {'a': (min, max), ...} for the INDEX_COLUMNS names.
+    '''
+    conditions, params = [], []
+    for name, _ in INDEX_COLUMNS:
+        conditions.append(f'{name}_max >= %s AND {name}_min <= %s')
+        params.extend(ranges[name])
+    return f'SELECT id FROM {get_index_table(cell_table)} WHERE {" AND ".join(conditions)}', params
@@ -0,0 +1,73 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from structure.models import CoordinatesBlock, AtomStatistics
+from qc_structure.models import QCCoordinatesBlock
+from api.query_planner import count_atoms
+import multiprocessing
+
+NUM_OF_PROC = max(int(multiprocessing.cpu_count() / 2), 1)  # number of physical processors
+CHUNK_SIZE = 5000  # the number of graphs read from the database at once
+
+
+def collect_atom_statistics(coordinates_model, pool):
+    statistics = Counter()
+    graphs = coordinates_model.objects.filter(packed_graph__isnull=False).values_list('packed_graph', flat=True)
+    chunk = []
+    for graph in graphs.iterator(chunk_size=CHUNK_SIZE):
+        if graph:
+            chunk.append(bytes(graph))
+        if len(chunk) == CHUNK_SIZE:
+            for counter in pool.map(count_atoms, chunk, chunksize=100):
+                statistics.update(counter)
+            chunk = []
+    for counter in pool.map(count_atoms, chunk, chunksize=100):
+        statistics.update(counter)
+    return statistics
+
+
+class Command(BaseCommand):
+    help = 'Recalculate atom statistics used by the search query planner.'
+
+    def handle(self, *args, **options):
+        statistics = dict()
+        with multiprocessing.Pool(NUM_OF_PROC) as pool:
+            for qc, model in ((False, CoordinatesBlock), (True, QCCoordinatesBlock)):
+                statistics[qc] = collect_atom_statistics(model, pool)
+        with transaction.atomic():
+            AtomStatistics.objects.all().delete()
+            AtomStatistics.objects.bulk_create([
+                AtomStatistics(qc=qc, element=element, h_num=h_num, coord=coord, count=count)
+                for qc, counter in statistics.items() for (element, h_num, coord), count in counter.items()
+            ])
+        for qc, counter in statistics.items():
+            self.stdout.write(f'{"QC" if qc else "Experimental"} structures: '
+                              f'{len(counter)} atom types, {sum(counter.values())} atoms')
@@ -0,0 +1,58 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from structure.models import ReducedCell
+from structure.cell_index import has_cell_index, rebuild_cell_index
+from qc_structure.models import QCReducedCell
+
+
+class Command(BaseCommand):
+    help = 'Refill R*Tree indexes of reduced cells used by the unit cell search (SQLite only).'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('R*Tree cell indexes are supported only for SQLite databases')
+        models = [ReducedCell, QCReducedCell]
+        if options['qc']:
+            models = models[1:]
+        elif options['no_qc']:
+            models = models[:1]
+        for model in models:
+            cell_table = model._meta.db_table
+            if not has_cell_index(cell_table):
+                raise CommandError(f'{cell_table} has no R*Tree index, apply migrations first')
+            with transaction.atomic():
+                count = rebuild_cell_index(cell_table)
+            self.stdout.write(f'{model.__name__}: {count} cells indexed')
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--qc', action='store_true', help='Rebuild only QC structures')
+        group.add_argument('--no-qc', action='store_true', help='Rebuild only experimental structures')
@@ -29,22 +29,35 @@
 import time
 
 from django.core.management.base import BaseCommand
+from django.db import connections, transaction
 import os
-from .cif_db_update_modules._cifparser import add_coords, add_cell_parms_with_error, add_other_info
-from .cif_db_update_modules._make_graphs_c import add_graphs_c
-from .cif_db_update_modules._add_graphs_to_db import upload_graphs_to_db
+from .cif_db_update_modules._cifparser import add_coords, add_cell_parms_with_error, add_other_info, has_coords
+from .cif_db_update_modules._make_graphs_c import add_graphs_c, get_graph
+from .cif_db_update_modules._add_graphs_to_db import upload_graphs_to_db, get_inchi_values
 from .cif_db_update_modules._add_substructure_filtration import add_substructure_filters
-from .cif_db_update_modules._add_all_cif_data import add_all_cif_data
+from .cif_db_update_modules._add_all_cif_data import (add_all_cif_data, get_or_create_space_group,
+                                                     get_refcode_values)
+from .cif_db_update_modules._bulk_add_to_db import (bulk_add_all_cif_data, bulk_add_coords_and_params_to_db,
+                                                    bulk_upload_graphs_to_db, get_structure_ids)
 from CifFile import ReadCif
 from structure.models import StructureCode, InChI, CoordinatesBlock
 import multiprocessing
-from django_project.loggers import cif_db_update_main_logger as logger_main
+import threading
+from queue import Empty
+from django_project.loggers import cif_db_update_main_logger as logger_main, set_prm_log
+from api.result_cache import bump_dataset_version
+from api.query_planner import add_atom_statistics
+from collections import Counter
+from contextlib import nullcontext
 import chardet
 from typing import Dict
 
-NUM_OF_PROC = int(multiprocessing.cpu_count() / 2)  # number of physical processors
+NUM_OF_PROC = max(int(multiprocessing.cpu_count() / 2), 1)  # number of physical processors
 MAX_TIME_WAIT = 600  # maximum time to wait for process completion (sec)
 CHUNK_SIZE = 5000  # size of the processed part of the array
+STREAM_QUEUE_SIZE = 100  # maximum number of items waiting between two stages of the streaming pipeline
+STREAM_WRITE_SIZE = 500  # number of structures written to the database at once by the streaming pipeline
+STREAM_FLUSH_TIME = 5  # maximum time the collected structures wait to be written by the streaming pipeline (sec)
 
 
 def collect_cif_data(file: str, cif_blocks: dict, user_refcode='', use_db=True):
@@ -192,9 +205,11 @@ def create_graph_c(queue):
 
 
 def manager_upload_graphs_to_db(graphs: Dict[str, Dict]):
+    atom_statistics = Counter()
     for refcode, graph in graphs.items():
         structure = StructureCode.objects.get(refcode=refcode)
-        upload_graphs_to_db(graph, structure)
+        atom_statistics.update(upload_graphs_to_db(graph, structure))
+    add_atom_statistics(atom_statistics)
 
 
 def manager_upload_smiles_and_inchi_to_db(graphs: Dict[str, Dict]):
@@ -205,35 +220,233 @@ def manager_upload_smiles_and_inchi_to_db(graphs: Dict[str, Dict]):
             coord_block.smiles = graph['smiles']
             coord_block.save()
         if graph['inchi'] and not InChI.objects.filter(refcode=structure).exists():
-            inchi = graph['inchi'].split('=')[1].split('/')
-            # print(inchi)
-            inchi_block = InChI.objects.create(refcode=structure, version=inchi[0], formula=inchi[1])
-            for item in inchi[2:]:
-                if item.startswith('c'):
-                    inchi_block.connectivity = item
-                elif item.startswith('h'):
-                    inchi_block.hydrogens = item
-                elif item.startswith('q'):
-                    inchi_block.q_charge = item
-                elif item.startswith('p'):
-                    inchi_block.p_charge = item
-                elif item.startswith('b'):
-                    inchi_block.b_stereo = item
-                elif item.startswith('t'):
-                    inchi_block.t_stereo = item
-                elif item.startswith('m'):
-                    inchi_block.m_stereo = item
-                elif item.startswith('s'):
-                    inchi_block.s_stereo = item
-                elif item.startswith('i'):
-                    inchi_block.i_isotopic = item
-            inchi_block.save()
-
-
-def main(args, all_data=False, user_refcodes=''):
+            InChI.objects.create(refcode=structure, **get_inchi_values(graph['inchi']))
+
+
+class StageStatistics:
+    '''Number of processed items and time spent by one worker of a streaming pipeline stage.'''
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.items = 0
+        self.waiting = 0.0  # waiting for input
+        self.blocked = 0.0  # waiting for a free place in the output queue
+        self.total = 0.0
+        self.start = time.perf_counter()
+
+    @property
+    def busy(self):
+        return self.total - self.waiting - self.blocked
+
+    def get(self, queue, timeout=None):
+        start = time.perf_counter()
+        try:
+            return queue.get(timeout=timeout)
+        finally:
+            self.waiting += time.perf_counter() - start
+
+    def put(self, queue, item):
+        start = time.perf_counter()
+        queue.put(item)
+        self.blocked += time.perf_counter() - start
+        self.items += 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+        return self
+
+
+def read_files(files, user_refcodes: dict, file_queue, num_parsers: int, statistics: list):
+    '''Reader stage of the streaming pipeline: pass cif files with their user refcodes to the parsers.'''
+    stage = StageStatistics('reader')
+    for file in files:
+        stage.put(file_queue, (file, user_refcodes.get(file, '')))
+    for i in range(num_parsers):
+        file_queue.put(None)
+    statistics.append(stage.finish())
+
+
+def parse_cifs(file_queue, block_queue, statistics_queue):
+    '''Parser stage of the streaming pipeline: read cif blocks of the files.'''
+    stage = StageStatistics('parser')
+    while True:
+        item = stage.get(file_queue)
+        if item is None:
+            break
+        file, user_refcode = item
+        try:
+            cif_blocks = collect_cif_data(file, dict(), user_refcode, use_db=False)
+        except Exception:
+            logger_main.error(f"File {file} was skipped!", exc_info=True)
+            continue
+        for refcode, cif_block in cif_blocks.items():
+            stage.put(block_queue, (refcode, cif_block))
+    statistics_queue.put(stage.finish())
+
+
+def make_graphs(block_queue, result_queue, statistics_queue, proc_num: int):
+    '''Graph stage of the streaming pipeline: make molecule graphs, smiles and inchi of the cif blocks.'''
+    add_graphs_logger = set_prm_log(proc_num)
+    stage = StageStatistics('graphs')
+    while True:
+        item = stage.get(block_queue)
+        if item is None:
+            break
+        refcode, cif_block = item
+        graph = None
+        if has_coords(cif_block):
+            try:
+                symops = get_or_create_space_group(cif_block[1], return_only_symops=True)
+                graph = get_graph(refcode, cif_block, symops, add_graphs_logger)
+            except Exception:
+                add_graphs_logger.error(f"Structure {refcode} not added to the resulting list!", exc_info=True)
+        stage.put(result_queue, (refcode, cif_block, graph))
+    statistics_queue.put(stage.finish())
+
+
+def finish_stages(parsers: list, block_queue, graph_workers: list, result_queue):
+    '''Pass the end of data to the next stage of the streaming pipeline when the previous one is completed.'''
+    for process in parsers:
+        process.join()
+    for i in range(len(graph_workers)):
+        block_queue.put(None)
+    for process in graph_workers:
+        process.join()
+    result_queue.put(None)
+
+
+def write_structures(results: list, all_data: bool) -> int:
+    '''
+    Writer stage of the streaming pipeline: write the structures with their graphs in one transaction,
+    return their number.
+    '''
+    cif_blocks = {refcode: cif_block for refcode, cif_block, graph in results}
+    with transaction.atomic():
+        if all_data:
+            try:
+                cif_blocks = bulk_add_all_cif_data(cif_blocks)
+            except Exception:
+                if len(cif_blocks) > 1:
+                    raise
+                # the only structure of the batch is not valid, the error is already logged
+                return 0
+        else:
+            get_structure_ids(
+                list(cif_blocks),
+                {refcode: get_refcode_values(cif_block[1]) for refcode, cif_block in cif_blocks.items()}
+            )
+        bulk_add_coords_and_params_to_db(cif_blocks)
+        graphs = {refcode: graph for refcode, cif_block, graph in results if graph and refcode in cif_blocks}
+        bulk_upload_graphs_to_db(graphs)
+        add_substructure_filters(graphs.keys(), NUM_OF_PROC)
+    # Cached search results are outdated now
+    bump_structures_version(cif_blocks)
+    return len(cif_blocks)
+
+
+def bump_structures_version(refcodes) -> int:
+    """Bump the dataset version recording ids of the structures with the given refcodes, return the version"""
+    structures = StructureCode.objects.only('id', 'refcode').in_bulk(list(refcodes), field_name='refcode')
+    return bump_dataset_version([structure.id for structure in structures.values()], qc=False)
+
+
+def log_stage_statistics(statistics: list):
+    stages: Dict[str, list] = dict()
+    for stage in statistics:
+        stages.setdefault(stage.stage, []).append(stage)
+    for name, workers in stages.items():
+        items = sum(worker.items for worker in workers)
+        busy = sum(worker.busy for worker in workers)
+        logger_main.info(f"Stage {name}: {len(workers)} worker(s), {items} items, "
+                         f"{items / max(busy, 1e-9) * len(workers):.1f} items/s without waiting, "
+                         f"waiting for input {sum(worker.waiting for worker in workers):.1f} s, "
+                         f"for output {sum(worker.blocked for worker in workers):.1f} s")
+
+
+def stream_cifs(cif_files: list, all_data=False, user_refcodes=None, num_parsers=NUM_OF_PROC,
+                num_graph_workers=NUM_OF_PROC):
+    """
+    Streaming pipeline: reader -> parsers -> graph workers -> database writer (this process);
+    the stages are connected by bounded queues, so the memory does not depend on the number of files
+    and the structures are written in batches of STREAM_WRITE_SIZE as they come
+    """
+    if user_refcodes is None:
+        user_refcodes = dict()
+    file_queue = multiprocessing.Queue(STREAM_QUEUE_SIZE)
+    block_queue = multiprocessing.Queue(STREAM_QUEUE_SIZE)
+    result_queue = multiprocessing.Queue(STREAM_QUEUE_SIZE)
+    statistics_queue = multiprocessing.Queue()
+    statistics = []
+    parsers = [
+        multiprocessing.Process(target=parse_cifs, args=(file_queue, block_queue, statistics_queue))
+        for i in range(num_parsers)
+    ]
+    graph_workers = [
+        multiprocessing.Process(target=make_graphs, args=(block_queue, result_queue, statistics_queue, i + 1))
+        for i in range(num_graph_workers)
+    ]
+    # child processes open their own database connections
+    connections.close_all()
+    for process in parsers + graph_workers:
+        process.start()
+    threads = [
+        threading.Thread(target=read_files, args=(cif_files, user_refcodes, file_queue, num_parsers, statistics),
+                         daemon=True),
+        threading.Thread(target=finish_stages, args=(parsers, block_queue, graph_workers, result_queue),
+                         daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    writer = StageStatistics('writer')
+    results = []
+    deadline = None
+    finished = False
+    try:
+        while not finished:
+            try:
+                timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+                result = writer.get(result_queue, timeout=timeout)
+                finished = result is None
+                if not finished:
+                    results.append(result)
+                    if deadline is None:
+                        deadline = time.perf_counter() + STREAM_FLUSH_TIME
+            except Empty:
+                pass
+            if results and (finished or len(results) >= STREAM_WRITE_SIZE or time.perf_counter() >= deadline):
+                writer.items += write_structures(results, all_data)
+                results = []
+                deadline = None
+                elapsed = time.perf_counter() - writer.start
+                logger_main.info(f"{writer.items} structures were added in {elapsed:.1f} s "
+                                 f"({writer.items / elapsed:.1f} structures/s), waiting in queues: "
+                                 f"{file_queue.qsize()} files, {block_queue.qsize()} cif blocks, "
+                                 f"{result_queue.qsize()} graphs")
+    finally:
+        if not finished:
+            for process in parsers + graph_workers:
+                process.terminate()
+    for thread in threads:
+        thread.join()
+    while True:
+        try:
+            statistics.append(statistics_queue.get(timeout=1))
+        except Empty:
+            break
+    statistics.append(writer.finish())
+    log_stage_statistics(statistics)
+    return writer.items
+
+
+def main(args, all_data=False, user_refcodes='', bulk=False, stream=False):
     """
     user_refcodes: {'path_file': 'user_refcode', ...}
     example: {'C:\dev\cifs\my1.cif': 'SDFIREJS'}
+    bulk: write each chunk table by table with bulk queries in two transactions, structures and their graphs
+          (see _bulk_add_to_db)
+    stream: process the files by the streaming pipeline instead of chunks (see stream_cifs)
+    Return the dataset version of the last processed chunk (None in the stream mode),
+    graph stores of the running workers are updated by it (see GraphStore.update)
     """
     if not user_refcodes:
         user_refcodes = dict()
@@ -241,20 +454,36 @@ def main(args, all_data=False, user_refcodes=''):
         all_data = True
     logger_main.info(f"Counting cif files in a specified directory")
     cif_files = get_files(args)
+    if stream:
+        stream_cifs(cif_files, all_data, user_refcodes)
+        logger_main.info(f"Script was finished successfully!")
+        return None
+    version = None
     # split an array of cif files in parts of CHUNK_SIZE size
     for i in range(0, len(cif_files), CHUNK_SIZE):
+        start = time.time()
         logger_main.info(f"Start reading cif files")
         cif_blocks = manager_collect_cifs(cif_files[i:i + CHUNK_SIZE], user_refcodes)
-        # Add all data from cif file
-        if all_data:
-            logger_main.info(f"Start adding all information from the cif to the database")
-            cif_blocks = add_all_cif_data(cif_blocks)
-        # Adding coordinates and parameters with deviations
-        logger_main.info(f"Start adding coordinates and cell parameters with deviations")
-        manager_add_coords_and_params_to_db(cif_blocks)
-        # Create a queue for multi-threaded processing and get a list of structures that should be added
-        logger_main.info(f"Start creating a queue for multi-threaded processing of cif files")
-        queue, refcodes_to_graph = create_queue(cif_blocks)
+        # the bulk mode writes the structures of the chunk in one transaction, so a failed chunk leaves no rows,
+        # and their graphs in another one; graphs are generated between them, so the write lock of the database
+        # is not held while the graphs are made
+        with transaction.atomic() if bulk else nullcontext():
+            # Add all data from cif file
+            if all_data:
+                logger_main.info(f"Start adding all information from the cif to the database")
+                if bulk:
+                    cif_blocks = bulk_add_all_cif_data(cif_blocks)
+                else:
+                    cif_blocks = add_all_cif_data(cif_blocks)
+            # Adding coordinates and parameters with deviations
+            logger_main.info(f"Start adding coordinates and cell parameters with deviations")
+            if bulk:
+                bulk_add_coords_and_params_to_db(cif_blocks)
+            else:
+                manager_add_coords_and_params_to_db(cif_blocks)
+            # Create a queue for multi-threaded processing and get a list of structures that should be added
+            logger_main.info(f"Start creating a queue for multi-threaded processing of cif files")
+            queue, refcodes_to_graph = create_queue(cif_blocks)
         # Creating molecule graphs
         logger_main.info(f"Start generating molecule graphs in multi-threaded mode")
         graphs: dict = create_graph_c(queue)
@@ -268,24 +497,33 @@ def main(args, all_data=False, user_refcodes=''):
                              f"\tNot added {len(not_added_structures)} structures (addition error in {round(len(not_added_structures) / len(refcodes_to_graph) * 100, 2)} % cases)\n"
                              f"\tList of unadded structures:\n"
                              f"\t\t{', '.join(not_added_structures)}")
-        # Adding graphs to the database
-        logger_main.info(f"Start adding graphs into the database")
-        manager_upload_graphs_to_db(graphs)
-        # Adding smiles and inchi
-        logger_main.info(f"Start adding smiles and inchi")
-        manager_upload_smiles_and_inchi_to_db(graphs)
-        # Adding substructure info
-        logger_main.info(f"Start adding substructure information")
-        add_substructure_filters(graphs.keys(), NUM_OF_PROC)
+        with transaction.atomic() if bulk else nullcontext():
+            # Adding graphs to the database
+            logger_main.info(f"Start adding graphs into the database")
+            if bulk:
+                bulk_upload_graphs_to_db(graphs)
+            else:
+                manager_upload_graphs_to_db(graphs)
+                # Adding smiles and inchi
+                logger_main.info(f"Start adding smiles and inchi")
+                manager_upload_smiles_and_inchi_to_db(graphs)
+            # Adding substructure info
+            logger_main.info(f"Start adding substructure information")
+            add_substructure_filters(graphs.keys(), NUM_OF_PROC)
+        # Cached search results are outdated now
+        version = bump_structures_version(cif_blocks)
+        elapsed = time.time() - start
+        logger_main.info(f"{len(cif_blocks)} structures were added in {elapsed:.1f} s "
+                         f"({len(cif_blocks) / elapsed:.1f} structures/s)")
     logger_main.info(f"Script was finished successfully!")
-    return 0
+    return version
 
 
 class Command(BaseCommand):
     help = 'Add new data to database from cif files.'
 
     def handle(self, *args, all_data=False, user_refcodes='', **options):
-        main(args, all_data=False, user_refcodes='')
+        main(args, all_data=False, user_refcodes='', bulk=options['bulk'], stream=options['stream'])
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -294,4 +532,14 @@ class Command(BaseCommand):
             help='Path to cif file(s) or directory path with cif files',
             dest='args'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Write each chunk of structures and then their graphs with bulk queries, one transaction each'
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Read, parse, make graphs and write structures by parallel stages connected by bounded queues'
+        )
 
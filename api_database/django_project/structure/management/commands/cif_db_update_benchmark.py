@@ -0,0 +1,118 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import os
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from structure.models import StructureCode, Author, Journal, Publication, Spacegroup, elem_models
+from .cif_db_update import (CHUNK_SIZE, get_files, collect_cif_data, manager_add_coords_and_params_to_db,
+                            create_queue, create_graph_c, manager_upload_graphs_to_db,
+                            manager_upload_smiles_and_inchi_to_db)
+from .cif_db_update_modules._add_all_cif_data import add_all_cif_data
+from .cif_db_update_modules._bulk_add_to_db import (bulk_add_all_cif_data, bulk_add_coords_and_params_to_db,
+                                                    bulk_upload_graphs_to_db)
+
+# tables with rows created by the benchmark runs (removed after every run)
+CREATED_MODELS = [StructureCode, Publication, Journal, Author, Spacegroup] + elem_models
+
+
+def write_chunk(cif_blocks, graphs, bulk):
+    '''Write the chunk as cif_db_update does (without substructure filters), return the number of structures.'''
+    if bulk:
+        cif_blocks = bulk_add_all_cif_data(cif_blocks)
+        bulk_add_coords_and_params_to_db(cif_blocks)
+        bulk_upload_graphs_to_db({refcode: graphs[refcode] for refcode in cif_blocks if refcode in graphs})
+    else:
+        cif_blocks = add_all_cif_data(cif_blocks)
+        manager_add_coords_and_params_to_db(cif_blocks)
+        chunk_graphs = {refcode: graphs[refcode] for refcode in cif_blocks if refcode in graphs}
+        manager_upload_graphs_to_db(chunk_graphs)
+        manager_upload_smiles_and_inchi_to_db(chunk_graphs)
+    return len(cif_blocks)
+
+
+class Command(BaseCommand):
+    help = ('Compare the database write throughput of the default and the bulk (--bulk) cif_db_update modes. '
+            'The runs write to a throwaway database created by migrations, the working database is not changed.')
+
+    def handle(self, *args, **options):
+        files = get_files(options['paths'])
+        old_name = connection.settings_dict['NAME']
+        with TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+            else:
+                connection.settings_dict['TEST']['NAME'] = f'benchmark_{old_name}'
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.run_benchmark(files)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_benchmark(self, files):
+        '''Write the files by both modes, rows of the first run are removed before the second one.'''
+        graphs = dict()
+        results = dict()
+        for bulk in (False, True):
+            last_ids = {model: model.objects.aggregate(Max('id'))['id__max'] or 0 for model in CREATED_MODELS}
+            count = 0
+            elapsed = 0
+            try:
+                for i in range(0, len(files), CHUNK_SIZE):
+                    cif_blocks = dict()
+                    for file in files[i:i + CHUNK_SIZE]:
+                        collect_cif_data(file, cif_blocks, use_db=False)
+                    if not bulk:
+                        # graphs are generated once (they do not depend on the write mode)
+                        add_all_cif_data(dict(cif_blocks))
+                        manager_add_coords_and_params_to_db(cif_blocks)
+                        queue, refcodes_to_graph = create_queue(cif_blocks)
+                        graphs.update(create_graph_c(queue))
+                        self.remove_created_rows(last_ids)
+                    start = perf_counter()
+                    count += write_chunk(cif_blocks, graphs, bulk)
+                    elapsed += perf_counter() - start
+            finally:
+                self.remove_created_rows(last_ids)
+            results[bulk] = elapsed
+            self.stdout.write(
+                f'{"bulk" if bulk else "default":<10}{count:>8} structures{elapsed:>10.1f} s'
+                f'{count / max(elapsed, 1e-9):>10.1f} structures/s'
+            )
+        self.stdout.write(f'speedup {results[False] / max(results[True], 1e-9):.2f}')
+
+    @staticmethod
+    def remove_created_rows(last_ids):
+        for model, last_id in last_ids.items():
+            model.objects.filter(id__gt=last_id).delete()
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', type=str, help='Path to cif file(s) or directory path with cif files')
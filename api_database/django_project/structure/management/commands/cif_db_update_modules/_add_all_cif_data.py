@@ -35,6 +35,7 @@ from structure.models import (StructureCode, Author, Spacegroup, SYSTEMS,
 from django_project.loggers import all_cif_data_logger as logger_1
 import re
 from api.filters import get_reduced_cell
+from structure.search_text import update_text_index
 from math import cos, sqrt, radians
 from ._cifparser import add_cell_parms_with_error
 from ._cifparser import get_coords as get_cif_composition
@@ -128,71 +129,82 @@ journal = {
 }
 
 
-def add_refcode(cif_block, refcode):
+def get_refcode_values(cif_block) -> dict:
+    '''CCDC number and database flags of the structure from the cif block.'''
     data_in_cif = cif_block.keys()
-    struct_obj, created = StructureCode.objects.get_or_create(refcode=refcode)
-    logger_1.info(f'Refcode: {refcode}. Created new: {created}')
+    values = dict()
     if '_database_code_depnum_ccdc_archive' in data_in_cif:
         ccdc = re.findall(r'\d+', cif_block['_database_code_depnum_ccdc_archive'])[0]
-        struct_obj.CCDC_number = str(ccdc)
+        values['CCDC_number'] = str(ccdc)
     if '_database_code_icsd' in data_in_cif:
-        struct_obj.ICSD = True
+        values['ICSD'] = True
     elif '_cod_database_code' in data_in_cif:
-        struct_obj.COD = True
+        values['COD'] = True
+    return values
+
+
+def add_refcode(cif_block, refcode):
+    struct_obj, created = StructureCode.objects.get_or_create(refcode=refcode)
+    logger_1.info(f'Refcode: {refcode}. Created new: {created}')
+    for key, value in get_refcode_values(cif_block).items():
+        setattr(struct_obj, key, value)
     struct_obj.save()
     return struct_obj
 
 
+def get_author_names(cif_block, key='_publ_author_name') -> list:
+    '''Author names from the cif block loop (or the ";" separated value).'''
+    try:
+        authors = []
+        authors_temp = cif_block.GetLoop(key)
+        for author in authors_temp:
+            authors.append(author[0])
+    except:
+        if key in cif_block.keys():
+            authors = cif_block[key].split(';')
+        else:
+            return []
+    return authors
+
+
+def get_author_filter(author) -> dict:
+    '''Author lookup ({'family_name': ..., 'initials': ...}) from the author name of the cif file.'''
+    author = str(author).replace('\n', '')
+    author = author.replace('\r', '')
+    if author[0] in ['\'', '"']:
+        author = author[1:]
+    if author[-1] in ['\'', '"']:
+        author = author[:-1]
+    author_split = re.findall('[^, .]+', author)
+    if len(author) == 1:
+        return {'family_name': author_split[0]}
+    elif len(author) == 2:
+        if ',' in author:
+            family, initials = author_split
+        else:
+            family = author_split[-1]
+            initials = author.replace(family, '')
+    else:
+        if ',' in author:
+            family = author.split(',')[0]
+            initials = ' '.join(re.findall('[^, ]+', author)[1:])
+        else:
+            family = author_split[-1]
+            initials = author.replace(family, '')
+    return {'family_name': family, 'initials': initials}
+
+
 def add_author(cif_block, struct_obj, authors=None):
     if not authors:
-        try:
-            authors = []
-            authors_temp = cif_block.GetLoop('_publ_author_name')
-            for author in authors_temp:
-                authors.append(author[0])
-        except:
-            if '_publ_author_name' in cif_block.keys():
-                authors = cif_block['_publ_author_name'].split(';')
-            else:
-                return 0
+        authors = get_author_names(cif_block)
     # add to database
     for author in authors:
-        author = str(author).replace('\n', '')
-        author = author.replace('\r', '')
-        if author[0] in ['\'', '"']:
-            author = author[1:]
-        if author[-1] in ['\'', '"']:
-            author = author[:-1]
-        author_split = re.findall('[^, .]+', author)
-        if len(author) == 1:
-            check_author_in_db = Author.objects.filter(family_name=author_split[0])
-            if check_author_in_db.count() <= 1:
-                author_obj, created = Author.objects.get_or_create(family_name=author_split[0])
-            else:
-                author_obj = check_author_in_db[0]
-        elif len(author) == 2:
-            if ',' in author:
-                family, initials = author_split
-            else:
-                family = author_split[-1]
-                initials = author.replace(family, '')
-            check_author_in_db = Author.objects.filter(family_name=family, initials=initials)
-            if check_author_in_db.count() <= 1:
-                author_obj, created = Author.objects.get_or_create(family_name=family, initials=initials)
-            else:
-                author_obj = check_author_in_db[0]
+        author_filter = get_author_filter(author)
+        check_author_in_db = Author.objects.filter(**author_filter)
+        if check_author_in_db.count() <= 1:
+            author_obj, created = Author.objects.get_or_create(**author_filter)
         else:
-            if ',' in author:
-                family = author.split(',')[0]
-                initials = ' '.join(re.findall('[^, ]+', author)[1:])
-            else:
-                family = author_split[-1]
-                initials = author.replace(family, '')
-            check_author_in_db = Author.objects.filter(family_name=family, initials=initials)
-            if check_author_in_db.count() <= 1:
-                author_obj, created = Author.objects.get_or_create(family_name=family, initials=initials)
-            else:
-                author_obj = check_author_in_db[0]
+            author_obj = check_author_in_db[0]
         logger_1.info(f'Author: {author_obj}')
         struct_obj.authors.add(author_obj)
         return author_obj
@@ -337,7 +349,8 @@ def get_or_create_space_group(cif_block, return_only_symops=False):
     return space_group
 
 
-def add_cell(cif_block, space_group, struct_obj):
+def get_cell_values(cif_block, space_group) -> dict:
+    '''Unit cell parameters, centring and Z values of the cif block.'''
     data_in_cif = cif_block.keys()
     if {
         '_cell_length_a', '_cell_length_b', '_cell_length_c',
@@ -368,25 +381,32 @@ def add_cell(cif_block, space_group, struct_obj):
     else:
         logger_1.error('No Z value was found!')
         z_val = len(space_group.symops.split(';'))
-    cell, created = Cell.objects.get_or_create(
+    values = dict(
         a=float(a), b=float(b), c=float(c),
         al=float(al), be=float(be), ga=float(ga),
-        spacegroup=space_group, refcode=struct_obj,
-        centring=centring_id, zvalue=z_val
+        spacegroup=space_group, centring=centring_id, zvalue=z_val
     )
     if '_cell_formula_units_Z_prime' in data_in_cif:
-        z_prime = float(cif_block['_cell_formula_units_Z_prime'])
+        values['zprime'] = float(cif_block['_cell_formula_units_Z_prime'])
+    return values
+
+
+def add_cell(cif_block, space_group, struct_obj):
+    values = get_cell_values(cif_block, space_group)
+    z_prime = values.pop('zprime', None)
+    cell, created = Cell.objects.get_or_create(refcode=struct_obj, **values)
+    if z_prime is not None:
         cell.zprime = z_prime
         cell.save()
     if created:
         add_cell_parms_with_error([1, cif_block], struct_obj)
 
 
-def add_reduced_cell(struct_obj):
+def get_reduced_cell_values(cell) -> dict:
+    '''Rounded parameters and volume of the reduced cell of the unit cell (saved or not).'''
     centrings = dict((v, k) for v, k in CENTRINGS)
-    centring = centrings[struct_obj.cell.centring]
-    params = [struct_obj.cell.a, struct_obj.cell.b, struct_obj.cell.c,
-              struct_obj.cell.al, struct_obj.cell.be, struct_obj.cell.ga]
+    centring = centrings[cell.centring]
+    params = [cell.a, cell.b, cell.c, cell.al, cell.be, cell.ga]
     reduced_params = get_reduced_cell(params, centring)
     a, b, c, al, be, ga = reduced_params
     volume = (
@@ -394,78 +414,90 @@ def add_reduced_cell(struct_obj):
             cos(radians(ga)) - cos(radians(al)) ** 2 -
             cos(radians(be)) ** 2 - cos(radians(ga)) ** 2)
     )
-    rc, created = ReducedCell.objects.get_or_create(
-        refcode=struct_obj,
+    return dict(
         a=round(a, 3), b=round(b, 3), c=round(c, 3),
         al=round(al, 3), be=round(be, 3), ga=round(ga, 3),
         volume=round(volume, 3),
     )
 
 
-def add_journal_and_publication(cif_block, struct_obj):
+def add_reduced_cell(struct_obj):
+    rc, created = ReducedCell.objects.get_or_create(refcode=struct_obj, **get_reduced_cell_values(struct_obj.cell))
 
-    def add_authors_and_get_flag():
-        for author in authors:
-            author_obj = add_author(cif_block[1], struct_obj, authors=[author, ])
-            if created:
-                pub_obj.authors.add(author_obj)
-            if author_obj in pub_obj.authors.all():
-                continue
-            else:
-                return False
-        return True
 
+def get_journal_filter(cif_block) -> dict:
+    '''Journal lookup ({'name': ..., 'fullname': ...}) from the cif block.'''
     filtr_j = dict()
     for key, values in journal.items():
         for data_key in values:
-            if data_key in cif_block[1].keys():
+            if data_key in cif_block.keys():
                 if data_key == '_citation_journal_abbrev':
-                    citation = cif_block[1].GetLoop('_citation_journal_abbrev')
+                    citation = cif_block.GetLoop('_citation_journal_abbrev')
                     value = citation['_citation_journal_abbrev'][0]
                 else:
-                    value = cif_block[1][data_key]
+                    value = cif_block[data_key]
                 if value:
                     if key == 'name':
                         filtr_j['name'] = value
                     elif key == 'fullname':
                         filtr_j['fullname'] = value
+    return filtr_j
+
+
+def get_or_create_journal(filtr_j):
+    '''Journal object of the lookup (None if there are several journals).'''
     j_obj = Journal.objects.filter(**filtr_j)
-    filtr = dict()
     if j_obj.count() == 1:
-        journal_obj = j_obj[0]
-        filtr['journal'] = journal_obj
+        return j_obj[0]
     elif j_obj.count() == 0:
-        journal_obj = Journal.objects.create(**filtr_j)
-        filtr['journal'] = journal_obj
-    # publication
-    year = 0
-    doi = ''
-    if '_journal_year' in cif_block[1].keys():
-        year = int(cif_block[1]['_journal_year'])
-        filtr['year'] = year
-    if '_journal_page_first' in cif_block[1].keys():
-        page = cif_block[1]['_journal_page_first']
-        filtr['page'] = page
-    if '_journal_volume' in cif_block[1].keys():
-        volume = cif_block[1]['_journal_volume']
-        filtr['volume'] = volume
-    if '_journal_doi' in cif_block[1].keys():
-        doi = cif_block[1]['_journal_doi']
-        filtr['doi'] = doi
-    if '_citation_year' in cif_block[1].keys():
-        citation = cif_block[1].GetLoop('_citation_year')
+        return Journal.objects.create(**filtr_j)
+
+
+def get_publication_filter(cif_block) -> dict:
+    '''Publication lookup (year, page, volume and doi) from the cif block.'''
+    filtr = dict()
+    if '_journal_year' in cif_block.keys():
+        filtr['year'] = int(cif_block['_journal_year'])
+    if '_journal_page_first' in cif_block.keys():
+        filtr['page'] = cif_block['_journal_page_first']
+    if '_journal_volume' in cif_block.keys():
+        filtr['volume'] = cif_block['_journal_volume']
+    if '_journal_doi' in cif_block.keys():
+        filtr['doi'] = cif_block['_journal_doi']
+    if '_citation_year' in cif_block.keys():
+        citation = cif_block.GetLoop('_citation_year')
         citation_keys = citation.GetItemOrder()
-        year = int(citation['_citation_year'][0])
-        filtr['year'] = year
+        filtr['year'] = int(citation['_citation_year'][0])
         if '_citation_doi' in citation_keys:
-            doi = citation['_citation_doi'][0]
-            filtr['doi'] = doi
+            filtr['doi'] = citation['_citation_doi'][0]
         if '_citation_journal_volume' in citation_keys:
-            volume = citation['_citation_journal_volume'][0]
-            filtr['volume'] = volume
+            filtr['volume'] = citation['_citation_journal_volume'][0]
         if '_citation_page_first' in citation_keys:
-            page = citation['_citation_page_first'][0]
-            filtr['page'] = page
+            filtr['page'] = citation['_citation_page_first'][0]
+    return filtr
+
+
+def add_journal_and_publication(cif_block, struct_obj):
+
+    def add_authors_and_get_flag():
+        for author in authors:
+            author_obj = add_author(cif_block[1], struct_obj, authors=[author, ])
+            if created:
+                pub_obj.authors.add(author_obj)
+            if author_obj in pub_obj.authors.all():
+                continue
+            else:
+                return False
+        return True
+
+    filtr = dict()
+    journal_obj = get_or_create_journal(get_journal_filter(cif_block[1]))
+    if journal_obj:
+        filtr['journal'] = journal_obj
+    # publication
+    filtr.update(get_publication_filter(cif_block[1]))
+    year = filtr.get('year', 0)
+    doi = filtr.get('doi', '')
     # filter is_null
     filtr_is_null = dict()
     for key in ['journal', 'page', 'volume', 'doi']:
@@ -481,14 +513,8 @@ def add_journal_and_publication(cif_block, struct_obj):
     else:
         return 0
     # authors
-    authors = []
-    if '_publ_author_name' in cif_block[1].keys():
-        try:
-            authors_temp = cif_block[1].GetLoop('_publ_author_name')
-            for author in authors_temp:
-                authors.append(author[0])
-        except:
-            authors = cif_block[1]['_publ_author_name'].split(';')
+    authors = get_author_names(cif_block[1])
+    if authors:
         add_authors_and_get_flag()
     if '_citation_author_name' in cif_block[1].keys():
         try:
@@ -502,116 +528,119 @@ def add_journal_and_publication(cif_block, struct_obj):
     ref_pub_obj.save()
 
 
-def add_element_composition(cif_block, struct_obj):
-    '''Must be call after add_formula function!!!'''
-    if Formula.objects.filter(refcode=struct_obj).exists():
-        formula_sum = struct_obj.formula.formula_sum
-        formula_moiety = struct_obj.formula.formula_moiety
-        elements_from_formula = dict()
-        if formula_sum:
-            elements = formula_sum.split()
-            for element in elements:
-                atom_type = re.findall(r'[A-Za-z]{1,3}', element)[0]
-                count = re.findall(r'\d+', element)
-                if count:
-                    count = float(count[0])
-                else:
-                    count = 1
-                elements_from_formula[atom_type] = count
-            el_manager, created = ElementsManager.objects.get_or_create(refcode=struct_obj)
-            el_manager.save_elements(elements_from_formula)
-            return 0
-        elif formula_moiety:
-            moiety_formula = dict()
-            mols = formula_moiety.split(',')
-            for mol in mols:
-                not_splited = False
-                if '(' in mol:
-                    multipl = re.findall(r'^\d+', mol)
-                    if multipl and mol.startswith(multipl[0] + '('):
-                        multipl_coof = float(multipl[0])
-                    elif mol.startswith('('):
-                        multipl = re.findall(r'[)]\d+', mol)
-                        if multipl and mol.endswith(multipl[0]):
-                            multipl_coof = float(multipl[0].replace(')', ''))
-                        elif mol.startswith('(') and mol.endswith(')'):
-                            multipl_coof = 1
-                        else:
-                            not_splited = True
+def get_formula_elements(formula_sum, formula_moiety) -> dict:
+    '''Elements with their numbers {'element': count, ...} from the formula sum (or the formula moiety).'''
+    elements_from_formula = dict()
+    if formula_sum:
+        elements = formula_sum.split()
+        for element in elements:
+            atom_type = re.findall(r'[A-Za-z]{1,3}', element)[0]
+            count = re.findall(r'\d+', element)
+            if count:
+                count = float(count[0])
+            else:
+                count = 1
+            elements_from_formula[atom_type] = count
+        return elements_from_formula
+    elif formula_moiety:
+        moiety_formula = dict()
+        mols = formula_moiety.split(',')
+        for mol in mols:
+            not_splited = False
+            if '(' in mol:
+                multipl = re.findall(r'^\d+', mol)
+                if multipl and mol.startswith(multipl[0] + '('):
+                    multipl_coof = float(multipl[0])
+                elif mol.startswith('('):
+                    multipl = re.findall(r'[)]\d+', mol)
+                    if multipl and mol.endswith(multipl[0]):
+                        multipl_coof = float(multipl[0].replace(')', ''))
+                    elif mol.startswith('(') and mol.endswith(')'):
+                        multipl_coof = 1
                     else:
                         not_splited = True
-                    if not not_splited:
-                        mol = mol.split('(')[1].split(')')[0].split()
-                        for item in mol:
-                            if re.search(r'[A-Za-z]', item):
-                                atom_type = re.findall(r'[A-Za-z]{1,3}', item)[0]
-                                count = re.findall(r'\d+', item)
-                                if count:
-                                    count = float(count[0])
-                                else:
-                                    count = 1
-                                if atom_type in moiety_formula.keys():
-                                    moiety_formula[atom_type] += count * multipl_coof
-                                else:
-                                    moiety_formula[atom_type] = count * multipl_coof
-                elif not not_splited:
-                    if re.search(r'[A-Za-z]', mol):
-                        atom_type = re.findall(r'[A-Za-z]{1,3}', mol)[0]
-                        count = re.findall(r'\d+', mol)
-                        if count:
-                            count = float(count[0])
-                        else:
-                            count = 1
-                        if atom_type in moiety_formula.keys():
-                            moiety_formula[atom_type] += count
-                        else:
-                            moiety_formula[atom_type] = count
-                if not_splited:
-                    mol = mol.split()
+                else:
+                    not_splited = True
+                if not not_splited:
+                    mol = mol.split('(')[1].split(')')[0].split()
                     for item in mol:
-                        if '(' in item:
-                            multipl = re.findall(r'^\d+', item)
-                            if multipl and item.startswith(multipl[0] + '('):
-                                multipl_coof = float(multipl[0])
-                            elif item.startswith('('):
-                                multipl = re.findall(r'[)]\d+', item)
-                                if multipl and item.endswith(multipl[0]):
-                                    multipl_coof = float(multipl[0].replace(')', ''))
-                                elif item.startswith('(') and item.endswith(')'):
-                                    multipl_coof = 1
-                                else:
-                                    continue
+                        if re.search(r'[A-Za-z]', item):
+                            atom_type = re.findall(r'[A-Za-z]{1,3}', item)[0]
+                            count = re.findall(r'\d+', item)
+                            if count:
+                                count = float(count[0])
+                            else:
+                                count = 1
+                            if atom_type in moiety_formula.keys():
+                                moiety_formula[atom_type] += count * multipl_coof
+                            else:
+                                moiety_formula[atom_type] = count * multipl_coof
+            elif not not_splited:
+                if re.search(r'[A-Za-z]', mol):
+                    atom_type = re.findall(r'[A-Za-z]{1,3}', mol)[0]
+                    count = re.findall(r'\d+', mol)
+                    if count:
+                        count = float(count[0])
+                    else:
+                        count = 1
+                    if atom_type in moiety_formula.keys():
+                        moiety_formula[atom_type] += count
+                    else:
+                        moiety_formula[atom_type] = count
+            if not_splited:
+                mol = mol.split()
+                for item in mol:
+                    if '(' in item:
+                        multipl = re.findall(r'^\d+', item)
+                        if multipl and item.startswith(multipl[0] + '('):
+                            multipl_coof = float(multipl[0])
+                        elif item.startswith('('):
+                            multipl = re.findall(r'[)]\d+', item)
+                            if multipl and item.endswith(multipl[0]):
+                                multipl_coof = float(multipl[0].replace(')', ''))
+                            elif item.startswith('(') and item.endswith(')'):
+                                multipl_coof = 1
                             else:
                                 continue
-                            item = item.split('(')[1].split(')')[0].split()
-                            for elem in item:
-                                if re.search(r'[A-Za-z]', elem):
-                                    atom_type = re.findall(r'[A-Za-z]{1,3}', elem)[0]
-                                    count = re.findall(r'\d+', elem)
-                                    if count:
-                                        count = float(count[0])
-                                    else:
-                                        count = 1
-                                    if atom_type in moiety_formula.keys():
-                                        moiety_formula[atom_type] += count * multipl_coof
-                                    else:
-                                        moiety_formula[atom_type] = count * multipl_coof
                         else:
-                            if re.search(r'[A-Za-z]', item):
-                                atom_type = re.findall(r'[A-Za-z]{1,3}', item)[0]
-                                count = re.findall(r'\d+', item)
+                            continue
+                        item = item.split('(')[1].split(')')[0].split()
+                        for elem in item:
+                            if re.search(r'[A-Za-z]', elem):
+                                atom_type = re.findall(r'[A-Za-z]{1,3}', elem)[0]
+                                count = re.findall(r'\d+', elem)
                                 if count:
                                     count = float(count[0])
                                 else:
                                     count = 1
                                 if atom_type in moiety_formula.keys():
-                                    moiety_formula[atom_type] += count
+                                    moiety_formula[atom_type] += count * multipl_coof
                                 else:
-                                    moiety_formula[atom_type] = count
-            if moiety_formula:
-                el_manager, created = ElementsManager.objects.get_or_create(refcode=struct_obj)
-                el_manager.save_elements(moiety_formula)
-                return 0
+                                    moiety_formula[atom_type] = count * multipl_coof
+                    else:
+                        if re.search(r'[A-Za-z]', item):
+                            atom_type = re.findall(r'[A-Za-z]{1,3}', item)[0]
+                            count = re.findall(r'\d+', item)
+                            if count:
+                                count = float(count[0])
+                            else:
+                                count = 1
+                            if atom_type in moiety_formula.keys():
+                                moiety_formula[atom_type] += count
+                            else:
+                                moiety_formula[atom_type] = count
+        return moiety_formula
+    return dict()
+
+
+def add_element_composition(cif_block, struct_obj):
+    '''Must be call after add_formula function!!!'''
+    if Formula.objects.filter(refcode=struct_obj).exists():
+        elements = get_formula_elements(struct_obj.formula.formula_sum, struct_obj.formula.formula_moiety)
+        if elements:
+            el_manager, created = ElementsManager.objects.get_or_create(refcode=struct_obj)
+            el_manager.save_elements(elements)
+            return 0
     logger_1.warning(
         f'Any chemcal composition was not found\n'
         f'or formula sum and formula moiety have invalid format\n'
@@ -620,8 +649,9 @@ def add_element_composition(cif_block, struct_obj):
     return 1
 
 
-def add_universal(model, refcode_obj, cif_block, iucr_dict):
-    obj_obj, created = model.objects.get_or_create(refcode=refcode_obj)
+def get_universal_values(cif_block, iucr_dict) -> dict:
+    '''Field values {'field': value, ...} of the iucr_dict fields found in the cif block.'''
+    fields_values = dict()
     for key, values in iucr_dict.items():
         for data_key in values:
             # try to set values
@@ -669,10 +699,17 @@ def add_universal(model, refcode_obj, cif_block, iucr_dict):
                     if key in ['r_factor', 'wR_factor', 'gof']:
                         value = float(value) * 100
                     if value and value not in ['?', 'none']:
-                        setattr(obj_obj, key, value)
+                        fields_values[key] = value
                         break
             except Exception:
                 continue
+    return fields_values
+
+
+def add_universal(model, refcode_obj, cif_block, iucr_dict):
+    obj_obj, created = model.objects.get_or_create(refcode=refcode_obj)
+    for key, value in get_universal_values(cif_block, iucr_dict).items():
+        setattr(obj_obj, key, value)
     # if problems with attr values (first of all for COD structures)
     try:
         obj_obj.save()
@@ -740,6 +777,8 @@ def add_all_cif_data(cifs: dict):
                 add_element_composition(cif_block, struct_obj)
             except Exception as err:
                 raise Exception(str(err))
+            logger_1.info(f'Update full-text index')
+            update_text_index([struct_obj.id])
             logger_1.info(f'Information addition from {refcode} is completed successfully!')
         except Exception as err:
             message = f'Caught an exception for structure {refcode}\n{err}'
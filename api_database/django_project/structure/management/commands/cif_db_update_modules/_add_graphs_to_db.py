@@ -26,18 +26,53 @@
 #
 # *****************************************************************************************
 
-from structure.models import CoordinatesBlock
+from structure.models import CoordinatesBlock, ComponentHash
 from django_project.loggers import add_graphs_to_db_logger
+from modules.graph_pack.graph_pack import pack_graph
+from modules.graph_pack.fingerprint import get_fingerprint
+from modules.graph_pack.graph_hash import set_graph_hashes
+from api.query_planner import count_atoms_change
 
 
 def add_string_graph_to_db(graphs, refcode):
-    add_graphs_to_db_logger.info(f'Write a graph string to the database')
+    '''Save the graph and return the change of atom statistics (see api/query_planner.py).'''
+    add_graphs_to_db_logger.info(f'Write a graph to the database')
     coord_block = CoordinatesBlock.objects.get(refcode=refcode)
-    graphs = str(refcode.id) + ' ' + graphs
-    coord_block.graph = graphs
+    old_graph = coord_block.packed_graph
+    coord_block.packed_graph = pack_graph(refcode.id, graphs)
+    coord_block.fingerprint = get_fingerprint(coord_block.packed_graph)
+    set_graph_hashes(coord_block, ComponentHash)
     coord_block.save()
+    return count_atoms_change(old_graph, coord_block.packed_graph)
 
 
 def upload_graphs_to_db(graph, structure_in_db):
-    add_string_graph_to_db(graph['graph_str'], structure_in_db)
+    atom_statistics = add_string_graph_to_db(graph['graph_str'], structure_in_db)
     add_graphs_to_db_logger.info(f'Structure {structure_in_db} successfully added to the database')
+    return atom_statistics
+
+
+def get_inchi_values(inchi_string: str) -> dict:
+    '''InChI model field values of the InChI string split into layers.'''
+    inchi = inchi_string.split('=')[1].split('/')
+    values = {'version': inchi[0], 'formula': inchi[1]}
+    for item in inchi[2:]:
+        if item.startswith('c'):
+            values['connectivity'] = item
+        elif item.startswith('h'):
+            values['hydrogens'] = item
+        elif item.startswith('q'):
+            values['q_charge'] = item
+        elif item.startswith('p'):
+            values['p_charge'] = item
+        elif item.startswith('b'):
+            values['b_stereo'] = item
+        elif item.startswith('t'):
+            values['t_stereo'] = item
+        elif item.startswith('m'):
+            values['m_stereo'] = item
+        elif item.startswith('s'):
+            values['s_stereo'] = item
+        elif item.startswith('i'):
+            values['i_isotopic'] = item
+    return values
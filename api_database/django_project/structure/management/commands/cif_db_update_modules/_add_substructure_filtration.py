@@ -27,7 +27,7 @@
 # *****************************************************************************************
 
 from structure.models import (
-    Substructure1, Substructure2, CoordinatesBlock, StructureCode,
+    Substructure1, Substructure2, CoordinatesBlock,
     ElementsSet1, ElementsSet2, ElementsSet3, ElementsSet4, ElementsSet5,
     ElementsSet6, ElementsSet7, ElementsSet8
 )
@@ -91,13 +91,13 @@ def reset_old_data_or_create(refcode):
     fields_substr1.remove('id')
     fields_substr1.remove('refcode')
     set_substr1 = dict.fromkeys(fields_substr1, False)
-    Substructure1.objects.update_or_create(refcode__refcode=refcode, defaults=set_substr1)
+    Substructure1.objects.update_or_create(refcode=refcode, defaults=set_substr1)
     # reset substructure2 model objects
     fields_substr2 = get_fields_list(Substructure2)
     fields_substr2.remove('id')
     fields_substr2.remove('refcode')
     set_substr2 = dict.fromkeys(fields_substr2, False)
-    Substructure2.objects.update_or_create(refcode__refcode=refcode, defaults=set_substr2)
+    Substructure2.objects.update_or_create(refcode=refcode, defaults=set_substr2)
 
 
 def set_only_CHNO(graphs, substructure_obj=Substructure1, filter_template='refcode__elements__element_set'):
@@ -152,17 +152,19 @@ def set_elements(
         substr.save()
 
 
-def start_dll_and_write(
-        template_graph, analyse_data,
-        NUM_OF_PROC, attr_name,
-        obj_to_save, struct_obj=StructureCode
-):
-    output = cpplib.SearchMain(template_graph, list(analyse_data), NUM_OF_PROC, False)
-    for elem in output:
-        refcode = struct_obj.objects.get(id=elem)
-        substr, created = obj_to_save.objects.get_or_create(refcode=refcode)
-        setattr(substr, attr_name, True)
-        substr.save()
+def start_dll_and_write(analyse_data, NUM_OF_PROC, models):
+    '''Search all TEMPLATES in one pass over the graphs and set the found substructure flags.'''
+    attr_names = list(TEMPLATES.keys())
+    outputs = cpplib.SearchBatchPacked(
+        [TEMPLATES[attr_name][0] for attr_name in attr_names], list(analyse_data), NUM_OF_PROC, False
+    )
+    found = dict()
+    for attr_name, output in zip(attr_names, outputs):
+        obj_name = TEMPLATES[attr_name][1]
+        for structure_id in output:
+            found.setdefault((obj_name, structure_id), dict())[attr_name] = True
+    for (obj_name, structure_id), flags in found.items():
+        models[obj_name].objects.update_or_create(refcode_id=structure_id, defaults=flags)
 
 
 def add_substructure_filters(refcodes, NUM_OF_PROC=1):
@@ -176,11 +178,9 @@ def add_substructure_filters(refcodes, NUM_OF_PROC=1):
     substructure_logger.info('Add substructure filtration...')
     models = {'Substructure1': Substructure1,
               'Substructure2': Substructure2}
-    analyse_data = structures.values_list('graph', flat=True)
+    analyse_data = structures.filter(packed_graph__isnull=False).values_list('packed_graph', flat=True)
     if analyse_data:
-        for attr_name, data in TEMPLATES.items():
-            template_graph, obj_name = data
-            start_dll_and_write(template_graph, analyse_data, NUM_OF_PROC, attr_name, models[obj_name])
+        start_dll_and_write(analyse_data, NUM_OF_PROC, models)
 
     substructure_logger.info('Add element filtration...')
     # set_only_CHNO(structures)
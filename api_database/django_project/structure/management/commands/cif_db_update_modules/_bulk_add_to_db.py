@@ -0,0 +1,419 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from django.db import transaction
+from structure.models import (StructureCode, Author, Cell, ReducedCell, Publication, RefcodePublicationConnection,
+                              CompoundName, ExperimentalInfo, RefinementInfo, CrystalAndStructureInfo, Formula,
+                              ElementsManager, CoordinatesBlock, Other, InChI, ComponentHash, elem_models,
+                              get_elements_mask, get_composition)
+from django_project.loggers import all_cif_data_logger as logger_1
+from django_project.loggers import add_graphs_to_db_logger
+from structure.search_text import update_text_index
+from api.query_planner import count_atoms_change, add_atom_statistics
+from modules.graph_pack.graph_pack import pack_graph
+from modules.graph_pack.fingerprint import get_fingerprint
+from modules.graph_pack.graph_hash import get_component_hashes, get_structure_hash
+from ._add_all_cif_data import (compound_names, experimental_info, refinement_info, crystal_and_structure_info,
+                                formula, get_refcode_values, get_author_names, get_author_filter,
+                                get_or_create_space_group, get_cell_values, get_reduced_cell_values,
+                                get_journal_filter, get_or_create_journal, get_publication_filter,
+                                get_formula_elements, get_universal_values)
+from ._cifparser import has_coords, get_coords, get_other_values, get_cell_parms_with_error
+from ._add_graphs_to_db import get_inchi_values
+from collections import Counter
+from typing import Dict
+
+BATCH_SIZE = 500  # number of rows in one INSERT/UPDATE query
+UNIVERSAL_MODELS = (
+    (CompoundName, compound_names),
+    (ExperimentalInfo, experimental_info),
+    (RefinementInfo, refinement_info),
+    (CrystalAndStructureInfo, crystal_and_structure_info),
+    (Formula, formula),
+)
+# cif data which defines the space group object (see get_or_create_space_group)
+SPACE_GROUP_KEYS = (
+    '_space_group_it_number', '_symmetry_int_tables_number', '_symmetry_space_group_name_h-m',
+    '_space_group_name_h-m_alt', '_space_group_crystal_system', '_symmetry_cell_setting',
+    '_symmetry_space_group_name_hall', '_space_group_name_hall',
+)
+CELL_ERROR_FIELDS = ('a_err', 'b_err', 'c_err', 'al_err', 'be_err', 'ga_err')
+REDUCED_CELL_FIELDS = ('a', 'b', 'c', 'al', 'be', 'ga', 'volume')
+
+
+def get_batches(items: list):
+    for i in range(0, len(items), BATCH_SIZE):
+        yield items[i:i + BATCH_SIZE]
+
+
+def get_structure_ids(refcodes: list, values: Dict[str, dict] = None) -> Dict[str, int]:
+    '''
+    Return {refcode: structure id}, absent structures are created;
+    values: {refcode: {field: value, ...}} to set to the structures
+    '''
+    if values is None:
+        values = dict()
+    structures = StructureCode.objects.in_bulk(refcodes, field_name='refcode')
+    new_structures = [
+        StructureCode(refcode=refcode, **values.get(refcode, dict()))
+        for refcode in refcodes if refcode not in structures
+    ]
+    updated_structures, fields = [], set()
+    for refcode, structure in structures.items():
+        if values.get(refcode):
+            for key, value in values[refcode].items():
+                setattr(structure, key, value)
+            updated_structures.append(structure)
+            fields.update(values[refcode])
+    StructureCode.objects.bulk_create(new_structures, batch_size=BATCH_SIZE)
+    if updated_structures:
+        StructureCode.objects.bulk_update(updated_structures, fields, batch_size=BATCH_SIZE)
+    if new_structures:
+        structures.update(StructureCode.objects.only('id', 'refcode').in_bulk(
+            [structure.refcode for structure in new_structures], field_name='refcode'
+        ))
+    return {refcode: structure.id for refcode, structure in structures.items()}
+
+
+def get_related_objects(model, structure_ids) -> dict:
+    '''Return {structure id: object} of the model rows of the structures (one per structure).'''
+    objects = dict()
+    for batch in get_batches(list(structure_ids)):
+        for obj in model.objects.filter(refcode_id__in=batch):
+            objects[obj.refcode_id] = obj
+    return objects
+
+
+def bulk_save_values(model, values: Dict[int, dict]):
+    '''
+    Create or update one-to-one rows of the structures by values = {structure id: {field: value, ...}}
+    (get_or_create and save of every row, but with a few queries for all of them)
+    '''
+    objects = get_related_objects(model, values.keys())
+    new_objects, updated_objects, fields = [], [], set()
+    for structure_id, obj_values in values.items():
+        obj = objects.get(structure_id)
+        if obj is None:
+            new_objects.append(model(refcode_id=structure_id, **obj_values))
+        elif obj_values:
+            for key, value in obj_values.items():
+                setattr(obj, key, value)
+            updated_objects.append(obj)
+            fields.update(obj_values)
+    model.objects.bulk_create(new_objects, batch_size=BATCH_SIZE)
+    if updated_objects:
+        model.objects.bulk_update(updated_objects, fields, batch_size=BATCH_SIZE)
+
+
+def get_valid_values(model, values: dict) -> dict:
+    '''Values without the ones the model fields can not save (add_universal drops them on save errors).'''
+    valid_values = dict()
+    for key, value in values.items():
+        try:
+            model._meta.get_field(key).get_prep_value(value)
+        except Exception:
+            continue
+        valid_values[key] = value
+    return valid_values
+
+
+def get_cif_data(cif_block, space_groups: dict) -> dict:
+    '''
+    Parse the cif block as add_all_cif_data does without writing to the database
+    (except new space groups and journals); space_groups: cache of space group objects
+    '''
+    block = cif_block[1]
+    data = {'structure': get_refcode_values(block), 'authors': [], 'publication': None}
+    try:
+        data['authors'] = [get_author_filter(author) for author in get_author_names(block)]
+    except Exception:
+        pass
+    space_group_key = tuple(str(block[key]) if key in block.keys() else None for key in SPACE_GROUP_KEYS)
+    if space_group_key not in space_groups:
+        space_groups[space_group_key] = get_or_create_space_group(block)
+    data[Cell] = get_cell_values(block, space_groups[space_group_key])
+    data[Cell].update(get_cell_parms_with_error(cif_block))
+    data[ReducedCell] = get_reduced_cell_values(Cell(**data[Cell]))
+    for model, iucr_dict in UNIVERSAL_MODELS:
+        try:
+            data[model] = get_valid_values(model, get_universal_values(cif_block, iucr_dict))
+        except Exception:
+            data[model] = dict()
+    try:
+        publication = get_publication_filter(block)
+        if publication.get('year'):
+            data['publication'] = (get_journal_filter(block), publication)
+    except Exception:
+        pass
+    if data['publication']:
+        try:
+            data['authors'] += [
+                get_author_filter(author) for author in get_author_names(block, '_citation_author_name')
+            ]
+        except Exception:
+            pass
+    data['elements'] = get_formula_elements(data[Formula].get('formula_sum'), data[Formula].get('formula_moiety'))
+    return data
+
+
+def get_authors(author_filters: list) -> dict:
+    '''Return {author key: author id} of the author lookups, absent authors are created.'''
+
+    def load_authors():
+        authors = dict()
+        for batch in get_batches(list(families)):
+            for author in Author.objects.filter(family_name__in=batch).order_by('id'):
+                authors.setdefault((('family_name', author.family_name), ), author.id)
+                authors.setdefault((('family_name', author.family_name), ('initials', author.initials)), author.id)
+        return authors
+
+    keys = {get_author_key(author_filter) for author_filter in author_filters}
+    families = {dict(key)['family_name'] for key in keys}
+    authors = load_authors()
+    new_authors = [Author(**dict(key)) for key in keys if key not in authors]
+    if new_authors:
+        Author.objects.bulk_create(new_authors, batch_size=BATCH_SIZE)
+        authors = load_authors()
+    return authors
+
+
+def get_author_key(author_filter: dict) -> tuple:
+    return tuple(sorted(author_filter.items()))
+
+
+def add_authors(cifs_data: dict, structure_ids: dict):
+    authors = get_authors([author for data in cifs_data.values() for author in data['authors']])
+    links = {
+        (structure_ids[refcode], authors[get_author_key(author)])
+        for refcode, data in cifs_data.items() for author in data['authors']
+    }
+    StructureCode.authors.through.objects.bulk_create(
+        [StructureCode.authors.through(structurecode_id=structure_id, author_id=author_id)
+         for structure_id, author_id in links],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    return authors
+
+
+def add_publications(cifs_data: dict, structure_ids: dict, authors: dict):
+    '''Journals, publications (new ones with their authors) and refcode-publication connections.'''
+    journals, publications, new_publications = dict(), dict(), dict()
+    lookups = dict()
+    for refcode, data in cifs_data.items():
+        if not data['publication']:
+            continue
+        journal_filter, lookup = data['publication']
+        journal_key = tuple(sorted(journal_filter.items()))
+        if journal_key not in journals:
+            journals[journal_key] = get_or_create_journal(journal_filter)
+        lookup = dict(lookup)
+        if journals[journal_key]:
+            lookup['journal'] = journals[journal_key]
+        lookups[refcode] = lookup
+    # publications with doi
+    dois = list({lookup['doi'] for lookup in lookups.values() if lookup.get('doi')})
+    publications.update(Publication.objects.in_bulk(dois, field_name='doi'))
+    for lookup in lookups.values():
+        if lookup.get('doi') and lookup['doi'] not in publications and lookup['doi'] not in new_publications:
+            new_publications[lookup['doi']] = Publication(**lookup)
+    Publication.objects.bulk_create(new_publications.values(), batch_size=BATCH_SIZE)
+    if new_publications:
+        publications.update(Publication.objects.in_bulk(list(new_publications), field_name='doi'))
+    created_ids = {publications[doi].id for doi in new_publications}
+    # publications without doi
+    for lookup in lookups.values():
+        if not lookup.get('doi'):
+            key = tuple(sorted((key, str(value)) for key, value in lookup.items()))
+            if key not in publications:
+                isnull_filter = {
+                    f'{field}__isnull': True for field in ['journal', 'page', 'volume', 'doi'] if field not in lookup
+                }
+                publications[key], created = Publication.objects.filter(**isnull_filter).get_or_create(**lookup)
+                if created:
+                    created_ids.add(publications[key].id)
+            lookup['publication'] = publications[key]
+    connections, links = dict(), set()
+    for refcode, lookup in lookups.items():
+        publication = lookup['publication'] if 'publication' in lookup else publications[lookup['doi']]
+        connections[structure_ids[refcode]] = {'publication': publication}
+        if publication.id in created_ids:
+            for author in cifs_data[refcode]['authors']:
+                links.add((publication.id, authors[get_author_key(author)]))
+    bulk_save_values(RefcodePublicationConnection, connections)
+    Publication.authors.through.objects.bulk_create(
+        [Publication.authors.through(publication_id=publication_id, author_id=author_id)
+         for publication_id, author_id in links],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def add_reduced_cells(reduced_cells: Dict[int, dict]):
+    '''Create reduced cells which the structures do not have yet (get_or_create of every row).'''
+    existing = set()
+    for batch in get_batches(list(reduced_cells)):
+        existing.update(
+            ReducedCell.objects.filter(refcode_id__in=batch).values_list('refcode_id', *REDUCED_CELL_FIELDS)
+        )
+    ReducedCell.objects.bulk_create(
+        [ReducedCell(refcode_id=structure_id, **values) for structure_id, values in reduced_cells.items()
+         if (structure_id, *(values[field] for field in REDUCED_CELL_FIELDS)) not in existing],
+        batch_size=BATCH_SIZE
+    )
+
+
+def add_element_compositions(cifs_data: dict, structure_ids: dict):
+    '''ElementsManager rows, elements masks and compositions of the structures (see save_elements).'''
+    element_sets, managers, structures = dict(), dict(), []
+    for refcode, data in cifs_data.items():
+        if not data['elements']:
+            logger_1.warning(f'Any chemcal composition was not found for structure {refcode}!')
+            continue
+        values = dict()
+        for key, (counts, isnull_filter) in ElementsManager.get_elements_queries(data['elements']).items():
+            set_key = (key, tuple(sorted(counts.items())))
+            if set_key not in element_sets:
+                element_sets[set_key], created = elem_models[key].objects.filter(
+                    **isnull_filter
+                ).get_or_create(**counts)
+            values[f'element_set_{key + 1}'] = element_sets[set_key]
+        managers[structure_ids[refcode]] = values
+        elements_mask_1, elements_mask_2 = get_elements_mask(data['elements'])
+        structures.append(StructureCode(
+            id=structure_ids[refcode],
+            elements_mask_1=elements_mask_1,
+            elements_mask_2=elements_mask_2,
+            composition=get_composition(data['elements'])
+        ))
+    bulk_save_values(ElementsManager, managers)
+    StructureCode.objects.bulk_update(
+        structures, ['elements_mask_1', 'elements_mask_2', 'composition'], batch_size=BATCH_SIZE
+    )
+
+
+def bulk_add_all_cif_data(cifs: dict):
+    '''
+    Bulk version of add_all_cif_data: all cif blocks are parsed first,
+    then every table is written by bulk queries in one transaction
+    '''
+    cif_blocks = cifs.copy()
+    cifs_data = dict()
+    space_groups = dict()
+    for refcode, cif_block in cifs.items():
+        try:
+            cifs_data[refcode] = get_cif_data(cif_block, space_groups)
+        except Exception as err:
+            logger_1.error(f'Caught an exception for structure {refcode}\n{err}')
+            cif_blocks.pop(refcode)
+            # if only 1 structure was upload raise error
+            if len(cifs) == 1:
+                raise Exception(err)
+    with transaction.atomic():
+        structure_ids = get_structure_ids(
+            list(cifs_data), {refcode: data['structure'] for refcode, data in cifs_data.items()}
+        )
+        authors = add_authors(cifs_data, structure_ids)
+        for model in [Cell] + [model for model, iucr_dict in UNIVERSAL_MODELS]:
+            bulk_save_values(model, {structure_ids[refcode]: data[model] for refcode, data in cifs_data.items()})
+        add_reduced_cells({structure_ids[refcode]: data[ReducedCell] for refcode, data in cifs_data.items()})
+        add_publications(cifs_data, structure_ids, authors)
+        add_element_compositions(cifs_data, structure_ids)
+        update_text_index(list(structure_ids.values()))
+    logger_1.info(f'Information from {len(cifs_data)} structures is added successfully!')
+    return cif_blocks
+
+
+def bulk_add_coords_and_params_to_db(cif_blocks: dict):
+    '''Bulk version of manager_add_coords_and_params_to_db.'''
+    structure_ids = get_structure_ids(list(cif_blocks))
+    coordinates, others, cell_errors = dict(), dict(), dict()
+    for refcode, cif_block in cif_blocks.items():
+        structure_id = structure_ids[refcode]
+        atoms = 0
+        if has_coords(cif_block):
+            try:
+                coords, atoms = get_coords(cif_block)
+            except Exception as err:
+                StructureCode.objects.filter(id=structure_id).delete()
+                raise Exception(f'There is a problem with coordinates in {refcode} structure:\n{err}')
+            coordinates[structure_id] = {'coordinates': coords}
+        others[structure_id] = get_other_values(atoms)
+        cell_errors[structure_id] = get_cell_parms_with_error(cif_block)
+    with transaction.atomic():
+        bulk_save_values(CoordinatesBlock, coordinates)
+        bulk_save_values(Other, others)
+        cells = get_related_objects(Cell, [structure_id for structure_id, values in cell_errors.items() if values])
+        for structure_id, cell in cells.items():
+            for key, value in cell_errors[structure_id].items():
+                setattr(cell, key, value)
+        Cell.objects.bulk_update(cells.values(), CELL_ERROR_FIELDS, batch_size=BATCH_SIZE)
+
+
+def bulk_upload_graphs_to_db(graphs: Dict[str, Dict]):
+    '''
+    Bulk version of manager_upload_graphs_to_db and manager_upload_smiles_and_inchi_to_db:
+    packed graphs, fingerprints, graph hashes, smiles and InChI of the structures in one transaction
+    '''
+    structures = StructureCode.objects.only('id', 'refcode').in_bulk(list(graphs), field_name='refcode')
+    structure_ids = {refcode: structure.id for refcode, structure in structures.items()}
+    coord_blocks = get_related_objects(CoordinatesBlock, structure_ids.values())
+    inchi_ids = set()
+    for batch in get_batches(list(structure_ids.values())):
+        inchi_ids.update(InChI.objects.filter(refcode_id__in=batch).values_list('refcode_id', flat=True))
+    updated_blocks, hashes, inchis = [], [], []
+    atom_statistics = Counter()
+    for refcode, graph in graphs.items():
+        structure_id = structure_ids.get(refcode)
+        coord_block = coord_blocks.get(structure_id)
+        if coord_block is None:
+            add_graphs_to_db_logger.error(f'Structure {refcode} has no coordinates, the graph was not added!')
+            continue
+        old_graph = coord_block.packed_graph
+        coord_block.packed_graph = pack_graph(structure_id, graph['graph_str'])
+        coord_block.fingerprint = get_fingerprint(coord_block.packed_graph)
+        component_hashes = get_component_hashes(bytes(coord_block.packed_graph))
+        coord_block.graph_hash = get_structure_hash(component_hashes)
+        hashes.extend(ComponentHash(refcode_id=structure_id, hash=value) for value in set(component_hashes))
+        atom_statistics.update(count_atoms_change(old_graph, coord_block.packed_graph))
+        if graph['smiles'] and not coord_block.smiles:
+            coord_block.smiles = graph['smiles']
+        if graph['inchi'] and structure_id not in inchi_ids:
+            inchis.append(InChI(refcode_id=structure_id, **get_inchi_values(graph['inchi'])))
+            inchi_ids.add(structure_id)
+        updated_blocks.append(coord_block)
+    with transaction.atomic():
+        CoordinatesBlock.objects.bulk_update(
+            updated_blocks, ['packed_graph', 'fingerprint', 'graph_hash', 'smiles'], batch_size=BATCH_SIZE
+        )
+        for batch in get_batches([coord_block.refcode_id for coord_block in updated_blocks]):
+            ComponentHash.objects.filter(refcode_id__in=batch).delete()
+        ComponentHash.objects.bulk_create(hashes, batch_size=BATCH_SIZE)
+        InChI.objects.bulk_create(inchis, batch_size=BATCH_SIZE)
+        add_atom_statistics(atom_statistics)
+    add_graphs_to_db_logger.info(f'Graphs of {len(updated_blocks)} structures successfully added to the database')
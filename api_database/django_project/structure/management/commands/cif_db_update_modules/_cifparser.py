@@ -32,12 +32,16 @@ import re
 from typing import Tuple, List
 
 
-def add_coords(cif_block: dict, structure: classmethod):
-    # if there are coordinates in the file, then add them to the database
-    if {
+def has_coords(cif_block: dict) -> bool:
+    return {
         '_atom_site_label', '_atom_site_fract_x',
         '_atom_site_fract_y', '_atom_site_fract_z'
-    }.issubset(cif_block[1].keys()):
+    }.issubset(cif_block[1].keys())
+
+
+def add_coords(cif_block: dict, structure: classmethod):
+    # if there are coordinates in the file, then add them to the database
+    if has_coords(cif_block):
         coords, atoms = get_coords(cif_block)
         cb_obj, created = CoordinatesBlock.objects.get_or_create(refcode=structure)
         cb_obj.coordinates = coords
@@ -46,8 +50,8 @@ def add_coords(cif_block: dict, structure: classmethod):
     return 0
 
 
-def add_other_info(atoms, structure):
-    other_obj, created = Other.objects.get_or_create(refcode=structure)
+def get_other_values(atoms) -> dict:
+    values = dict()
     max_atom_num = 0
     if atoms:
         for atom in atoms:
@@ -56,29 +60,39 @@ def add_other_info(atoms, structure):
                 num = element_numbers[atom_type[0]]
                 if num > max_atom_num:
                     max_atom_num = num
-        other_obj.number_atoms_with_sites = len(atoms)
-        other_obj.maximum_atomic_number = max_atom_num
+        values['number_atoms_with_sites'] = len(atoms)
+        values['maximum_atomic_number'] = max_atom_num
     else:
-        other_obj.has_3d_structure = False
+        values['has_3d_structure'] = False
+    return values
+
+
+def add_other_info(atoms, structure):
+    other_obj, created = Other.objects.get_or_create(refcode=structure)
+    for key, value in get_other_values(atoms).items():
+        setattr(other_obj, key, value)
     other_obj.save()
     return 0
 
 
-def add_cell_parms_with_error(cif_block, structure: classmethod):
+def get_cell_parms_with_error(cif_block) -> dict:
     if {'_cell_length_a', '_cell_length_b', '_cell_length_c',
             '_cell_angle_alpha', '_cell_angle_beta', '_cell_angle_gamma'}.issubset(cif_block[1].keys()):
-        a, b, c, al, be, ga = (cif_block[1]['_cell_length_a'], cif_block[1]['_cell_length_b'],
-                               cif_block[1]['_cell_length_c'], cif_block[1]['_cell_angle_alpha'],
-                               cif_block[1]['_cell_angle_beta'], cif_block[1]['_cell_angle_gamma'])
-        if Cell.objects.filter(refcode=structure).exists():
-            cell = Cell.objects.get(refcode=structure)
-            cell.a_err = a
-            cell.b_err = b
-            cell.c_err = c
-            cell.al_err = al
-            cell.be_err = be
-            cell.ga_err = ga
-            cell.save()
+        return {
+            'a_err': cif_block[1]['_cell_length_a'], 'b_err': cif_block[1]['_cell_length_b'],
+            'c_err': cif_block[1]['_cell_length_c'], 'al_err': cif_block[1]['_cell_angle_alpha'],
+            'be_err': cif_block[1]['_cell_angle_beta'], 'ga_err': cif_block[1]['_cell_angle_gamma'],
+        }
+    return dict()
+
+
+def add_cell_parms_with_error(cif_block, structure: classmethod):
+    values = get_cell_parms_with_error(cif_block)
+    if values and Cell.objects.filter(refcode=structure).exists():
+        cell = Cell.objects.get(refcode=structure)
+        for key, value in values.items():
+            setattr(cell, key, value)
+        cell.save()
     return 0
 
 
@@ -31,6 +31,7 @@ import cpplib
 from ._element_numbers import element_numbers
 from django_project.loggers import set_prm_log
 from modules.gen2d.gen2d import main_v2
+from modules.graph_pack.graph_pack import unpack_graph
 import re
 
 
@@ -152,22 +153,34 @@ def print_graph(graphs):
         plt.show()
 
 
-def print_graph_c(string_graph):
+def make_networkx_graph(packed_graph):
+    '''Create networkx graph with "element" and "h_num" node attributes from packed graph.'''
+    number_elements = {value: key for key, value in element_numbers.items()}
+    structure_id, types, h_nums, bonds = unpack_graph(packed_graph)
     graph = nx.Graph()
-    string_graph = string_graph.split()
-    num_nodes = int(string_graph[1])
-    for idx, el in enumerate(string_graph[3:], start=1):
-        # nodes
-        if idx < num_nodes * 2 and idx % 2 == 1:
-            for key, value in element_numbers.items():
-                if value == int(el):
-                    element = key
-                    break
-            graph.add_nodes_from([(int((idx + 1) / 2), {'element': element}), ])
-        # edges
-        elif idx > num_nodes * 2 and idx % 2 == 1:
-            graph.add_edge(int(el), int(string_graph[idx + 3]))
-    print_graph([graph, ])
+    for idx, atom_type in enumerate(types, start=1):
+        graph.add_node(idx, element=number_elements[atom_type], h_num=h_nums[idx - 1])
+    graph.add_edges_from(bonds)
+    return graph
+
+
+def print_graph_c(packed_graph):
+    print_graph([make_networkx_graph(packed_graph), ])
+
+
+def get_graph(refcode, cif_block, symops_db, add_graphs_logger) -> dict:
+    add_graphs_logger.info(f"Start processing structure {refcode}")
+    params, coords_types, types, symops = get_data(cif_block, symops_db)
+    add_graphs_logger.info(f"Received atomic coordinates and translation matrix")
+    graph_str, smiles, inchi = make_graph_c(params, coords_types, types, refcode, add_graphs_logger, symops)
+    if smiles and inchi:
+        add_graphs_logger.info(f"Received graph string and 2D representation")
+    else:
+        add_graphs_logger.info(f"Build 2D representation failed!")
+    add_graphs_logger.info(f"Processing completed {refcode}")
+    bonds = []
+    angles = []
+    return {'graph_str': graph_str, 'bonds': bonds, 'angles': angles, 'smiles': smiles, 'inchi': inchi}
 
 
 def add_graphs_c(queue, return_dict, proc_num: int):
@@ -180,18 +193,7 @@ def add_graphs_c(queue, return_dict, proc_num: int):
             # if the queue is empty, terminate the thread
             break
         try:
-            add_graphs_logger.info(f"Start processing structure {refcode}")
-            params, coords_types, types, symops = get_data(cif_block, symops_db)
-            add_graphs_logger.info(f"Received atomic coordinates and translation matrix")
-            graph_str, smiles, inchi = make_graph_c(params, coords_types, types, refcode, add_graphs_logger, symops)
-            if smiles and inchi:
-                add_graphs_logger.info(f"Received graph string and 2D representation")
-            else:
-                add_graphs_logger.info(f"Build 2D representation failed!")
-            add_graphs_logger.info(f"Processing completed {refcode}")
-            bonds = []
-            angles = []
-            return_dict[refcode] = {'graph_str': graph_str, 'bonds': bonds, 'angles': angles, 'smiles': smiles, 'inchi': inchi}
+            return_dict[refcode] = get_graph(refcode, cif_block, symops_db, add_graphs_logger)
             add_graphs_logger.info(f"Structure {refcode} successfully added to the resulting list!")
         except Exception as err:
             add_graphs_logger.error(f"Structure {refcode} not added to the resulting list!", exc_info=True)
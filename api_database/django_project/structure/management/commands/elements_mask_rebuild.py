@@ -0,0 +1,89 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from structure.models import (StructureCode, ElementsManager, elem_models, get_elements_list_for_model,
+                              get_elements_mask, get_composition)
+from qc_structure.models import QCStructureCode, QCElementsManager
+
+CHUNK_SIZE = 5000  # the number of structures written to the database at once
+
+
+def get_manager_elements(manager, model_elements):
+    '''Return {'element': count, ...} of the ElementsManager object.'''
+    elements = dict()
+    for i, elements_list in enumerate(model_elements, start=1):
+        element_set = getattr(manager, f'element_set_{i}')
+        if element_set is None:
+            continue
+        for element in elements_list:
+            count = getattr(element_set, element)
+            if count is not None:
+                elements[element] = count
+    return elements
+
+
+def rebuild_elements_mask(structure_code_model, manager_model, stdout=None):
+    '''Recalculate elements masks and compositions of all structures and return the number of structures.'''
+    model_elements = [get_elements_list_for_model(elem_model) for elem_model in elem_models]
+    structure_ids = list(structure_code_model.objects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(structure_ids), CHUNK_SIZE):
+        chunk_ids = structure_ids[i:i + CHUNK_SIZE]
+        managers = manager_model.objects.filter(refcode_id__in=chunk_ids).select_related(
+            *[f'element_set_{number}' for number in range(1, len(elem_models) + 1)]
+        )
+        elements = {manager.refcode_id: get_manager_elements(manager, model_elements) for manager in managers}
+        structures = list(structure_code_model.objects.filter(id__in=chunk_ids).only('id'))
+        for structure in structures:
+            structure_elements = elements.get(structure.id, dict())
+            structure.elements_mask_1, structure.elements_mask_2 = get_elements_mask(structure_elements)
+            structure.composition = get_composition(structure_elements)
+        with transaction.atomic():
+            structure_code_model.objects.bulk_update(structures, ['elements_mask_1', 'elements_mask_2', 'composition'])
+        if stdout:
+            stdout.write(f'{structure_code_model.__name__}: {i + len(chunk_ids)} of {len(structure_ids)}')
+    return len(structure_ids)
+
+
+class Command(BaseCommand):
+    help = 'Recalculate elements masks and compositions used by element and formula filters.'
+
+    def handle(self, *args, **options):
+        models = [(StructureCode, ElementsManager), (QCStructureCode, QCElementsManager)]
+        if options['qc']:
+            models = models[1:]
+        elif options['no_qc']:
+            models = models[:1]
+        for structure_code_model, manager_model in models:
+            rebuild_elements_mask(structure_code_model, manager_model, self.stdout)
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--qc', action='store_true', help='Rebuild only QC structures')
+        group.add_argument('--no-qc', action='store_true', help='Rebuild only experimental structures')
@@ -0,0 +1,91 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from structure.models import CoordinatesBlock, ComponentHash
+from qc_structure.models import QCCoordinatesBlock, QCComponentHash
+from modules.graph_pack.graph_hash import get_component_hashes, get_structure_hash
+from api.result_cache import bump_dataset_version
+import multiprocessing
+
+NUM_OF_PROC = max(int(multiprocessing.cpu_count() / 2), 1)  # number of physical processors
+CHUNK_SIZE = 5000  # the number of structures written to the database at once
+
+
+def rebuild_graph_hashes(coordinates_model, hash_model, only_missing=False, stdout=None):
+    '''Recalculate graph hashes of all structures with graphs and return the number of updated structures.'''
+    blocks = coordinates_model.objects.filter(packed_graph__isnull=False)
+    if only_missing:
+        blocks = blocks.filter(graph_hash__isnull=True)
+    block_ids = list(blocks.order_by('id').values_list('id', flat=True))
+    updated = 0
+    with multiprocessing.Pool(NUM_OF_PROC) as pool:
+        for i in range(0, len(block_ids), CHUNK_SIZE):
+            chunk = coordinates_model.objects.filter(
+                id__in=block_ids[i:i + CHUNK_SIZE]
+            ).only('id', 'refcode_id', 'packed_graph')
+            chunk = [block for block in chunk if block.packed_graph]
+            hashes = pool.map(get_component_hashes, [bytes(block.packed_graph) for block in chunk], chunksize=100)
+            component_hashes = []
+            for block, block_hashes in zip(chunk, hashes):
+                block.graph_hash = get_structure_hash(block_hashes)
+                component_hashes.extend(hash_model(refcode_id=block.refcode_id, hash=value) for value in set(block_hashes))
+            with transaction.atomic():
+                hash_model.objects.filter(refcode_id__in=[block.refcode_id for block in chunk]).delete()
+                hash_model.objects.bulk_create(component_hashes, batch_size=CHUNK_SIZE)
+                coordinates_model.objects.bulk_update(chunk, ['graph_hash'])
+            updated += len(chunk)
+            if stdout:
+                stdout.write(f'{coordinates_model.__name__}: {updated} of {len(block_ids)}')
+    return updated
+
+
+class Command(BaseCommand):
+    help = 'Recalculate canonical graph hashes used by the exact search.'
+
+    def handle(self, *args, **options):
+        models = [(CoordinatesBlock, ComponentHash), (QCCoordinatesBlock, QCComponentHash)]
+        if options['qc']:
+            models = models[1:]
+        elif options['no_qc']:
+            models = models[:1]
+        for coordinates_model, hash_model in models:
+            rebuild_graph_hashes(coordinates_model, hash_model, options['only_missing'], self.stdout)
+        # Cached search results of the running workers are outdated now, graphs were not changed
+        bump_dataset_version(structure_ids=[])
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only-missing',
+            action='store_true',
+            help='Calculate hashes only for structures which have none',
+        )
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--qc', action='store_true', help='Rebuild only QC structures')
+        group.add_argument('--no-qc', action='store_true', help='Rebuild only experimental structures')
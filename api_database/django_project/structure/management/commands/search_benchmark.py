@@ -0,0 +1,102 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from structure.models import CoordinatesBlock
+from qc_structure.models import QCCoordinatesBlock
+from structure.management.commands.cif_db_update_modules._add_substructure_filtration import TEMPLATES
+from api.query_planner import get_start_atom, get_statistics
+import cpplib
+import multiprocessing
+
+NUM_OF_PROC = max(int(multiprocessing.cpu_count() / 2), 1)  # number of physical processors
+# templates like the ones drawn in VnE DrawerWidget: hydrogens are given by Hnum, coordination from the drawing
+DRAWN_TEMPLATES = {
+    'pyridine-COOH': '1 9 9 6 0 2 14 6 1 2 14 6 1 2 14 7 0 2 14 6 1 2 14 6 0 3 14 6 0 3 3 8 0 1 1 8 1 2 2 '
+                     '1 2 2 3 3 4 4 5 5 6 6 1 6 7 7 8 7 9',
+    'P-Ph': '1 7 7 15 0 1 14 6 0 3 3 6 1 3 3 6 1 3 3 6 1 3 3 6 1 3 3 6 1 3 3 1 2 2 3 3 4 4 5 5 6 6 7 7 2',
+    'Cu-N2': '1 3 2 29 0 2 14 7 0 1 14 7 0 1 14 1 2 1 3',
+    'SO3': '1 4 3 16 0 4 4 8 0 1 14 8 0 1 14 8 0 1 14 1 2 1 3 1 4',
+    'halogen-C-N': '1 3 2 -1 0 1 1 6 0 2 14 7 0 1 14 1 2 2 3 -1 9 17 35 53 0',
+}
+
+
+def time_search(template, graphs, exact, repeat, start_atom=0):
+    '''Return (the best time in seconds, the number of hits) of the cpplib search.'''
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        hits = cpplib.SearchMainPacked(template, graphs, NUM_OF_PROC, exact, 0, start_atom)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(hits)
+
+
+class Command(BaseCommand):
+    help = 'Compare the substructure search time with the default and the planned start atom.'
+
+    def handle(self, *args, **options):
+        model = QCCoordinatesBlock if options['qc'] else CoordinatesBlock
+        graphs = [
+            bytes(graph) for graph in model.objects.filter(packed_graph__isnull=False).values_list(
+                'packed_graph', flat=True
+            ) if graph
+        ]
+        statistics = get_statistics(options['qc'])
+        if not statistics:
+            self.stdout.write('No atom statistics, run "atom_statistics_rebuild" first')
+            return
+        templates = {name: data[0] for name, data in TEMPLATES.items()}
+        templates.update(DRAWN_TEMPLATES)
+        self.stdout.write(f'{len(graphs)} graphs, {NUM_OF_PROC} threads')
+        self.stdout.write(f'{"template":<16}{"hits":>8}{"default, ms":>14}{"planned, ms":>14}{"speedup":>10}')
+        total_default = total_planned = 0
+        for name, template in templates.items():
+            start_atom = get_start_atom(template, statistics)
+            default_time, hits = time_search(template, graphs, options['exact'], options['repeat'])
+            planned_time, planned_hits = time_search(
+                template, graphs, options['exact'], options['repeat'], start_atom
+            )
+            if hits != planned_hits:
+                self.stderr.write(f'{name}: {hits} hits with the default and {planned_hits} with the planned start')
+            total_default += default_time
+            total_planned += planned_time
+            self.stdout.write(
+                f'{name:<16}{hits:>8}{default_time * 1000:>14.1f}{planned_time * 1000:>14.1f}'
+                f'{default_time / max(planned_time, 1e-9):>10.2f}'
+            )
+        self.stdout.write(
+            f'{"total":<16}{"":>8}{total_default * 1000:>14.1f}{total_planned * 1000:>14.1f}'
+            f'{total_default / max(total_planned, 1e-9):>10.2f}'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--qc', action='store_true', help='Search in QC structures')
+        parser.add_argument('--exact', action='store_true', help='Exact search')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of runs of every search, the best is used')
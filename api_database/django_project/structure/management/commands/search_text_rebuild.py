@@ -0,0 +1,56 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from structure.search_text import has_text_index, rebuild_text_index
+
+
+class Command(BaseCommand):
+    help = 'Refill full-text indexes of names, authors, journals and DOIs used by text filters (SQLite only).'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Full-text indexes are supported only for SQLite databases')
+        qc_flags = [False, True]
+        if options['qc']:
+            qc_flags = qc_flags[1:]
+        elif options['no_qc']:
+            qc_flags = qc_flags[:1]
+        for qc in qc_flags:
+            name = 'QCStructureCode' if qc else 'StructureCode'
+            if not has_text_index(qc):
+                raise CommandError(f'{name} has no full-text index, apply migrations first')
+            with transaction.atomic():
+                count = rebuild_text_index(qc)
+            self.stdout.write(f'{name}: {count} structures indexed')
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--qc', action='store_true', help='Rebuild only QC structures')
+        group.add_argument('--no-qc', action='store_true', help='Rebuild only experimental structures')
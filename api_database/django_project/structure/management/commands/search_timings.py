@@ -0,0 +1,94 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+import json
+import os
+from collections import deque
+import numpy as np
+from django.core.management.base import BaseCommand
+from django_project.loggers import SEARCH_TIMINGS_LOG
+
+COUNTS = ('candidates', 'passed', 'hits')
+
+
+def read_records(last, scope=None, cache=None):
+    '''Return the last records of the search timings log (the rotated file is read first).'''
+    records = deque(maxlen=last)
+    for path in (f'{SEARCH_TIMINGS_LOG}.1', SEARCH_TIMINGS_LOG):
+        if not os.path.exists(path):
+            continue
+        with open(path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if scope and record.get('scope') != scope or cache and record.get('cache') != cache:
+                    continue
+                records.append(record)
+    return list(records)
+
+
+class Command(BaseCommand):
+    help = 'Summarize wall and CPU time of search phases (p50/p95) over the last searches.'
+
+    def handle(self, *args, **options):
+        records = read_records(options['last'], options['scope'], options['cache'])
+        if not records:
+            self.stdout.write('No search timings recorded')
+            return
+        self.stdout.write(f'{len(records)} searches')
+        phases = dict()
+        for record in records:
+            for name, values in record['phases'].items():
+                phases.setdefault(name, []).append((values['wall_ms'], values['cpu_ms']))
+        self.stdout.write(
+            f'{"phase":<12}{"searches":>10}{"wall p50":>12}{"wall p95":>12}{"cpu p50":>12}{"cpu p95":>12}'
+        )
+        for name, values in phases.items():
+            wall, cpu = np.array(values).T
+            self.stdout.write(
+                f'{name:<12}{len(values):>10}'
+                f'{np.percentile(wall, 50):>12.2f}{np.percentile(wall, 95):>12.2f}'
+                f'{np.percentile(cpu, 50):>12.2f}{np.percentile(cpu, 95):>12.2f}'
+            )
+        total = np.array([record['total_ms'] for record in records])
+        self.stdout.write(
+            f'{"total":<12}{len(total):>10}{np.percentile(total, 50):>12.2f}{np.percentile(total, 95):>12.2f}'
+        )
+        for name in COUNTS:
+            values = [record[name] for record in records if name in record]
+            if values:
+                self.stdout.write(
+                    f'{name}: p50 {np.percentile(values, 50):.0f}, p95 {np.percentile(values, 95):.0f}'
+                )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--last', type=int, default=1000, help='The number of the last searches')
+        parser.add_argument('--scope', choices=['exp', 'qc'], help='Only experimental or QC structures search')
+        parser.add_argument('--cache', choices=['hit', 'miss'], help='Only searches with or without cached result')
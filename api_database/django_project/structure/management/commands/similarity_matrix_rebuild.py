@@ -0,0 +1,51 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from django.core.management.base import BaseCommand
+from structure.models import CoordinatesBlock
+from qc_structure.models import QCCoordinatesBlock
+from api.similarity import write_matrix, get_matrix_path
+
+
+class Command(BaseCommand):
+    help = 'Write memory-mapped fingerprint matrices used by the similarity search.'
+
+    def handle(self, *args, **options):
+        models = [(CoordinatesBlock, False), (QCCoordinatesBlock, True)]
+        if options['qc']:
+            models = models[1:]
+        elif options['no_qc']:
+            models = models[:1]
+        for coordinates_model, qc in models:
+            num_rows = write_matrix(coordinates_model, get_matrix_path(qc), self.stdout)
+            self.stdout.write(f'{coordinates_model.__name__}: {num_rows} fingerprints written')
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--qc', action='store_true', help='Rebuild only the QC structures matrix')
+        group.add_argument('--no-qc', action='store_true', help='Rebuild only the experimental structures matrix')
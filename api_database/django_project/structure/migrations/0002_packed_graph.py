@@ -0,0 +1,52 @@
+# Generated by Django 3.2.24 on 2026-10-16 23:49
+
+from django.db import migrations, models
+from modules.graph_pack.graph_pack import pack_graph_string, graph_to_string
+
+BATCH_SIZE = 5000
+
+
+def pack_graphs(apps, schema_editor):
+    coordinates_model = apps.get_model('structure', 'CoordinatesBlock')
+    batch = []
+    coord_blocks = coordinates_model.objects.exclude(graph__isnull=True).exclude(graph='').only('id', 'graph')
+    for coord_block in coord_blocks.iterator(chunk_size=BATCH_SIZE):
+        coord_block.packed_graph = pack_graph_string(coord_block.graph)
+        batch.append(coord_block)
+        if len(batch) >= BATCH_SIZE:
+            coordinates_model.objects.bulk_update(batch, ['packed_graph'])
+            batch = []
+    coordinates_model.objects.bulk_update(batch, ['packed_graph'])
+
+
+def unpack_graphs(apps, schema_editor):
+    coordinates_model = apps.get_model('structure', 'CoordinatesBlock')
+    batch = []
+    coord_blocks = coordinates_model.objects.exclude(packed_graph__isnull=True).only('id', 'packed_graph')
+    for coord_block in coord_blocks.iterator(chunk_size=BATCH_SIZE):
+        coord_block.graph = graph_to_string(coord_block.packed_graph)
+        batch.append(coord_block)
+        if len(batch) >= BATCH_SIZE:
+            coordinates_model.objects.bulk_update(batch, ['graph'])
+            batch = []
+    coordinates_model.objects.bulk_update(batch, ['graph'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coordinatesblock',
+            name='packed_graph',
+            field=models.BinaryField(blank=True, help_text='packed graph for structure search (see modules/graph_pack)', null=True, verbose_name='Graph'),
+        ),
+        migrations.RunPython(pack_graphs, unpack_graphs),
+        migrations.RemoveField(
+            model_name='coordinatesblock',
+            name='graph',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-16 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0002_packed_graph'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coordinatesblock',
+            name='fingerprint',
+            field=models.BinaryField(blank=True, help_text='structural fingerprint for search prescreen (see modules/graph_pack/fingerprint.py)', null=True, verbose_name='Fingerprint'),
+        ),
+    ]
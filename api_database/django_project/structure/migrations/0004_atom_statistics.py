@@ -0,0 +1,27 @@
+# Generated by Django 3.2.24 on 2026-10-17 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0003_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtomStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('element', models.PositiveSmallIntegerField(verbose_name='Atomic number')),
+                ('h_num', models.PositiveSmallIntegerField(verbose_name='Number of hydrogens')),
+                ('coord', models.PositiveSmallIntegerField(verbose_name='Coordination number')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Number of atoms')),
+            ],
+            options={
+                'verbose_name_plural': 'Atom statistics',
+                'unique_together': {('element', 'h_num', 'coord')},
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.24 on 2026-10-17 00:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+from modules.graph_pack.graph_hash import get_component_hashes, get_structure_hash
+
+BATCH_SIZE = 5000
+
+
+def set_graph_hashes(apps, schema_editor):
+    coordinates_model = apps.get_model('structure', 'CoordinatesBlock')
+    hash_model = apps.get_model('structure', 'ComponentHash')
+    batch = []
+    component_hashes = []
+    coord_blocks = coordinates_model.objects.exclude(packed_graph__isnull=True).only(
+        'id', 'refcode_id', 'packed_graph'
+    )
+    for coord_block in coord_blocks.iterator(chunk_size=BATCH_SIZE):
+        if not coord_block.packed_graph:
+            continue
+        hashes = get_component_hashes(bytes(coord_block.packed_graph))
+        coord_block.graph_hash = get_structure_hash(hashes)
+        batch.append(coord_block)
+        component_hashes.extend(hash_model(refcode_id=coord_block.refcode_id, hash=value) for value in set(hashes))
+        if len(batch) >= BATCH_SIZE:
+            coordinates_model.objects.bulk_update(batch, ['graph_hash'])
+            hash_model.objects.bulk_create(component_hashes, batch_size=BATCH_SIZE)
+            batch = []
+            component_hashes = []
+    coordinates_model.objects.bulk_update(batch, ['graph_hash'])
+    hash_model.objects.bulk_create(component_hashes, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0004_atom_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coordinatesblock',
+            name='graph_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='canonical hash of the structure graph (see modules/graph_pack/graph_hash.py)', max_length=32, null=True, verbose_name='Graph hash'),
+        ),
+        migrations.CreateModel(
+            name='ComponentHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(db_index=True, max_length=32, verbose_name='Hash')),
+                ('refcode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='component_hashes', to='structure.structurecode')),
+            ],
+            options={
+                'verbose_name_plural': 'Component hashes',
+            },
+        ),
+        migrations.RunPython(set_graph_hashes, migrations.RunPython.noop),
+    ]
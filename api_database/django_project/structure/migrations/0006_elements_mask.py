@@ -0,0 +1,34 @@
+# Generated by Django 3.2.24 on 2026-10-17 00:40
+
+from django.db import migrations, models
+from structure.management.commands.elements_mask_rebuild import rebuild_elements_mask
+
+
+def set_elements_masks(apps, schema_editor):
+    rebuild_elements_mask(apps.get_model('structure', 'StructureCode'), apps.get_model('structure', 'ElementsManager'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0005_graph_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='structurecode',
+            name='composition',
+            field=models.CharField(blank=True, default='', editable=False, help_text='elements with their numbers, for example " H12 C6 O6 " (see get_composition)', max_length=1024, verbose_name='Composition'),
+        ),
+        migrations.AddField(
+            model_name='structurecode',
+            name='elements_mask_1',
+            field=models.BigIntegerField(default=0, editable=False, help_text='bits of the first 64 elements of the structure (see get_elements_mask)', verbose_name='Elements mask 1'),
+        ),
+        migrations.AddField(
+            model_name='structurecode',
+            name='elements_mask_2',
+            field=models.BigIntegerField(default=0, editable=False, help_text='bits of the other elements of the structure (see get_elements_mask)', verbose_name='Elements mask 2'),
+        ),
+        migrations.RunPython(set_elements_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.24 on 2026-10-17 02:40
+
+from django.db import migrations
+from structure.search_text import create_text_index, drop_text_index
+
+QC = False
+
+
+def create_index(apps, schema_editor):
+    create_text_index(schema_editor, QC)
+
+
+def drop_index(apps, schema_editor):
+    drop_text_index(schema_editor, QC)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0007_reduced_cell_rtree'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
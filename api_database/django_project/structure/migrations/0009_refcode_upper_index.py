@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-17 02:55
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0008_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='structurecode',
+            index=models.Index(django.db.models.functions.text.Upper('refcode'), name='structure_refcode_upper_idx'),
+        ),
+    ]
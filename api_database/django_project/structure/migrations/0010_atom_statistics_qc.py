@@ -0,0 +1,47 @@
+# Generated by Django 3.2.24 on 2026-10-17 03:20
+
+from collections import Counter
+from django.db import migrations, models
+
+BATCH_SIZE = 5000
+
+
+def collect_atom_statistics(apps, schema_editor):
+    '''Statistics were common for experimental and QC structures, they are recalculated separately.'''
+    from api.query_planner import count_atoms
+    statistics_model = apps.get_model('structure', 'AtomStatistics')
+    statistics_model.objects.all().delete()
+    for qc, coordinates_model in (
+            (False, apps.get_model('structure', 'CoordinatesBlock')),
+            (True, apps.get_model('qc_structure', 'QCCoordinatesBlock'))
+    ):
+        statistics = Counter()
+        graphs = coordinates_model.objects.filter(packed_graph__isnull=False).values_list('packed_graph', flat=True)
+        for graph in graphs.iterator(chunk_size=BATCH_SIZE):
+            if graph:
+                statistics.update(count_atoms(bytes(graph)))
+        statistics_model.objects.bulk_create([
+            statistics_model(qc=qc, element=element, h_num=h_num, coord=coord, count=count)
+            for (element, h_num, coord), count in statistics.items()
+        ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0009_refcode_upper_index'),
+        ('qc_structure', '0002_packed_graph'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atomstatistics',
+            name='qc',
+            field=models.BooleanField(default=False, verbose_name='QC structures'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='atomstatistics',
+            unique_together={('qc', 'element', 'h_num', 'coord')},
+        ),
+        migrations.RunPython(collect_atom_statistics, migrations.RunPython.noop),
+    ]
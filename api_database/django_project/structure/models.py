@@ -29,9 +29,11 @@
 import os.path
 
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth import get_user_model
 from io import BytesIO
 import base64
+from functools import lru_cache
 
 from modules.gen2d.gen2d import gen2d
 
@@ -72,6 +74,8 @@ SHAPES = [
     ('plank', 'plank')
 ]
 
+MASK_BITS = 64  # number of bits of each elements mask column
+
 
 def get_fields_list(model):
     return [field.name for field in model._meta.get_fields()]
@@ -80,6 +84,27 @@ def get_fields_list(model):
 class AbstractStructureCode(models.Model):
     '''(Abstract table) Table with structure codes.'''
     refcode = models.CharField(verbose_name='Refcode', max_length=17, unique=True)
+    # element filters without joins of ElementsSet tables (filled by ElementsManager.save_elements)
+    elements_mask_1 = models.BigIntegerField(
+        verbose_name='Elements mask 1',
+        help_text='bits of the first 64 elements of the structure (see get_elements_mask)',
+        default=0,
+        editable=False
+    )
+    elements_mask_2 = models.BigIntegerField(
+        verbose_name='Elements mask 2',
+        help_text='bits of the other elements of the structure (see get_elements_mask)',
+        default=0,
+        editable=False
+    )
+    composition = models.CharField(
+        verbose_name='Composition',
+        help_text='elements with their numbers, for example " H12 C6 O6 " (see get_composition)',
+        max_length=1024,
+        blank=True,
+        default='',
+        editable=False
+    )
 
     class Meta:
         abstract = True
@@ -169,13 +194,37 @@ class AbstractCoordinatesBlock(models.Model):
         blank=True,
         null=True,
     )
-    graph = models.TextField(
+    packed_graph = models.BinaryField(
         verbose_name='Graph',
-        help_text='string graph for structure search',
+        help_text='packed graph for structure search (see modules/graph_pack)',
+        blank=True,
+        null=True,
+        editable=False
+    )
+    fingerprint = models.BinaryField(
+        verbose_name='Fingerprint',
+        help_text='structural fingerprint for search prescreen (see modules/graph_pack/fingerprint.py)',
         blank=True,
         null=True,
         editable=False
     )
+    graph_hash = models.CharField(
+        verbose_name='Graph hash',
+        help_text='canonical hash of the structure graph (see modules/graph_pack/graph_hash.py)',
+        max_length=32,
+        db_index=True,
+        blank=True,
+        null=True,
+        editable=False
+    )
+
+    class Meta:
+        abstract = True
+
+
+class AbstractComponentHash(models.Model):
+    '''(Abstract table) Canonical hash of connected component of the structure graph (used by the exact search).'''
+    hash = models.CharField(verbose_name='Hash', max_length=32, db_index=True)
 
     class Meta:
         abstract = True
@@ -328,8 +377,12 @@ class AbstractFormula(models.Model):
 class AbstractElementsManager(models.Model):
     '''(Abstract table) Refcode to ElementsSets relations.'''
 
-    def save_elements(self, elements: dict):
-        # elements = {'elem': count, ...}
+    @staticmethod
+    def get_elements_queries(elements: dict):
+        '''
+        Return {ElementsSet index: (counts of its elements, isnull filter of its other elements)}
+        for elements = {'elem': count, ...}
+        '''
         elem_query = {0: {}, 1: {}, 2: {}, 3: {}, 4: {}, 5: {}, 6: {}, 7: {}}
         isnull_elem_query = {0: {}, 1: {}, 2: {}, 3: {}, 4: {}, 5: {}, 6: {}, 7: {}}
         # fill isnull_elem_query by default values
@@ -345,13 +398,18 @@ class AbstractElementsManager(models.Model):
                     elem_query[i][element] = float(count)
                     isnull_elem_query[i][f'{element}__isnull'] = False
                     break
+        return {key: (value, isnull_elem_query[key]) for key, value in elem_query.items() if value}
+
+    def save_elements(self, elements: dict):
+        # elements = {'elem': count, ...}
         # save attribute values
-        for key, value in elem_query.items():
-            if value:
-                isnull_filter = isnull_elem_query[key]
-                elem_set_obj, created = elem_models[key].objects.filter(**isnull_filter).get_or_create(**value)
-                setattr(self, f'element_set_{key + 1}', elem_set_obj)
+        for key, (value, isnull_filter) in self.get_elements_queries(elements).items():
+            elem_set_obj, created = elem_models[key].objects.filter(**isnull_filter).get_or_create(**value)
+            setattr(self, f'element_set_{key + 1}', elem_set_obj)
         self.save()
+        self.refcode.elements_mask_1, self.refcode.elements_mask_2 = get_elements_mask(elements)
+        self.refcode.composition = get_composition(elements)
+        self.refcode.save(update_fields=['elements_mask_1', 'elements_mask_2', 'composition'])
 
     class Meta:
         abstract = True
@@ -391,6 +449,8 @@ class StructureCode(AbstractStructureCode):
 
     class Meta:
         ordering = ['refcode']
+        # case-insensitive refcode lookups (see api.filters.get_refcodes_filter)
+        indexes = [models.Index(Upper('refcode'), name='structure_refcode_upper_idx')]
 
     def __str__(self):
         return self.refcode
@@ -956,6 +1016,44 @@ def get_elements_list():
     return all_elements
 
 
+@lru_cache(maxsize=None)
+def get_element_positions():
+    '''Bit positions of elements in the elements mask: {'H': 0, 'C': 1, ...} (the order of get_elements_list).'''
+    return {element: position for position, element in enumerate(get_elements_list())}
+
+
+def get_elements_mask(elements):
+    '''
+    Return two signed 64-bit values (elements_mask_1, elements_mask_2) with bits of the given elements set,
+    unknown elements are skipped.
+    '''
+    positions = get_element_positions()
+    mask = 0
+    for element in elements:
+        if element in positions:
+            mask |= 1 << positions[element]
+    return tuple(
+        value - (1 << MASK_BITS) if value >= 1 << (MASK_BITS - 1) else value
+        for value in (mask & ((1 << MASK_BITS) - 1), mask >> MASK_BITS)
+    )
+
+
+def get_composition(elements):
+    '''
+    Return composition string of {'element': count, ...}: elements in the order of the elements mask
+    with their counts separated by spaces (also at the start and the end), for example " H12 C6 O6 ".
+    '''
+    positions = get_element_positions()
+    items = sorted((positions[element], element, count) for element, count in elements.items() if element in positions)
+    if not items:
+        return ''
+    return f' {" ".join(get_composition_item(element, count) for position, element, count in items)} '
+
+
+def get_composition_item(element, count):
+    return f'{element}{float(count):g}'
+
+
 class ElementsManager(AbstractElementsManager):
     '''Refcode to ElementsSets relations.'''
     refcode = models.OneToOneField(
@@ -1106,3 +1204,28 @@ class Other(models.Model):
 
     class Meta:
         verbose_name_plural = 'Other'
+
+
+class ComponentHash(AbstractComponentHash):
+    '''Canonical hashes of connected components of structure graphs.'''
+    refcode = models.ForeignKey(
+        StructureCode,
+        related_name='component_hashes',
+        on_delete=models.CASCADE
+    )
+
+    class Meta:
+        verbose_name_plural = 'Component hashes'
+
+
+class AtomStatistics(models.Model):
+    '''Frequency of atoms in structure graphs (used by the search query planner, see api/query_planner.py).'''
+    qc = models.BooleanField(verbose_name='QC structures', default=False)
+    element = models.PositiveSmallIntegerField(verbose_name='Atomic number')
+    h_num = models.PositiveSmallIntegerField(verbose_name='Number of hydrogens')
+    coord = models.PositiveSmallIntegerField(verbose_name='Coordination number')
+    count = models.BigIntegerField(verbose_name='Number of atoms', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Atom statistics'
+        unique_together = (('qc', 'element', 'h_num', 'coord'),)
@@ -0,0 +1,155 @@
+# Copyright 2023 Alexander A. Korlyukov, Alexander D. Volodin, Petr A. Buikin, Alexander R. Romanenko
+# This file is part of ASID - Atomistic Simulation Instruments and Database
+# For more information see <https://github.com/ASID-Production/ASID>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# *****************************************************************************************
+#  Author:      Alexander A. Korlyukov (head)
+#  ORCID:       0000-0002-5600-9886
+#  Author:      Alexander D. Volodin (author of cpplib)
+#  ORCID:       0000-0002-3522-9193
+#  Author:      Petr A. Buikin (author of api_database)
+#  ORCID:       0000-0001-9243-9915
+#  Author:      Alexander R. Romanenko (author of VnE)
+#  ORCID:       0009-0003-5298-6836
+#
+# *****************************************************************************************
+
+from functools import lru_cache
+from django.db import connection
+import re
+
+CHUNK_SIZE = 500  # the number of structures updated by one statement
+# SQLite FTS5 tables with the trigram tokenizer: every term of 3 or more characters matches
+# as a case-insensitive substring like icontains, but without the full table scan
+TEXT_TABLES = {
+    False: 'structure_structurecode_text',
+    True: 'qc_structure_qcstructurecode_text',
+}
+CODE_TABLES = {
+    False: 'structure_structurecode',
+    True: 'qc_structure_qcstructurecode',
+}
+TEXT_COLUMNS = {
+    False: ('systematic_name', 'trivial_name', 'authors', 'journal', 'doi'),
+    True: ('systematic_name', 'trivial_name'),
+}
+TEXT_SELECTS = {
+    False: '''
+        SELECT s.id, n.systematic_name, n.trivial_name,
+            (SELECT group_concat(a.family_name, ' ; ') FROM structure_structurecode_authors sa
+                JOIN structure_author a ON a.id = sa.author_id WHERE sa.structurecode_id = s.id),
+            j.name || coalesce(' ; ' || j.fullname, ''), p.doi
+        FROM structure_structurecode s
+        LEFT JOIN structure_compoundname n ON n.refcode_id = s.id
+        LEFT JOIN structure_refcodepublicationconnection rp ON rp.refcode_id = s.id
+        LEFT JOIN structure_publication p ON p.id = rp.publication_id
+        LEFT JOIN structure_journal j ON j.id = p.journal_id
+    ''',
+    True: '''
+        SELECT s.id, n.systematic_name, n.trivial_name
+        FROM qc_structure_qcstructurecode s
+        LEFT JOIN qc_structure_qccompoundname n ON n.refcode_id = s.id
+    ''',
+}
+MIN_TERM_LENGTH = 3  # shorter terms are not found by the trigram tokenizer
+
+
+def get_fill_sql(qc=False, structure_ids=None):
+    '''Return SQL statement copying texts of the structures (all structures if ids are None) to the full-text index.'''
+    sql = f'INSERT INTO {TEXT_TABLES[qc]}(rowid, {", ".join(TEXT_COLUMNS[qc])}) {TEXT_SELECTS[qc]}'
+    if structure_ids is not None:
+        sql += f' WHERE s.id IN ({", ".join(str(int(structure_id)) for structure_id in structure_ids)})'
+    return sql
+
+
+def get_create_sql(qc=False):
+    '''Return SQL statements creating the full-text index of structures, its trigger and its content.'''
+    text_table = TEXT_TABLES[qc]
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {text_table} USING fts5({", ".join(TEXT_COLUMNS[qc])}, '
+        f'tokenize="trigram")',
+        f'CREATE TRIGGER IF NOT EXISTS {text_table}_delete AFTER DELETE ON {CODE_TABLES[qc]} BEGIN '
+        f'DELETE FROM {text_table} WHERE rowid = old.id; END',
+        get_fill_sql(qc),
+    ]
+
+
+def get_drop_sql(qc=False):
+    '''Return SQL statements removing the full-text index of structures.'''
+    text_table = TEXT_TABLES[qc]
+    return [f'DROP TRIGGER IF EXISTS {text_table}_delete', f'DROP TABLE IF EXISTS {text_table}']
+
+
+def create_text_index(schema_editor, qc=False):
+    '''Create the full-text index of structures (SQLite only).'''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in get_create_sql(qc):
+        schema_editor.execute(sql)
+
+
+def drop_text_index(schema_editor, qc=False):
+    '''Remove the full-text index of structures (SQLite only).'''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in get_drop_sql(qc):
+        schema_editor.execute(sql)
+
+
+@lru_cache(maxsize=None)
+def has_text_index(qc=False):
+    '''Check if the full-text index of structures exists.'''
+    if connection.vendor != 'sqlite':
+        return False
+    return TEXT_TABLES[qc] in connection.introspection.table_names()
+
+
+def update_text_index(structure_ids, qc=False):
+    '''Replace texts of the structures in the full-text index, called after structures are added or changed.'''
+    if not has_text_index(qc):
+        return
+    structure_ids = list(structure_ids)
+    with connection.cursor() as cursor:
+        for i in range(0, len(structure_ids), CHUNK_SIZE):
+            chunk_ids = structure_ids[i:i + CHUNK_SIZE]
+            cursor.execute(
+                f'DELETE FROM {TEXT_TABLES[qc]} WHERE rowid IN ({", ".join(["%s"] * len(chunk_ids))})', chunk_ids
+            )
+            cursor.execute(get_fill_sql(qc, chunk_ids))
+
+
+def rebuild_text_index(qc=False):
+    '''Refill the full-text index of structures and return the number of structures.'''
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TEXT_TABLES[qc]}')
+        cursor.execute(get_fill_sql(qc))
+        cursor.execute(f'SELECT count(*) FROM {TEXT_TABLES[qc]}')
+        return cursor.fetchone()[0]
+
+
+def get_text_terms(value):
+    '''
+    Split the query into terms, "quoted text" is kept as one phrase.
+    Terms match anywhere in words, so the trailing * of prefix terms is dropped.
+    '''
+    terms = [phrase or word.rstrip('*') for phrase, word in re.findall(r'"([^"]+)"|(\S+)', value)]
+    return [term for term in terms if term]
+
+
+def get_match_query(terms, columns=None):
+    '''Return FTS5 query matching all the terms in the columns (any column if None).'''
+    prefix = '{' + ' '.join(columns) + '} : ' if columns else ''
+    strings = ['"' + term.replace('"', '""') + '"' for term in terms]
+    return ' AND '.join(prefix + string for string in strings)
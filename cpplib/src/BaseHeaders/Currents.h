@@ -16,7 +16,9 @@ namespace cpplib {
 	class FindGeometry;
 	class FAM_Struct;
 	class FAM_Cell;
-	class SearchDataInterface;
+	template<class Item> class BasicSearchDataInterface;
+	template<class Item> class BasicBatchSearchDataInterface;
+	struct PackedGraphView;
 	class ParseData;
 
 	namespace geometry {
@@ -44,7 +46,9 @@ namespace cpplib {
 		using ParseIndexType = ::std::vector<size_type>;
 		using CellType = geometry::Cell<FloatingPointType>;
 		using SearchGraphType = SearchGraph;
-		using SearchDataInterfaceType = SearchDataInterface;
+		using SearchDataInterfaceType = BasicSearchDataInterface<const char*>;
+		using PackedSearchDataInterfaceType = BasicSearchDataInterface<PackedGraphView>;
+		using PackedBatchSearchDataInterfaceType = BasicBatchSearchDataInterface<PackedGraphView>;
 		using FindMoleculesType = FindMolecules;
 		using FindGeometryType = FindGeometry;
 		using FAMStructType = FAM_Struct;
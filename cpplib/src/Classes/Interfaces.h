@@ -27,33 +27,40 @@
 // ******************************************************************************************
 #pragma once
 #include <mutex>
+#include <atomic>
 #include <vector>
 #include <bitset>
+#include <algorithm>
 #include "../Classes/Geometry.h"
 #include "../Classes/FindMolecules.h"
 #include "../Functions/AllInOneAndCurrent.h"
 namespace cpplib {
-	class SearchDataInterface {
+	template<class Item>
+	class BasicSearchDataInterface {
 	public:
 		using MoleculeIndex = currents::MoleculeIndex;
-		using RawVector = std::vector<const char*>;
+		using RawVector = std::vector<Item>;
 		using MultiflagType = std::bitset<mend_size>;
-		using size_type = RawVector::size_type;
+		using size_type = typename RawVector::size_type;
 	private:
 		size_type iterator_ = 0;
 		const size_type size_;
 		const RawVector rawdata_;
 		const MultiflagType multiflag_;
+		// Search stops after maxResults_ results (0 - search in all data)
+		const size_type maxResults_;
+		std::atomic<bool> stopped_{ false };
 
 		std::mutex mutexIN_;
 		std::mutex mutexOUT_;
 
-		std::vector<int> ret_;
+		// Pairs of data index and molecular ID
+		std::vector<std::pair<size_type, int>> ret_;
 
 	public:
-		SearchDataInterface() = delete;
-		explicit SearchDataInterface(std::vector<const char*>&& rawdata, MultiflagType&& multiflag) noexcept
-			: rawdata_(rawdata), size_(rawdata.size()), multiflag_(multiflag) {
+		BasicSearchDataInterface() = delete;
+		explicit BasicSearchDataInterface(RawVector&& rawdata, MultiflagType&& multiflag, const size_type maxResults = 0) noexcept
+			: size_(rawdata.size()), rawdata_(std::move(rawdata)), multiflag_(multiflag), maxResults_(maxResults) {
 			if (size_ >= 1024)
 				ret_.reserve(1024);
 			else
@@ -62,31 +69,53 @@ namespace cpplib {
 		inline size_type size() const noexcept {
 			return size_;
 		}
-		const char* getNext() {
+		const Item* getNext() {
 			size_type iter;
 			do {
 				iter = getNextIterator();
 				if (iter == size_type(-1))
 					return nullptr;
-			} while (rawdata_[iter][0] == '\0');
+			} while (isEmpty(rawdata_[iter]));
 
-			return rawdata_[iter];
+			return &rawdata_[iter];
 		}
 		inline const MultiflagType& getMulty() const noexcept {
 			return multiflag_;
 		}
-		void push_result(const MoleculeIndex molecularID) {
+		inline size_type indexOf(const Item* item) const noexcept {
+			return static_cast<size_type>(item - rawdata_.data());
+		}
+		void push_result(const Item* item, const MoleculeIndex molecularID) {
 			std::lock_guard<std::mutex> lock(mutexOUT_);
-			ret_.push_back(molecularID);
+			ret_.emplace_back(indexOf(item), molecularID);
+			// Items which were already taken are searched to the end, so the result does not depend on threads
+			if (maxResults_ != 0 && ret_.size() >= maxResults_)
+				stopped_ = true;
 		}
-		std::vector<int>&& getAllResults() noexcept {
+		// With maxResults the first results in the data order are returned
+		std::vector<int> getAllResults() {
 			std::lock_guard<std::mutex> lock(mutexOUT_);
-			return std::move(ret_);
+			if (maxResults_ != 0) {
+				std::sort(ret_.begin(), ret_.end());
+				if (ret_.size() > maxResults_)
+					ret_.resize(maxResults_);
+			}
+			std::vector<int> ret;
+			ret.reserve(ret_.size());
+			for (const auto& r : ret_)
+				ret.push_back(r.second);
+			return ret;
 		}
 	private:
+		static inline bool isEmpty(const char* item) noexcept {
+			return item[0] == '\0';
+		}
+		static inline bool isEmpty(const PackedGraphView& item) noexcept {
+			return item.empty();
+		}
 		size_type getNextIterator() {
 			std::lock_guard<std::mutex> lock(mutexIN_);
-			if (iterator_ == size_)
+			if (iterator_ == size_ || stopped_)
 				return size_type(-1);
 			size_type i = iterator_;
 			iterator_++;
@@ -94,6 +123,33 @@ namespace cpplib {
 		}
 	};
 
+	// Data of the batch search: every item is given to one thread, which compares it with all requests
+	template<class Item>
+	class BasicBatchSearchDataInterface : public BasicSearchDataInterface<Item> {
+	public:
+		using Base = BasicSearchDataInterface<Item>;
+		using MoleculeIndex = typename Base::MoleculeIndex;
+		using RawVector = typename Base::RawVector;
+		using MultiflagType = typename Base::MultiflagType;
+	private:
+		std::mutex mutexResults_;
+		std::vector<std::vector<int>> results_;
+
+	public:
+		BasicBatchSearchDataInterface() = delete;
+		BasicBatchSearchDataInterface(RawVector&& rawdata, const size_t requests)
+			: Base(std::move(rawdata), MultiflagType()), results_(requests) {}
+
+		void push_result(const size_t request, const MoleculeIndex molecularID) {
+			std::lock_guard<std::mutex> lock(mutexResults_);
+			results_[request].push_back(molecularID);
+		}
+		std::vector<std::vector<int>>&& getAllResults() noexcept {
+			std::lock_guard<std::mutex> lock(mutexResults_);
+			return std::move(results_);
+		}
+	};
+
 	struct ParseData {
 		using FAMStructType = FAM_Struct;
 		using FAMCellType = FAM_Cell;
@@ -34,7 +34,80 @@
 #include <numeric> // for std::iota
 #include <algorithm> // for std::stable_sort
 #include <sstream>
+#include <cstring> // for std::memcpy
 namespace cpplib {		
+	// Packed (binary) database graph. Little-endian layout:
+	// header  - 'A' 'G' version(uint8) flags(uint8) id(int32) atoms(uint32) bonds(uint32)
+	// atoms   - (type, H) as uint8 pairs
+	// bonds   - (a, b) as uint16 pairs, or uint32 pairs if (flags & PackedGraphView::wide_flag)
+	struct PackedGraphView {
+		static constexpr size_t header_size = 16;
+		static constexpr uint8_t version = 1;
+		static constexpr uint8_t wide_flag = 1;
+
+		const uint8_t* data = nullptr;
+		size_t size = 0;
+
+		constexpr PackedGraphView() noexcept = default;
+		constexpr PackedGraphView(const uint8_t* d, const size_t s) noexcept : data(d), size(s) {}
+		inline bool empty() const noexcept {
+			return size == 0;
+		}
+	};
+	class PackedGraphReader {
+	private:
+		const uint8_t* cur_ = nullptr;
+		int header_[3] = { 0, 0, 0 };
+		uint_fast8_t headerPos_ = 0;
+		size_t nodeValues_ = 0;
+		bool wide_ = false;
+		bool valid_ = false;
+
+		template<class T>
+		static inline T readRaw(const uint8_t* p) noexcept {
+			T v;
+			std::memcpy(&v, p, sizeof(T));
+			return v;
+		}
+	public:
+		explicit PackedGraphReader(const PackedGraphView& view) noexcept {
+			if (view.size < PackedGraphView::header_size || view.data[0] != 'A' || view.data[1] != 'G' ||
+				view.data[2] != PackedGraphView::version)
+				return;
+			wide_ = (view.data[3] & PackedGraphView::wide_flag) != 0;
+			header_[0] = static_cast<int>(readRaw<int32_t>(view.data + 4));
+			const uint32_t atoms = readRaw<uint32_t>(view.data + 8);
+			const uint32_t bonds = readRaw<uint32_t>(view.data + 12);
+			header_[1] = static_cast<int>(atoms);
+			header_[2] = static_cast<int>(bonds);
+			nodeValues_ = size_t(atoms) * 2;
+			const size_t expected = PackedGraphView::header_size + nodeValues_ + size_t(bonds) * 2 * (wide_ ? 4 : 2);
+			if (expected != view.size)
+				return;
+			cur_ = view.data + PackedGraphView::header_size;
+			valid_ = true;
+		}
+		inline bool valid() const noexcept {
+			return valid_;
+		}
+		// Returns values in the same order as they are written in a string graph
+		inline int operator()() noexcept {
+			if (headerPos_ < 3)
+				return header_[headerPos_++];
+			if (nodeValues_ > 0) {
+				nodeValues_--;
+				return *(cur_++);
+			}
+			if (wide_) {
+				const auto v = readRaw<uint32_t>(cur_);
+				cur_ += 4;
+				return static_cast<int>(v);
+			}
+			const auto v = readRaw<uint16_t>(cur_);
+			cur_ += 2;
+			return static_cast<int>(v);
+		}
+	};
 	class TypeMap {
 	public:
 		using AtomIndex = currents::AtomIndex;
@@ -78,6 +151,76 @@ namespace cpplib {
 			return true;
 		}
 	};
+	// Packed database graph decoded once to be read by several requests (see SearchBatchPacked).
+	// Numbers of atoms and hydrogens of every type are counted while decoding, so the check of the request
+	// composition made by MoleculeGraph::ReadData is done without building the graph.
+	class DecodedGraph {
+	public:
+		using AtomIndex = currents::AtomIndex;
+		class Reader {
+		private:
+			const int* cur_;
+		public:
+			explicit Reader(const int* cur) noexcept : cur_(cur) {}
+			inline int operator()() noexcept {
+				return *(cur_++);
+			}
+		};
+	private:
+		::std::vector<int> values_;
+		::std::array<AtomIndex, mend_size> atoms_{};
+		::std::array<AtomIndex, mend_size> hAtoms_{};
+		AtomIndex otherHAtoms_ = 0;
+		bool valid_ = false;
+	public:
+		explicit DecodedGraph(const PackedGraphView& view) {
+			PackedGraphReader next(view);
+			if (!next.valid()) return;
+			const int id = next();
+			const int atoms = next();
+			const int bonds = next();
+			values_.reserve(3 + 2 * (size_t(atoms) + size_t(bonds)));
+			values_.push_back(id);
+			values_.push_back(atoms);
+			values_.push_back(bonds);
+			for (int i = 0; i < atoms; i++) {
+				const int a = next();
+				const int b = next();
+				values_.push_back(a);
+				values_.push_back(b);
+				if (a > 0 && a < mend_size) {
+					atoms_[a]++;
+					hAtoms_[a] += b;
+				}
+				else {
+					otherHAtoms_ += b;
+				}
+			}
+			for (int i = 0; i < bonds * 2; i++) {
+				values_.push_back(next());
+			}
+			valid_ = true;
+		}
+		inline bool valid() const noexcept {
+			return valid_;
+		}
+		inline Reader reader() const noexcept {
+			return Reader(values_.data());
+		}
+		// The same result as the map check of MoleculeGraph::parseAtomsBlockData
+		bool hasAtoms(const TypeMap& map) const noexcept {
+			AtomIndex hAtoms = otherHAtoms_;
+			for (TypeMap::indexType i = 1; i < mend_size; i++)
+			{
+				if (map[i] == AtomIndex(-1))
+					continue;
+				hAtoms += hAtoms_[i];
+				if (i != 1 && map[i] > atoms_[i])
+					return false;
+			}
+			return map[1] <= 0 || map[1] <= atoms_[1] + hAtoms;
+		}
+	};
 	template<class A> class MoleculeGraph  {
 	public:
 		// Declarations
@@ -99,6 +242,9 @@ namespace cpplib {
 		// Data
 		NodeContainer data_;
 		MoleculeIndex id_ = 0;
+		// position of the request atom chosen by the query planner (api_database/api/query_planner.py)
+		// after sorting, 0 if the search starts from the first atom of the sorted graph
+		AtomIndex start_ = 0;
 
 	public:
 		constexpr MoleculeGraph() noexcept = default;
@@ -114,10 +260,31 @@ namespace cpplib {
 			mg.release_HAtoms(multiAtomBits);
 			return ::std::make_pair<MoleculeGraph, bool>(std::move(mg), true);
 		}
+		static ::std::pair<MoleculeGraph, bool> ReadData(const PackedGraphView& view, const currents::TypeBitset& multiAtomBits, const TypeMap& map) {
+			MoleculeGraph mg;
+			PackedGraphReader reader(view);
+			if (!reader.valid()) return ::std::make_pair<MoleculeGraph, bool>(std::move(mg), false);
+			const auto sn = mg.parseMainData(reader, map);
+			if (sn == 0) return ::std::make_pair<MoleculeGraph, bool>(std::move(mg), false);
+			mg.release_HAtoms(multiAtomBits);
+			return ::std::make_pair<MoleculeGraph, bool>(std::move(mg), true);
+		}
 
-		static ::std::pair<MoleculeGraph, currents::TypeBitset> ReadInput(const char* str) {
+		static ::std::pair<MoleculeGraph, bool> ReadData(const DecodedGraph& graph, const currents::TypeBitset& multiAtomBits, const TypeMap& map) {
+			MoleculeGraph mg;
+			if (!graph.valid() || !graph.hasAtoms(map)) return ::std::make_pair<MoleculeGraph, bool>(std::move(mg), false);
+			auto reader = graph.reader();
+			const auto sn = mg.parseMainData(reader, map);
+			if (sn == 0) return ::std::make_pair<MoleculeGraph, bool>(std::move(mg), false);
+			mg.release_HAtoms(multiAtomBits);
+			return ::std::make_pair<MoleculeGraph, bool>(std::move(mg), true);
+		}
+
+		static ::std::pair<MoleculeGraph, currents::TypeBitset> ReadInput(const char* str, const AtomIndex startAtom = 0) {
 			MoleculeGraph mg;
 			const auto sn = mg.parseMainstringRequest(str);
+			if (startAtom < mg.size())
+				mg.start_ = startAtom;
 			auto multiAtomBits = mg.parseMultiatom(str, sn);
 			mg.release_HAtoms(multiAtomBits);
 			mg.sortGraph();
@@ -210,7 +377,7 @@ namespace cpplib {
 
 		// For Search
 		constexpr AtomIndex findStart() const {
-			return 1;
+			return start_ != 0 ? start_ : 1;
 		}
 		constexpr AtomIndex getNeighbourId(AtomIndex cur, AtomIndex neighbourIt) const noexcept {
 			return data_[cur].getNeighbour(neighbourIt)->getID();
@@ -227,6 +394,7 @@ namespace cpplib {
 			// Copy
 			MoleculeGraph ret;
 			ret.id_ = id_;
+			ret.start_ = start_;
 			AtomIndex s = size();
 			ret.data_.reserve(s);
 			// Convertion to Correct Neighbours
@@ -241,6 +409,7 @@ namespace cpplib {
 			// Copy
 			MoleculeGraph<OT> ret;
 			ret.id_ = id_;
+			ret.start_ = start_;
 			AtomIndex s = size();
 			ret.data_.reserve(s);
 			// Convertion to Correct Neighbours
@@ -322,6 +491,10 @@ namespace cpplib {
 				}
 				if (best != i) {
 					exchange(i, best);
+					if (start_ == i)
+						start_ = best;
+					else if (start_ == best)
+						start_ = i;
 				}
 			}
 			for (AtomIndex i = 1; i < s; i++)
@@ -367,14 +540,15 @@ namespace cpplib {
 			else
 				return res;
 		}
-		inline ::std::vector<bool> parseAtomsBlockData(const char *& str, const AtomIndex sn, const TypeMap& argMap) {
+		template<class Reader>
+		inline ::std::vector<bool> parseAtomsBlockData(Reader& next, const AtomIndex sn, const TypeMap& argMap) {
 			data_.reserve(sn);
 			TypeMap map(argMap);
 			data_.emplace_back(A(0), HType(0), AtomIndex(0));
 			::std::vector<bool> is_used(sn, false);
 			for (AtomIndex i = 1; i < sn; i++) {
-				int a = readSingleInt(str);
-				int b = readSingleInt(str);
+				int a = next();
+				int b = next();
 				if (a > 0) {
 					if (map[a] == -1)
 						continue;
@@ -409,21 +583,31 @@ namespace cpplib {
 				data_.back().setCoord(Coord(static_cast<Coord::argumentType>(first), static_cast<Coord::argumentType>(second)));
 			}
 		}
-		::std::pair<AtomIndex, AtomIndex> parseInit(const char*& str) {
-			id_ = readSingleInt(str);
+		template<class Reader>
+		::std::pair<AtomIndex, AtomIndex> parseInitData(Reader& next) {
+			id_ = next();
 			::std::pair<AtomIndex, AtomIndex> r;
-			r.first = readSingleInt(str);
-			r.second = readSingleInt(str);
+			r.first = next();
+			r.second = next();
 			r.first++;
 			return r;
 		}
+		::std::pair<AtomIndex, AtomIndex> parseInit(const char*& str) {
+			auto next = [this, &str]() { return readSingleInt(str); };
+			return parseInitData(next);
+		}
 		inline AtomIndex parseMainstringData(const char*& str, const TypeMap& map) {
-			::std::pair<AtomIndex, AtomIndex>&& sn_sb = parseInit(str);
+			auto next = [this, &str]() { return readSingleInt(str); };
+			return parseMainData(next, map);
+		}
+		template<class Reader>
+		inline AtomIndex parseMainData(Reader& next, const TypeMap& map) {
+			::std::pair<AtomIndex, AtomIndex>&& sn_sb = parseInitData(next);
 			AtomIndex& sn = sn_sb.first;
 			AtomIndex& sb = sn_sb.second;
 
 			// Atomic loop
-			auto used = parseAtomsBlockData(str, sn, map);
+			auto used = parseAtomsBlockData(next, sn, map);
 			if (used[0] == false) return 0;
 			std::vector<AtomIndex> reI(sn, 0);
 			AtomIndex reI_last = 1;
@@ -439,8 +623,8 @@ namespace cpplib {
 
 			// Bond loop
 			for (AtomIndex i = 0; i < sb; i++) {
-				int a = readSingleInt(str);
-				int b = readSingleInt(str);
+				int a = next();
+				int b = next();
 				bool b_reIa = reI[a] != 0;
 				bool b_reIb = reI[b] != 0;
 				if(b_reIa && b_reIb)
@@ -112,12 +112,12 @@ namespace cpplib {
 			auto si = inputNode.neighboursSize();
 			auto sn = dataNode.neighboursSize();
 
-			AtomIndex j = 0;
 			for (AtomIndex i = 0; i < si; ++i) {
 				if (inputNode.getNeighbour(i)->getType().get_simple() < 0)
 					continue;
 				bool condition = false;
-				for (; j < sn; ++j) {
+				// neighbours of request and data atoms are not sorted in the same way, so all of them are checked
+				for (AtomIndex j = 0; j < sn; ++j) {
 					condition = compareLow(*(inputNode.getNeighbour(i)), *(dataNode.getNeighbour(j)), exact);
 					if (condition) {
 						break;
@@ -35,7 +35,13 @@
 
 using namespace cpplib::currents;
 
-static void ChildThreadFunc(const SearchGraphType::RequestGraphType& input, const SearchGraphType::AtomIndex MaxAtom, SearchDataInterfaceType& dataInterface, const bool exact); 
+template<class DataInterface>
+static void ChildThreadFunc(const SearchGraphType::RequestGraphType& input, const SearchGraphType::AtomIndex MaxAtom, DataInterface& dataInterface, const bool exact);
+template<class DataInterface>
+static std::vector<int> SearchMainImpl(const char* search, typename DataInterface::RawVector&& data, const int np, const bool exact, const int maxHits = 0, const int startAtom = 0);
+using BatchRequestType = std::pair<SearchGraphType::RequestGraphType, cpplib::currents::TypeBitset>;
+static void BatchChildThreadFunc(const std::vector<BatchRequestType>& inputs, const std::vector<cpplib::TypeMap>& maps,
+								 PackedBatchSearchDataInterfaceType& dataInterface, const bool exact);
 static cpplib::DATTuple& ConvertDATTuple(cpplib::DATTuple&& dat, const cpplib::currents::FAMStructType& fs);
 
 
@@ -59,16 +65,68 @@ bool CompareGraph(const char* search1, const char* search2, const bool exact) {
 	return graph.startFullSearch(exact);
 }
 std::vector<int> SearchMain(const char* search, std::vector<const char*>&& data, const int np, const bool exact) {
+	return SearchMainImpl<SearchDataInterfaceType>(search, std::move(data), np, exact);
+}
+
+std::vector<int> SearchMainPacked(const char* search, std::vector<cpplib::PackedGraphView>&& data, const int np, const bool exact, const int maxHits, const int startAtom) {
+	return SearchMainImpl<PackedSearchDataInterfaceType>(search, std::move(data), np, exact, maxHits, startAtom);
+}
+
+std::vector<std::vector<int>> SearchBatchPacked(const std::vector<const char*>& searches, std::vector<cpplib::PackedGraphView>&& data, const int np, const bool exact, const std::vector<int>& startAtoms) {
+	std::vector<BatchRequestType> inputs;
+	std::vector<cpplib::TypeMap> maps;
+	inputs.reserve(searches.size());
+	maps.reserve(searches.size());
+	for (size_t i = 0; i < searches.size(); i++) {
+		const auto startAtom = i < startAtoms.size() ? std::max(startAtoms[i], 0) : 0;
+		inputs.emplace_back(SearchGraphType::RequestGraphType::ReadInput(searches[i], static_cast<SearchGraphType::AtomIndex>(startAtom)));
+		maps.emplace_back(inputs.back().first.getTypeMap());
+	}
+	PackedBatchSearchDataInterfaceType databuf(std::move(data), inputs.size());
+	if (databuf.size() == 0 || inputs.empty())
+		return databuf.getAllResults();
+	std::vector<std::thread> threads;
+	const size_t nThreads = std::min(std::min(static_cast<unsigned int>(np), std::thread::hardware_concurrency()),
+									 static_cast<unsigned int>(databuf.size())) - 1;
+	threads.reserve(nThreads);
+	for (size_t i = 0; i < nThreads; i++) {
+		threads.emplace_back(BatchChildThreadFunc, std::cref(inputs), std::cref(maps), std::ref(databuf), exact);
+	}
+	BatchChildThreadFunc(inputs, maps, databuf, exact);
+
+	for (size_t i = 0; i < nThreads; i++) {
+		threads[i].join();
+	}
+	return databuf.getAllResults();
+}
+
+bool CompareGraphPacked(const char* search, const cpplib::PackedGraphView& data, const bool exact) {
+	SearchGraphType graph;
 	auto&& inputpair = SearchGraphType::RequestGraphType::ReadInput(search);
-	SearchDataInterfaceType databuf(std::move(data), std::move(inputpair.second));
+	auto map = inputpair.first.getTypeMap();
+	graph.setupInput(std::move(inputpair.first));
+	auto&& d_pair = SearchGraphType::DatabaseGraphType::ReadData(data, inputpair.second, map);
+	if (!d_pair.second) return false;
+	graph.setupData(std::move(d_pair.first));
+	graph.prepareToSearch();
+	return graph.startFullSearch(exact);
+}
+
+template<class DataInterface>
+static std::vector<int> SearchMainImpl(const char* search, typename DataInterface::RawVector&& data, const int np, const bool exact, const int maxHits, const int startAtom) {
+	auto&& inputpair = SearchGraphType::RequestGraphType::ReadInput(search, static_cast<SearchGraphType::AtomIndex>(std::max(startAtom, 0)));
+	DataInterface databuf(std::move(data), std::move(inputpair.second), static_cast<typename DataInterface::size_type>(std::max(maxHits, 0)));
+	if (databuf.size() == 0)
+		return databuf.getAllResults();
 	std::vector<std::thread> threads;
 	const size_t nThreads = std::min(std::min(static_cast<unsigned int>(np), std::thread::hardware_concurrency()),
 									 static_cast<unsigned int>(databuf.size())) - 1;
 	threads.reserve(nThreads);
-	auto ma = inputpair.first.findStart();
+	// the start atom is found after hydrogens are unpacked (see SearchGraph::startFullSearch)
+	const SearchGraphType::AtomIndex ma = 0;
 
 	for (size_t i = 0; i < nThreads; i++) {
-		threads.emplace_back(ChildThreadFunc, std::cref(inputpair.first), ma, std::ref(databuf), exact);
+		threads.emplace_back(ChildThreadFunc<DataInterface>, std::cref(inputpair.first), ma, std::ref(databuf), exact);
 	}
 	ChildThreadFunc(inputpair.first, ma, databuf, exact);
 
@@ -320,7 +378,8 @@ cpplib::DATTuple FindDAT_WC(cpplib::currents::FAMStructType::AtomContainerType&
 }
 
 // Single thread function
-static void ChildThreadFunc(const SearchGraphType::RequestGraphType& input, const SearchGraphType::AtomIndex MaxAtom, SearchDataInterfaceType& dataInterface, const bool exact) {
+template<class DataInterface>
+static void ChildThreadFunc(const SearchGraphType::RequestGraphType& input, const SearchGraphType::AtomIndex MaxAtom, DataInterface& dataInterface, const bool exact) {
 	SearchGraphType graph;
 	while (true) {
 		auto next = dataInterface.getNext();
@@ -331,13 +390,40 @@ static void ChildThreadFunc(const SearchGraphType::RequestGraphType& input, cons
 		auto map = input.getTypeMap();
 		graph.setupInput(input.makeCopy()); 
 		//SearchGraphType::DatabaseGraphType molData;
-		auto && molData = SearchGraphType::DatabaseGraphType::ReadData(next, multi, map);
+		auto && molData = SearchGraphType::DatabaseGraphType::ReadData(*next, multi, map);
 		if (!molData.second) continue;
 		auto id = molData.first.getID();
 		graph.setupData(std::move(molData.first));
 		graph.prepareToSearch();
 		if (graph.startFullSearch(exact, MaxAtom)) {
-			dataInterface.push_result(id);
+			dataInterface.push_result(next, id);
+		}
+	}
+}
+
+// Every data graph is taken and decoded once and compared with all requests,
+// requests with atoms which the data graph has not got are skipped before the graph is built
+static void BatchChildThreadFunc(const std::vector<BatchRequestType>& inputs, const std::vector<cpplib::TypeMap>& maps,
+								 PackedBatchSearchDataInterfaceType& dataInterface, const bool exact) {
+	SearchGraphType graph;
+	const size_t s = inputs.size();
+	while (true) {
+		auto next = dataInterface.getNext();
+		if (next == nullptr) {
+			return;
+		}
+		const cpplib::DecodedGraph decoded(*next);
+		if (!decoded.valid()) continue;
+		for (size_t i = 0; i < s; i++) {
+			auto&& molData = SearchGraphType::DatabaseGraphType::ReadData(decoded, inputs[i].second, maps[i]);
+			if (!molData.second) continue;
+			auto id = molData.first.getID();
+			graph.setupInput(inputs[i].first.makeCopy());
+			graph.setupData(std::move(molData.first));
+			graph.prepareToSearch();
+			if (graph.startFullSearch(exact, 0)) {
+				dataInterface.push_result(i, id);
+			}
 		}
 	}
 }
@@ -16,6 +16,23 @@ std::vector<int> SearchMain(const char* search,
 							const int np,
 							const bool exact);
 
+std::vector<int> SearchMainPacked(const char* search,
+								  std::vector<cpplib::PackedGraphView>&& data,
+								  const int np,
+								  const bool exact,
+								  const int maxHits = 0,
+								  const int startAtom = 0);
+
+std::vector<std::vector<int>> SearchBatchPacked(const std::vector<const char*>& searches,
+												std::vector<cpplib::PackedGraphView>&& data,
+												const int np,
+												const bool exact,
+												const std::vector<int>& startAtoms = {});
+
+bool CompareGraphPacked(const char* search,
+						const cpplib::PackedGraphView& data,
+						const bool exact);
+
 std::tuple<std::string, std::string, cpplib::FindMolecules::RightType>
 	FindMoleculesInCell(const std::array<float, 6>& unit_cell,
 						std::vector<const char*>& symm,
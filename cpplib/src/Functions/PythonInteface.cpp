@@ -259,6 +259,161 @@ extern "C" {
 		deb_write("py_SearchMain return");
 		return ret_o;
 	}
+	// Holds buffer views of packed graphs while the search is running
+	struct PackedBuffers {
+		std::vector<Py_buffer> buffers;
+		std::vector<cpplib::PackedGraphView> views;
+		~PackedBuffers() {
+			for (auto& b : buffers) {
+				PyBuffer_Release(&b);
+			}
+		}
+		bool add(PyObject* item) {
+			if (item == Py_None) {
+				views.emplace_back();
+				return true;
+			}
+			Py_buffer b;
+			if (PyObject_GetBuffer(item, &b, PyBUF_SIMPLE) != 0)
+				return false;
+			buffers.push_back(b);
+			views.emplace_back(static_cast<const uint8_t*>(b.buf), static_cast<size_t>(b.len));
+			return true;
+		}
+	};
+	static PyObject* cpplib_SearchMainPacked(PyObject* self, PyObject* args) {
+		const char* search = NULL;
+		PyObject* o = NULL;
+		int np = 0;
+		int exact = 0;
+		int maxHits = 0;
+		int startAtom = 0;
+		if (!PyArg_ParseTuple(args, "sOip|ii", &search, &o, &np, &exact, &maxHits, &startAtom)) {
+			return NULL;
+		}
+		PyObject* seq = PySequence_Fast(o, "data must be a sequence of buffer objects");
+		if (seq == NULL) {
+			return NULL;
+		}
+		const Py_ssize_t s = PySequence_Fast_GET_SIZE(seq);
+		PackedBuffers packed;
+		packed.buffers.reserve(static_cast<size_t>(s));
+		packed.views.reserve(static_cast<size_t>(s));
+		for (Py_ssize_t i = 0; i < s; i++) {
+			if (!packed.add(PySequence_Fast_GET_ITEM(seq, i))) {
+				Py_DECREF(seq);
+				return NULL;
+			}
+		}
+		deb_write("py_SearchMainPacked data.size = ", packed.views.size());
+		std::vector<int> ret;
+		Py_BEGIN_ALLOW_THREADS
+		ret = SearchMainPacked(search, std::move(packed.views), np, (exact != 0), maxHits, startAtom);
+		Py_END_ALLOW_THREADS
+		Py_DECREF(seq);
+
+		PyObject* ret_o = PyList_New(0);
+		for (size_t i = 0; i < ret.size(); i++)
+		{
+			PyObject* item = PyLong_FromLong(ret[i]);
+			PyList_Append(ret_o, item);
+			Py_DECREF(item);
+		}
+		return ret_o;
+	}
+	static PyObject* cpplib_SearchBatchPacked(PyObject* self, PyObject* args) {
+		PyObject* osearch = NULL;
+		PyObject* o = NULL;
+		int np = 0;
+		int exact = 0;
+		PyObject* ostart = NULL;
+		if (!PyArg_ParseTuple(args, "OOip|O", &osearch, &o, &np, &exact, &ostart)) {
+			return NULL;
+		}
+		std::vector<int> startAtoms;
+		if (ostart != NULL && ostart != Py_None) {
+			PyObject* startSeq = PySequence_Fast(ostart, "start atoms must be a sequence of integers");
+			if (startSeq == NULL) {
+				return NULL;
+			}
+			const Py_ssize_t sa = PySequence_Fast_GET_SIZE(startSeq);
+			startAtoms.reserve(static_cast<size_t>(sa));
+			for (Py_ssize_t i = 0; i < sa; i++) {
+				const long startAtom = PyLong_AsLong(PySequence_Fast_GET_ITEM(startSeq, i));
+				if (startAtom == -1 && PyErr_Occurred()) {
+					Py_DECREF(startSeq);
+					return NULL;
+				}
+				startAtoms.push_back(static_cast<int>(startAtom));
+			}
+			Py_DECREF(startSeq);
+		}
+		PyObject* searchSeq = PySequence_Fast(osearch, "graphs must be a sequence of strings");
+		if (searchSeq == NULL) {
+			return NULL;
+		}
+		const Py_ssize_t ss = PySequence_Fast_GET_SIZE(searchSeq);
+		std::vector<const char*> searches;
+		searches.reserve(static_cast<size_t>(ss));
+		for (Py_ssize_t i = 0; i < ss; i++) {
+			const char* search = PyUnicode_AsUTF8(PySequence_Fast_GET_ITEM(searchSeq, i));
+			if (search == NULL) {
+				Py_DECREF(searchSeq);
+				return NULL;
+			}
+			searches.push_back(search);
+		}
+		PyObject* seq = PySequence_Fast(o, "data must be a sequence of buffer objects");
+		if (seq == NULL) {
+			Py_DECREF(searchSeq);
+			return NULL;
+		}
+		const Py_ssize_t s = PySequence_Fast_GET_SIZE(seq);
+		PackedBuffers packed;
+		packed.buffers.reserve(static_cast<size_t>(s));
+		packed.views.reserve(static_cast<size_t>(s));
+		for (Py_ssize_t i = 0; i < s; i++) {
+			if (!packed.add(PySequence_Fast_GET_ITEM(seq, i))) {
+				Py_DECREF(seq);
+				Py_DECREF(searchSeq);
+				return NULL;
+			}
+		}
+		deb_write("py_SearchBatchPacked searches.size = ", searches.size());
+		std::vector<std::vector<int>> ret;
+		Py_BEGIN_ALLOW_THREADS
+		ret = SearchBatchPacked(searches, std::move(packed.views), np, (exact != 0), startAtoms);
+		Py_END_ALLOW_THREADS
+		Py_DECREF(seq);
+		Py_DECREF(searchSeq);
+
+		PyObject* ret_o = PyList_New(static_cast<Py_ssize_t>(ret.size()));
+		for (size_t i = 0; i < ret.size(); i++)
+		{
+			PyObject* ids = PyList_New(static_cast<Py_ssize_t>(ret[i].size()));
+			for (size_t j = 0; j < ret[i].size(); j++) {
+				PyList_SET_ITEM(ids, static_cast<Py_ssize_t>(j), PyLong_FromLong(ret[i][j]));
+			}
+			PyList_SET_ITEM(ret_o, static_cast<Py_ssize_t>(i), ids);
+		}
+		return ret_o;
+	}
+	static PyObject* cpplib_SubSearchPacked(PyObject* self, PyObject* args) {
+		const char* search = NULL;
+		PyObject* o = NULL;
+		int exact = 0;
+		if (!PyArg_ParseTuple(args, "sO|p", &search, &o, &exact)) {
+			return NULL;
+		}
+		PackedBuffers packed;
+		if (!packed.add(o)) {
+			return NULL;
+		}
+		if (packed.views.back().empty() == false && CompareGraphPacked(search, packed.views.back(), (exact != 0))) {
+			Py_RETURN_TRUE;
+		}
+		Py_RETURN_FALSE;
+	}
 	static PyObject* cpplib_CompareGraph(PyObject* self, PyObject* args)
 	{
 		deb_write("cpplib_CompareGraph: start");
@@ -931,6 +1086,9 @@ static struct PyMethodDef methods[] = {
 	{ "FindDAT_WC", cpplib_FindDAT_WC, METH_O, "Create dictionary with distances, angles and torsions in xyz"},
 	{ "himp", cpplib_himp, METH_VARARGS, "Moves hydrogens to the nearest atom"},
 	{ "SubSearch", cpplib_SubSearch, METH_VARARGS, "Compare two graphs"},
+	{ "SearchMainPacked", cpplib_SearchMainPacked, METH_VARARGS, "Compare graph with packed data"},
+	{ "SearchBatchPacked", cpplib_SearchBatchPacked, METH_VARARGS, "Compare several graphs with packed data in one pass"},
+	{ "SubSearchPacked", cpplib_SubSearchPacked, METH_VARARGS, "Compare graph with one packed graph"},
 	{ "compaq", cpplib_compaq, METH_VARARGS, "Do the same as Olex2 'compaq' function"},
 	{ "SortDatabase", cpplib_SortDatabase, METH_O, "Sort graph"},
 
@@ -37,6 +37,47 @@ def SearchMain(graph: str, data: List[str], nprocs: int, exact: bool) -> List[in
         Returns: List of successful IDs.
     """
     ...
+def SearchMainPacked(graph: str, data: List[bytes], nprocs: int, exact: bool, max_hits: int = 0,
+                     start_atom: int = 0) -> List[int]:
+    """
+        The same as SearchMain, but 'data' contains packed graphs (see modules/graph_pack in api_database).
+        Items are read through the buffer protocol without copying (bytes, memoryview, NumPy uint8 arrays);
+        empty items and None are skipped. GIL is released during the search.
+        Variables:
+          graph: String representation of request molecular graph.
+          data: List of packed molecular graphs.
+          nprocs: the number of threads for multiprocessing.
+          exact: boolean flag for exact search (True) or substructure search (False).
+          max_hits: stop the search after max_hits found graphs (0 - search in all data).
+          start_atom: number of the request atom (in the order of 'graph') to start the search from,
+            chosen by api_database/api/query_planner.py (0 - the first atom of the sorted request).
+        Returns: List of successful IDs. With max_hits these are the first found graphs in the order of 'data'
+          regardless of the number of threads.
+    """
+    ...
+def SearchBatchPacked(graphs: List[str], data: List[bytes], nprocs: int, exact: bool,
+                      start_atoms: List[int] = None) -> List[List[int]]:
+    """
+        Search several request graphs in one pass over 'data': every packed graph is taken once
+        and compared with all requests. GIL is released during the search.
+        Variables:
+          graphs: List of string representations of request molecular graphs.
+          data: List of packed molecular graphs.
+          nprocs: the number of threads for multiprocessing.
+          exact: boolean flag for exact search (True) or substructure search (False).
+          start_atoms: start atom of every request graph (see SearchMainPacked).
+        Returns: List of successful IDs for every request graph (in the same order).
+    """
+    ...
+def SubSearchPacked(graph: str, data: bytes, exact: bool = False) -> bool:
+    """
+        Search 'graph' in one packed graph.
+        Variables:
+          graph: String representation of request molecular graph.
+          data: Packed molecular graph (any buffer protocol object).
+          exact: boolean flag for exact search (True) or substructure search (False)
+    """
+    ...
 def CompareGraph(graph_1: str, graph_2: str, exact: bool) -> bool:
     """
         Compare 'graph_1' and 'graph_2'.